@@ -0,0 +1,161 @@
+# 報價的鎖競爭 benchmark：很多承包人同時對「同一個案件」反覆報價（接近截止時的情況），比較
+#   locked      035 之前的 bid_new：SELECT ... FOR UPDATE 鎖住案件 → 檢查 → upsert 報價 → 寫事件，
+#               同一個案件的報價全部排隊
+#   optimistic  現在的 bid_new：event:BID_SUBMITTED 一條 SQL，案件只用 FOR SHARE 鎖住，報價之間不互相等待
+# 連線經過 bench.hot_job 的延遲 proxy（--rtt-ms），鎖裡面的每次 round trip 都會讓其他人多等。
+#
+# 用法：python -m bench.bid_contention [--bidders 64] [--seconds 10] [--rtt-ms 1]
+# 會另外建立 / 刪除一個測試資料庫，不會動到正式資料。
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import psycopg
+from psycopg.conninfo import conninfo_to_dict, make_conninfo
+from psycopg.types.json import Jsonb
+
+import job_state
+from bench.hot_job import start_proxy
+from db import DATABASE_URL
+from explain_check import prepare_database
+
+
+# 035 之前的寫法，SQL 照當時的 job_lock / bid_upsert / event:BID_SUBMITTED 寫在這裡
+async def bid_locked(conn, job_id: int, contractor_id: int, price: int) -> bool:
+    async with conn.transaction():
+        cur = await conn.execute(
+            "SELECT id, client_id, status, due_date FROM jobs WHERE id = %s FOR UPDATE", (job_id,)
+        )
+        job = await cur.fetchone()
+        if job is None or job[2] != "pending" or job[1] == contractor_id:
+            return False
+        cur = await conn.execute(
+            """
+            INSERT INTO bids (job_id, contractor_id, price, note) VALUES (%s, %s, %s, 'bench')
+            ON CONFLICT (job_id, contractor_id) DO UPDATE SET price = EXCLUDED.price, note = EXCLUDED.note
+            RETURNING (xmax = 0)
+            """,
+            (job_id, contractor_id, price),
+        )
+        (inserted,) = await cur.fetchone()
+        await conn.execute(
+            """
+            WITH target AS (
+                SELECT id FROM jobs WHERE id = %(job_id)s AND status = 'pending' FOR UPDATE
+            )
+            INSERT INTO job_events (job_id, actor_id, event_type, message, description, payload)
+            SELECT id, %(actor_id)s, 'BID_SUBMITTED', 'bench', 'bench', %(payload)s FROM target
+            """,
+            {"job_id": job_id, "actor_id": contractor_id, "payload": Jsonb({"price": price, "new_bid": inserted})},
+        )
+    return True
+
+
+# 現在 routes_contractor.bid_new 的寫法
+async def bid_optimistic(conn, job_id: int, contractor_id: int, price: int) -> bool:
+    # create_job 直接 INSERT 的案件 version 是預設的 0，報價不會改版本號
+    try:
+        async with conn.transaction():
+            await job_state.apply(
+                conn, "BID_SUBMITTED", job_id=job_id, actor_id=contractor_id,
+                message="bench", description="bench", price=price, note="bench",
+                proposal_file=None, proposal_original_name=None, job_version=0,
+            )
+    except job_state.InvalidTransition:
+        return False
+    return True
+
+
+MODES = {"locked": bid_locked, "optimistic": bid_optimistic}
+
+
+async def bidder(conninfo: str, bid, job_id: int, contractor_id: int, deadline: float, latencies: list, failed: list):
+    async with await psycopg.AsyncConnection.connect(conninfo) as conn:
+        price = 1000
+        while time.perf_counter() < deadline:
+            price += 1
+            start = time.perf_counter()
+            if not await bid(conn, job_id, contractor_id, price):
+                failed.append(1)
+            latencies.append(time.perf_counter() - start)
+
+
+async def create_job(conninfo: str, bidders: int) -> tuple[int, list[int]]:
+    tag = uuid.uuid4().hex[:8]
+    async with await psycopg.AsyncConnection.connect(conninfo, autocommit=True) as conn:
+        cur = await conn.execute(
+            "INSERT INTO users (username, password_hash, role) VALUES (%s, 'x', 'client') RETURNING id",
+            (f"contention_client_{tag}",),
+        )
+        (client_id,) = await cur.fetchone()
+        cur = await conn.execute(
+            """
+            INSERT INTO users (username, password_hash, role)
+            SELECT 'contention_contractor_' || %s || '_' || g, 'x', 'contractor' FROM generate_series(1, %s) g
+            RETURNING id
+            """,
+            (tag, bidders),
+        )
+        contractor_ids = [r[0] for r in await cur.fetchall()]
+        cur = await conn.execute(
+            "INSERT INTO jobs (title, content, client_id, status) VALUES ('hot', 'hot', %s, 'pending') RETURNING id",
+            (client_id,),
+        )
+        (job_id,) = await cur.fetchone()
+    return job_id, contractor_ids
+
+
+async def run(conninfo: str, mode: str, args) -> None:
+    job_id, contractor_ids = await create_job(conninfo, args.bidders)
+    latencies, failed = [], []
+    deadline = time.perf_counter() + args.seconds
+    await asyncio.gather(*(
+        bidder(conninfo, MODES[mode], job_id, cid, deadline, latencies, failed) for cid in contractor_ids
+    ))
+
+    # 第一次報價的事件數應該等於報價筆數（列表的報價數就是 bids 的筆數）
+    async with await psycopg.AsyncConnection.connect(conninfo) as conn:
+        cur = await conn.execute(
+            """
+            SELECT (SELECT COUNT(*) FROM job_events
+                    WHERE job_id = %(job_id)s AND event_type = 'BID_SUBMITTED' AND (payload->>'new_bid')::boolean),
+                   (SELECT COUNT(*) FROM bids WHERE job_id = %(job_id)s)
+            """,
+            {"job_id": job_id},
+        )
+        counted, actual = await cur.fetchone()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)]
+    ok = len(latencies) - len(failed)
+    print(f"{mode:<12}{ok / args.seconds:>9.1f}{statistics.median(latencies) * 1000:>10.1f}"
+          f"{p95 * 1000:>10.1f}{len(failed):>8}{f'{counted}/{actual}':>12}")
+
+
+async def main(args) -> None:
+    dbname = "bench_bid_contention"
+    admin = make_conninfo(DATABASE_URL, dbname="postgres")
+    conninfo = await prepare_database(admin, dbname, args.scale)
+    params = conninfo_to_dict(conninfo)
+    server, port = await start_proxy(params.get("host", "localhost"), int(params.get("port", 5432)), args.rtt_ms)
+    proxied = make_conninfo(conninfo, host="127.0.0.1", port=port)
+    try:
+        print(f"{args.bidders} 個承包人同時報價同一個案件 {args.seconds}s，RTT {args.rtt_ms}ms")
+        print(f"{'mode':<12}{'bids/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'failed':>8}{'events/bids':>12}")
+        for mode in MODES:
+            await run(proxied, mode, args)
+    finally:
+        server.close()
+        async with await psycopg.AsyncConnection.connect(admin, autocommit=True) as conn:
+            await conn.execute(f'DROP DATABASE IF EXISTS "{dbname}"')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=2_000)
+    parser.add_argument("--bidders", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--rtt-ms", type=float, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,258 @@
+# 熱門案件的鎖競爭 benchmark
+#
+# 一個案件同時有很多承包人在報價（每次報價都要短暫鎖住案件），同時委託人 / 承包人反覆
+#   選標 → 上傳結案檔案 → （重設回 pending）
+# 比較選標、上傳的兩種寫法對報價吞吐量的影響：
+#   locked  034 之前的寫法：先 SELECT ... FOR UPDATE，鎖住之後才查報價、承包人帳號、退件紀錄、
+#           版本號，上傳時連寫檔都在鎖裡面
+#   short   現在 bid_accept / job_upload 的寫法：唯讀查詢與寫檔都在鎖外面，
+#           上鎖的只有 job_state 的一條轉換 SQL
+# 所有連線都經過一個本機 TCP proxy，每個方向延遲 --rtt-ms / 2，模擬 app 與資料庫之間的網路；
+# 鎖裡面每多一次 round trip，其他人就多等一個 RTT。寫檔另外加上 --io-ms 的延遲。
+#
+# 用法：python -m bench.hot_job [--bidders 32] [--seconds 10] [--rtt-ms 1] [--io-ms 20]
+# 會另外建立 / 刪除一個測試資料庫，不會動到正式資料。
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import date
+
+import psycopg
+from psycopg.conninfo import conninfo_to_dict, make_conninfo
+
+import job_state
+import repo
+from db import DATABASE_URL
+from explain_check import prepare_database
+from job_state import InvalidTransition
+
+
+# ========== 延遲 proxy ==========
+
+async def _pump(reader, writer, delay: float) -> None:
+    try:
+        while data := await reader.read(65536):
+            await asyncio.sleep(delay)
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_proxy(host: str, port: int, rtt_ms: float):
+    delay = rtt_ms / 2000
+
+    async def handle(client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection(host, port)
+        await asyncio.gather(
+            _pump(client_reader, server_writer, delay),
+            _pump(server_reader, client_writer, delay),
+        )
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+# ========== 測試情境 ==========
+
+class Hot:
+    def __init__(self, job_id, client_id, contractor_id, bid_id, io_ms, size, outdir):
+        self.job_id = job_id
+        self.client_id = client_id
+        self.contractor_id = contractor_id
+        self.bid_id = bid_id
+        self.io_seconds = io_ms / 1000
+        self.payload = os.urandom(size)
+        self.outdir = outdir
+
+
+def _write(path: str, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+async def write_file(h: Hot) -> str:
+    name = f"job_{h.job_id}_{uuid.uuid4().hex}.pdf"
+    await asyncio.sleep(h.io_seconds)
+    await asyncio.to_thread(_write, os.path.join(h.outdir, name), h.payload)
+    return name
+
+
+# 034 之前的寫法（SQL 照當時的查詢寫在這裡；版本紀錄改由 job_state 一起寫入，比當時少一次 round trip）
+async def accept_locked(conn, h: Hot) -> None:
+    async with conn.transaction():
+        await conn.execute(
+            "SELECT id, client_id, status, due_date FROM jobs WHERE id = %s AND client_id = %s AND status = 'pending' FOR UPDATE",
+            (h.job_id, h.client_id),
+        )
+        cur = await conn.execute("SELECT contractor_id, price FROM bids WHERE id = %s AND job_id = %s", (h.bid_id, h.job_id))
+        contractor_id, price = await cur.fetchone()
+        await conn.execute("SELECT username FROM users WHERE id = %s AND role = 'contractor'", (contractor_id,))
+        await job_state.apply(
+            conn, "BID_SELECTED", job_id=h.job_id, actor_id=h.client_id, message="bench", description="bench",
+            contractor_id=contractor_id, bid_id=h.bid_id, price=price,
+        )
+
+
+async def upload_locked(conn, h: Hot) -> None:
+    async with conn.transaction():
+        await conn.execute(
+            "SELECT id FROM jobs WHERE id = %s AND contractor_id = %s AND status IN ('accepted', 'rejected') FOR UPDATE",
+            (h.job_id, h.contractor_id),
+        )
+        await conn.execute(
+            "SELECT EXISTS (SELECT 1 FROM job_events WHERE job_id = %s AND event_type = 'JOB_REJECTED')", (h.job_id,)
+        )
+        name = await write_file(h)
+        await job_state.apply(
+            conn, "REPORT_UPLOADED", job_id=h.job_id, actor_id=h.contractor_id, message="bench", description="bench",
+            report_file=name, original_name="r.pdf",
+        )
+
+
+# 現在 routes_client.bid_accept / routes_contractor.job_upload 的寫法
+async def accept_short(conn, h: Hot) -> None:
+    async with conn.transaction():
+        found = await repo.fetchone(conn, "bid_accept_lookup", job_id=h.job_id, bid_id=h.bid_id, client_id=h.client_id)
+    async with conn.transaction():
+        await job_state.apply(
+            conn, "BID_SELECTED", job_id=h.job_id, actor_id=h.client_id, message="bench", description="bench",
+            contractor_id=found.contractor_id, bid_id=h.bid_id, price=found.price,
+        )
+
+
+async def upload_short(conn, h: Hot) -> None:
+    async with conn.transaction():
+        found = await repo.fetchone(conn, "upload_lookup", job_id=h.job_id, contractor_id=h.contractor_id)
+    name = await write_file(h)
+    async with conn.transaction():
+        await job_state.apply(
+            conn, "REPORT_UPLOADED", job_id=h.job_id, actor_id=h.contractor_id, message="bench", description="bench",
+            report_file=name, original_name="r.pdf",
+        )
+
+
+MODES = {
+    "locked": (accept_locked, upload_locked),
+    "short": (accept_short, upload_short),
+}
+
+
+# 委託人 + 承包人：選標 → 上傳 → 直接把案件改回 pending（只有 benchmark 會這樣做）再來一輪
+async def holder(conninfo: str, h: Hot, accept, upload, deadline: float, cycles: list) -> None:
+    async with await psycopg.AsyncConnection.connect(conninfo) as conn:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await accept(conn, h)
+            await upload(conn, h)
+            async with conn.transaction():
+                await conn.execute(
+                    "UPDATE jobs SET status = 'pending', contractor_id = NULL, report_file = NULL WHERE id = %s",
+                    (h.job_id,),
+                )
+            cycles.append(time.perf_counter() - start)
+
+
+# 承包人不斷報價；案件不在 pending 時報價會失敗（InvalidTransition），只算成功的。
+# 每次報價前先讀版本號，跟從頁面進入報價表單一樣（選標會讓版本號 + 1）
+async def bidder(conninfo: str, h: Hot, contractor_id: int, deadline: float, latencies: list, bids: list) -> None:
+    async with await psycopg.AsyncConnection.connect(conninfo) as conn:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                async with conn.transaction():
+                    cur = await conn.execute("SELECT version FROM jobs WHERE id = %s", (h.job_id,))
+                    (version,) = await cur.fetchone()
+                    await job_state.apply(
+                        conn, "BID_SUBMITTED", job_id=h.job_id, actor_id=contractor_id,
+                        message="bench", description="bench", price=1000, note="bench",
+                        proposal_file="bench.pdf", proposal_original_name="bench.pdf", job_version=version,
+                    )
+                bids.append(1)
+            except InvalidTransition:
+                pass
+            latencies.append(time.perf_counter() - start)
+
+
+# 建立一個今天截止（可報價也可選標）的案件、得標者的報價，以及其他報價的承包人
+async def create_hot_job(conninfo: str, bidders: int) -> tuple:
+    tag = uuid.uuid4().hex[:8]
+    async with await psycopg.AsyncConnection.connect(conninfo, autocommit=True) as conn:
+        cur = await conn.execute(
+            "INSERT INTO users (username, password_hash, role) VALUES (%s, 'x', 'client') RETURNING id",
+            (f"hot_client_{tag}",),
+        )
+        (client_id,) = await cur.fetchone()
+        cur = await conn.execute(
+            """
+            INSERT INTO users (username, password_hash, role)
+            SELECT 'hot_contractor_' || %s || '_' || g, 'x', 'contractor' FROM generate_series(0, %s) g
+            RETURNING id
+            """,
+            (tag, bidders),
+        )
+        contractor_ids = [r[0] for r in await cur.fetchall()]
+        cur = await conn.execute(
+            "INSERT INTO jobs (title, content, client_id, status, due_date) VALUES ('hot', 'hot', %s, 'pending', %s) RETURNING id",
+            (client_id, date.today()),
+        )
+        (job_id,) = await cur.fetchone()
+        cur = await conn.execute(
+            "INSERT INTO bids (job_id, contractor_id, price, note) VALUES (%s, %s, 1000, 'hot') RETURNING id",
+            (job_id, contractor_ids[0]),
+        )
+        (bid_id,) = await cur.fetchone()
+    return job_id, client_id, contractor_ids[0], bid_id, contractor_ids[1:]
+
+
+async def run(conninfo: str, mode: str, args) -> None:
+    accept, upload = MODES[mode]
+    job_id, client_id, contractor_id, bid_id, bidder_ids = await create_hot_job(conninfo, args.bidders)
+    with tempfile.TemporaryDirectory() as outdir:
+        h = Hot(job_id, client_id, contractor_id, bid_id, args.io_ms, args.size, outdir)
+        cycles, latencies, bids = [], [], []
+        deadline = time.perf_counter() + args.seconds
+        await asyncio.gather(
+            holder(conninfo, h, accept, upload, deadline, cycles),
+            *(bidder(conninfo, h, cid, deadline, latencies, bids) for cid in bidder_ids),
+        )
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)]
+    print(f"{mode:<8}{len(bids) / args.seconds:>9.1f}{statistics.median(latencies) * 1000:>10.1f}"
+          f"{p95 * 1000:>10.1f}{len(cycles) / args.seconds:>10.1f}{statistics.mean(cycles) * 1000:>10.1f}")
+
+
+async def main(args) -> None:
+    dbname = "bench_hot_job"
+    admin = make_conninfo(DATABASE_URL, dbname="postgres")
+    conninfo = await prepare_database(admin, dbname, args.scale)
+    params = conninfo_to_dict(conninfo)
+    server, port = await start_proxy(params.get("host", "localhost"), int(params.get("port", 5432)), args.rtt_ms)
+    proxied = make_conninfo(conninfo, host="127.0.0.1", port=port)
+    try:
+        print(f"{args.bidders} 個承包人同時報價同一個案件 {args.seconds}s，RTT {args.rtt_ms}ms，寫檔延遲 {args.io_ms}ms")
+        print(f"{'mode':<8}{'bids/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'cycles/s':>10}{'cycle ms':>10}")
+        for mode in MODES:
+            await run(proxied, mode, args)
+    finally:
+        server.close()
+        async with await psycopg.AsyncConnection.connect(admin, autocommit=True) as conn:
+            await conn.execute(f'DROP DATABASE IF EXISTS "{dbname}"')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=2_000)
+    parser.add_argument("--bidders", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--rtt-ms", type=float, default=1)
+    parser.add_argument("--io-ms", type=float, default=20)
+    parser.add_argument("--size", type=int, default=256 * 1024)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,111 @@
+# 微型 benchmark：同一條連線上重複執行熱門 statement，比較
+#   text     每次送 SQL 字串，由 server 重新 parse / plan（prepare=False）
+#   prepared repo.py 的做法，第一次之後直接執行 server-side prepared statement（prepare=True）
+# 的 app 端 CPU（process_time）與 DB 端 CPU（讀本機 backend 程序的 /proc/<pid>/stat）。
+#
+# 用法：python -m bench.prepared_statements [--scale 20000] [--iterations 2000]
+# 會另外建立 / 刪除一個測試資料庫，不會動到正式資料。
+import argparse
+import asyncio
+import os
+import time
+from datetime import date
+
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import class_row, dict_row
+from psycopg.types.json import Jsonb
+
+import job_state  # noqa: F401  登錄 event:* statement
+from db import DATABASE_URL
+from explain_check import SAMPLE_QUERIES, prepare_database
+from repo import STATEMENTS
+
+HOT_STATEMENTS = ["contractor_open_jobs", "job_detail", "event:BID_SUBMITTED"]
+
+
+def backend_cpu_seconds(pid: int):
+    # 只有資料庫在本機時讀得到；讀不到就回傳 None
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+async def run_mode(conninfo: str, ids: dict, name: str, prepare: bool, iterations: int) -> dict:
+    stmt = STATEMENTS[name]
+    params = {
+        "job_id": ids["job_id"],
+        "contractor_id": ids["contractor_id"],
+        "actor_id": ids["contractor_id"],
+        "price": 1234,
+        "note": "bench",
+        "proposal_file": "bench.pdf",
+        "proposal_original_name": "bench.pdf",
+        "event_type": "BID_SUBMITTED",
+        "message": "bench",
+        "description": "bench",
+        "due_date": date.today(),
+        "payload": Jsonb({}),
+        "job_version": ids["job_version"],
+    }
+    row_factory = class_row(stmt.row) if stmt.row else dict_row
+
+    # prepare_threshold=None 關掉 psycopg 的自動 prepare，text 模式才是真的每次重新 plan
+    async with await psycopg.AsyncConnection.connect(conninfo, prepare_threshold=None) as conn:
+        cur = await conn.execute("SELECT pg_backend_pid()")
+        (pid,) = await cur.fetchone()
+
+        async with conn.cursor(row_factory=row_factory) as cur:
+            await cur.execute(stmt.sql, params, prepare=prepare)  # 暖身
+            db_start, app_start, wall_start = backend_cpu_seconds(pid), time.process_time(), time.perf_counter()
+            for _ in range(iterations):
+                await cur.execute(stmt.sql, params, prepare=prepare)
+                if cur.description is not None:
+                    await cur.fetchall()
+            wall = time.perf_counter() - wall_start
+            app = time.process_time() - app_start
+            db_end = backend_cpu_seconds(pid)
+        await conn.rollback()
+
+    db = (db_end - db_start) if db_start is not None and db_end is not None else None
+    return {"wall": wall, "app": app, "db": db}
+
+
+def fmt_us(seconds, iterations: int) -> str:
+    return "n/a" if seconds is None else f"{seconds / iterations * 1e6:8.1f}"
+
+
+async def main(scale: int, iterations: int) -> None:
+    dbname = "bench_prepared_statements"
+    admin = make_conninfo(DATABASE_URL, dbname="postgres")
+    conninfo = await prepare_database(admin, dbname, scale)
+    try:
+        ids = {}
+        async with await psycopg.AsyncConnection.connect(conninfo) as conn:
+            for key, query in SAMPLE_QUERIES.items():
+                cur = await conn.execute(query)
+                ids[key] = (await cur.fetchone())[0]
+            cur = await conn.execute("SELECT version FROM jobs WHERE id = %s", (ids["job_id"],))
+            ids["job_version"] = (await cur.fetchone())[0]
+
+        print(f"scale={scale} jobs, {iterations} 次 / statement，單位：微秒 / 次")
+        print(f"{'statement':<24}{'mode':<10}{'wall':>9}{'app cpu':>9}{'db cpu':>9}")
+        for name in HOT_STATEMENTS:
+            for mode, prepare in (("text", False), ("prepared", True)):
+                r = await run_mode(conninfo, ids, name, prepare, iterations)
+                print(f"{name:<24}{mode:<10}{fmt_us(r['wall'], iterations):>9}"
+                      f"{fmt_us(r['app'], iterations):>9}{fmt_us(r['db'], iterations):>9}")
+    finally:
+        async with await psycopg.AsyncConnection.connect(admin, autocommit=True) as conn:
+            await conn.execute(f'DROP DATABASE IF EXISTS "{dbname}"')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=20_000)
+    parser.add_argument("--iterations", type=int, default=2_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.scale, args.iterations))
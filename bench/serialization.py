@@ -0,0 +1,70 @@
+# 序列化 benchmark：/history 這類列表回應，每秒能序列化幾筆資料列
+#   before  dict 資料列 → jsonable_encoder → json.dumps（原本 dict_row + FastAPI 預設回應的路徑）
+#   after   models.py 的 slots dataclass → responses.FastJSONResponse（orjson）
+# 不需要資料庫，資料列是合成的。
+#
+# 用法：python -m bench.serialization [--rows 5000] [--repeat 20]
+import argparse
+import dataclasses
+import json
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+
+from fast_json import orjson
+from models import EventRow
+from responses import FastJSONResponse
+
+
+def make_rows(n: int) -> list[EventRow]:
+    base = datetime(2025, 10, 1, 12, 0, 0)
+    return [
+        EventRow(
+            id=i,
+            job_id=i // 7,
+            actor_id=i % 50,
+            event_type="BID_SUBMITTED",
+            message=f"報價 ${1000 + i}",
+            description=f"承包人 contractor_{i % 50} 報價 ${1000 + i}。備註：第 {i} 筆",
+            created_at=base + timedelta(minutes=i),
+            job_title=f"案件 {i // 7}",
+            actor_name=f"contractor_{i % 50}",
+        )
+        for i in range(n)
+    ]
+
+
+def bench(label: str, fn, rows: int, repeat: int) -> float:
+    fn()  # 暖身
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = time.perf_counter() - start
+    rate = rows * repeat / elapsed
+    print(f"{label:<8}{rate:>14,.0f} rows/s")
+    return rate
+
+
+def main(rows: int, repeat: int) -> None:
+    models = make_rows(rows)
+    dicts = [dataclasses.asdict(r) for r in models]
+
+    def before():
+        return json.dumps(jsonable_encoder({"items": dicts}), ensure_ascii=False).encode("utf-8")
+
+    def after():
+        return FastJSONResponse({"items": models}).body
+
+    print(f"{rows} 筆 × {repeat} 次，encoder = {'orjson' if orjson else 'json（未安裝 orjson）'}")
+    slow = bench("before", before, rows, repeat)
+    fast = bench("after", after, rows, repeat)
+    print(f"加速 {fast / slow:.1f} 倍")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.rows, args.repeat)
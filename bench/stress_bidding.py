@@ -0,0 +1,419 @@
+# 案件狀態機的並行壓力測試：幾百個登入的使用者同時對 app 送 request，結束後檢查資料是否一致
+#
+# 每個案件同時跑一輪完整的流程，所有案件一起開始：
+#   建立案件（部分為邀請制）
+#   邀請制：受邀者同時按「接受」與「婉拒」，其他承包人同時嘗試報價（邀請中不能報價）
+#   報價：多位承包人同時報價、重新報價；委託人在報價進行中同時送出幾次選標（連點 / 開兩個分頁）
+#   上傳與審核：得標者同時上傳兩次、另一位承包人也嘗試上傳，委託人同時退件或結案，重複幾輪
+# request 經過真正的 app（httpx ASGITransport，含 session、表單解析與各 route 的 transaction），
+# 連線經過 bench.hot_job 的延遲 proxy（--rtt-ms），讓鎖裡面的時間接近實際的網路環境。
+#
+# 結束後檢查：
+#   狀態機   依 id 重播每個案件的事件，每個事件都是當時狀態允許的轉換，最後的狀態 / 承包人與 jobs 相同，
+#            jobs.version 等於改變狀態的事件數
+#   得標者   每個案件最多一個 BID_SELECTED / INVITE_ACCEPTED
+#   成果檔案 版本號依寫入順序為 1..n、上傳時間遞增，數量等於上傳事件數，jobs.report_file 是最新版本
+#   報價數   bids 筆數（列表顯示的報價數）= 第一次報價的事件數
+#   回應     每種操作成功（302）的次數等於對應的事件數；沒有任何 5xx
+# 並回報吞吐量、各操作的延遲、deadlock 數（pg_stat_database）、等待鎖的時間（每 20ms 取樣 pg_stat_activity）
+# 與借連線的等待時間。有任何不一致時 exit code = 1。
+#
+# 注意：使用者與 app 跑在同一個 process、同一個 event loop 裡，CPU 用滿時（單核心機器上幾十個 request
+# 同時進行就會）拿到鎖的 request 要排隊等 event loop 才能送出 COMMIT，在 pg_stat_activity 裡是
+# 「idle in transaction」，其他 request 因此等鎖。這時的延遲與等鎖時間主要反映這個 process 的 CPU，
+# 只適合同一台機器上前後比較；要看資料是否一致，數字大小不影響。
+#
+# 用法：python -m bench.stress_bidding [--jobs 200] [--clients 50] [--contractors 300] [--pool 20] [--rtt-ms 1]
+# 會另外建立 / 刪除一個測試資料庫，不會動到正式資料。
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+import httpx
+import psycopg
+from psycopg.conninfo import conninfo_to_dict, make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+import db
+import job_state
+from bench.hot_job import start_proxy
+from explain_check import prepare_database
+
+LOCK_SAMPLE_SECONDS = 0.02
+
+# 成功的 request 各自對應到哪些事件
+EXPECTED_EVENTS = {
+    "job_new": ("JOB_CREATED", "JOB_INVITED"),
+    "bid_new": ("BID_SUBMITTED",),
+    "bid_accept": ("BID_SELECTED",),
+    "invitation_accept": ("INVITE_ACCEPTED",),
+    "invitation_decline": ("INVITE_DECLINED",),
+    "job_upload": ("REPORT_UPLOADED", "REPORT_RE_UPLOADED"),
+    "review_rejected": ("JOB_REJECTED",),
+    "review_closed": ("JOB_CLOSED",),
+}
+
+
+@dataclass
+class User:
+    http: httpx.AsyncClient
+    id: int
+    role: str
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.statuses: Counter = Counter()
+        self.errors: list[str] = []
+
+    async def post(self, user: User, action: str, url: str, data: dict, files=None) -> int:
+        start = time.perf_counter()
+        r = await user.http.post(url, data=data, files=files)
+        self.latencies[action].append(time.perf_counter() - start)
+        self.statuses[action, r.status_code] += 1
+        if r.status_code >= 500:
+            self.errors.append(f"{action} {data}: {r.status_code} {r.text[:200]}")
+        return r.status_code
+
+    def ok(self, action: str) -> int:
+        return self.statuses[action, 302]
+
+
+async def sign_in(app, name: str, role: str) -> User:
+    http = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://stress")
+    await http.post("/register", data={"username": name, "password": "stress", "role": role})
+    r = await http.post("/login", data={"username": name, "password": "stress"})
+    if r.status_code != 302:
+        raise RuntimeError(f"登入失敗 {name}：{r.status_code} {r.text[:200]}")
+    me = (await http.get("/me")).json()
+    return User(http, me["user_id"], role)
+
+
+# ========== 每個案件的流程 ==========
+
+async def job_detail(user: User, job_id: int) -> dict:
+    return (await user.http.get(f"/job/{job_id}/detail")).json()
+
+
+async def bid(rec: Recorder, contractor: User, job_id: int, rng: random.Random) -> int:
+    files = {"proposal_file": ("proposal.pdf", b"%PDF-1.4 stress", "application/pdf")}
+    # 跟從頁面進入報價表單一樣先讀版本號；案件已不開放時看不到案件，照樣送出（會因狀態被拒絕）
+    version = (await job_detail(contractor, job_id)).get("job", {}).get("version", 0)
+    data = {"job_id": job_id, "price": rng.randint(100, 5000), "note": "stress", "job_version": version}
+    return await rec.post(contractor, "bid_new", "/bid/new", data, files)
+
+
+async def upload(rec: Recorder, contractor: User, job_id: int) -> int:
+    files = {"report_file": ("report.pdf", b"%PDF-1.4 report", "application/pdf")}
+    return await rec.post(contractor, "job_upload", "/job/upload", {"job_id": job_id}, files)
+
+
+async def review(rec: Recorder, client: User, job_id: int, decision: str, delay: float) -> int:
+    await asyncio.sleep(delay)
+    data = {"job_id": job_id, "decision": decision, "message": "stress"}
+    return await rec.post(client, f"review_{decision}", "/job/review", data)
+
+
+async def lifecycle(rec: Recorder, pool, client: User, contractors: list[User], invited: Optional[User],
+                    rng: random.Random, args) -> None:
+    title = f"stress-{uuid.uuid4().hex}"
+    data = {"title": title, "content": "stress", "budget_str": "1000", "due_date_str": date.today().isoformat()}
+    if invited is not None:
+        data["invited_contractor_id_str"] = str(invited.id)
+    if await rec.post(client, "job_new", "/job/new", data) != 302:
+        return
+    async with pool.connection() as conn:
+        cur = await conn.execute("SELECT id FROM jobs WHERE title = %s", (title,))
+        job_id = (await cur.fetchone())["id"]
+
+    bidders = rng.sample([c for c in contractors if c is not invited], args.bidders)
+    winner = None
+    if invited is not None:
+        accepted, *_ = await asyncio.gather(
+            rec.post(invited, "invitation_accept", "/invitation/accept", {"job_id": job_id}),
+            rec.post(invited, "invitation_decline", "/invitation/decline", {"job_id": job_id}),
+            *(bid(rec, c, job_id, rng) for c in bidders[:3]),
+        )
+        if accepted == 302:
+            winner = invited
+
+    if winner is None:
+        async def bidder(c: User):
+            for _ in range(rng.randint(1, args.rebids)):
+                await bid(rec, c, job_id, rng)
+                await asyncio.sleep(rng.uniform(0, args.window))
+
+        async def select():
+            await asyncio.sleep(rng.uniform(0, args.window))
+            bids = (await job_detail(client, job_id)).get("bids") or []
+            if bids:
+                picks = [rng.choice(bids) for _ in range(args.accepts)]
+                await asyncio.gather(*(
+                    rec.post(client, "bid_accept", "/bid/accept", {"job_id": job_id, "bid_id": b["id"]}) for b in picks
+                ))
+
+        await asyncio.gather(select(), *(bidder(c) for c in bidders))
+        contractor_id = (await job_detail(client, job_id))["job"]["contractor_id"]
+        winner = next((c for c in contractors if c.id == contractor_id), None)
+        if winner is None:
+            return  # 選標時還沒有人報價成功
+
+    for n in range(args.rounds):
+        decision = "closed" if n == args.rounds - 1 or rng.random() < 0.3 else "rejected"
+        results = await asyncio.gather(
+            upload(rec, winner, job_id),
+            upload(rec, winner, job_id),
+            upload(rec, rng.choice(contractors), job_id),
+            review(rec, client, job_id, decision, rng.uniform(0, args.window)),
+            review(rec, client, job_id, decision, rng.uniform(0, args.window)),
+        )
+        if decision == "closed" and 302 in results[3:]:
+            break
+
+
+# ========== 觀察資料庫 ==========
+
+async def sample_lock_waits(conninfo: str, dbname: str, stop: asyncio.Event) -> dict:
+    waited, peak, last = 0.0, 0, time.perf_counter()
+    async with await psycopg.AsyncConnection.connect(conninfo, autocommit=True) as conn:
+        while not stop.is_set():
+            cur = await conn.execute(
+                "SELECT COUNT(*) FROM pg_stat_activity WHERE datname = %s AND wait_event_type = 'Lock'", (dbname,)
+            )
+            (waiting,) = await cur.fetchone()
+            now = time.perf_counter()
+            waited += waiting * (now - last)
+            peak = max(peak, waiting)
+            last = now
+            try:
+                await asyncio.wait_for(stop.wait(), LOCK_SAMPLE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    return {"seconds": waited, "peak": peak}
+
+
+async def database_counters(conninfo: str, dbname: str) -> dict:
+    async with await psycopg.AsyncConnection.connect(conninfo, autocommit=True, row_factory=dict_row) as conn:
+        cur = await conn.execute(
+            "SELECT deadlocks, xact_commit, xact_rollback FROM pg_stat_database WHERE datname = %s", (dbname,)
+        )
+        return await cur.fetchone()
+
+
+# ========== 不變量 ==========
+
+async def check_invariants(conn, rec: Recorder) -> list[str]:
+    problems = []
+    cur = await conn.execute("SELECT id, status, version, contractor_id, report_file FROM jobs WHERE title LIKE 'stress-%%'")
+    jobs = {j["id"]: j for j in await cur.fetchall()}
+    cur = await conn.execute(
+        "SELECT job_id, event_type, actor_id, payload FROM job_events WHERE job_id = ANY(%s) ORDER BY job_id, id",
+        (list(jobs),),
+    )
+    events = defaultdict(list)
+    counts = Counter()
+    new_bids = Counter()
+    for e in await cur.fetchall():
+        events[e["job_id"]].append(e)
+        counts[e["event_type"]] += 1
+        if e["event_type"] == "BID_SUBMITTED" and (e["payload"] or {}).get("new_bid"):
+            new_bids[e["job_id"]] += 1
+
+    uploads = Counter()
+    for job_id, job in jobs.items():
+        evs = events.get(job_id, [])
+        if not evs or evs[0]["event_type"] not in job_state.CREATIONS:
+            problems.append(f"job {job_id}: 第一個事件不是建立案件")
+            continue
+        state = job_state.CREATIONS[evs[0]["event_type"]]
+        contractor = (evs[0]["payload"] or {}).get("contractor_id")
+        transitions = winners = 0
+        for e in evs[1:]:
+            t = job_state.TRANSITIONS.get(e["event_type"])
+            if t is None or state not in t.from_states:
+                problems.append(f"job {job_id}: {state} 狀態下出現 {e['event_type']}")
+                break
+            if e["event_type"] == "BID_SELECTED":
+                contractor = e["payload"]["contractor_id"]
+            elif e["event_type"] == "INVITE_DECLINED":
+                contractor = None
+            elif e["event_type"].startswith("REPORT_"):
+                uploads[job_id] += 1
+                if e["actor_id"] != contractor:
+                    problems.append(f"job {job_id}: 非得標者 {e['actor_id']} 上傳成功")
+            if e["event_type"] in ("BID_SELECTED", "INVITE_ACCEPTED"):
+                winners += 1
+            if t.to_state is not None:
+                state = t.to_state
+                transitions += 1
+        if winners > 1:
+            problems.append(f"job {job_id}: {winners} 個得標者")
+        if state != job["status"] or contractor != job["contractor_id"]:
+            problems.append(f"job {job_id}: 事件推導為 {state}/{contractor}，jobs 是 {job['status']}/{job['contractor_id']}")
+        if transitions != job["version"]:
+            problems.append(f"job {job_id}: {transitions} 次狀態轉換，version 是 {job['version']}")
+
+    cur = await conn.execute(
+        """
+        SELECT job_id, array_agg(version ORDER BY id) AS versions, array_agg(file_path ORDER BY id) AS files,
+               bool_and(prev IS NULL OR prev <= uploaded_at) AS ordered
+        FROM (SELECT *, lag(uploaded_at) OVER (PARTITION BY job_id ORDER BY id) AS prev FROM job_result_files) f
+        WHERE job_id = ANY(%s)
+        GROUP BY job_id
+        """,
+        (list(jobs),),
+    )
+    for f in await cur.fetchall():
+        job_id = f["job_id"]
+        if f["versions"] != list(range(1, len(f["versions"]) + 1)) or not f["ordered"]:
+            problems.append(f"job {job_id}: 成果檔案版本 {f['versions']}")
+        if len(f["versions"]) != uploads[job_id]:
+            problems.append(f"job {job_id}: {len(f['versions'])} 個成果檔案、{uploads[job_id]} 個上傳事件")
+        if jobs[job_id]["report_file"] != f["files"][-1]:
+            problems.append(f"job {job_id}: report_file 不是最新版本")
+
+    cur = await conn.execute(
+        """
+        SELECT j.id, (SELECT COUNT(*) FROM bids b WHERE b.job_id = j.id) AS bids
+        FROM jobs j
+        WHERE j.id = ANY(%s)
+        """,
+        (list(jobs),),
+    )
+    for r in await cur.fetchall():
+        if r["bids"] != new_bids[r["id"]]:
+            problems.append(f"job {r['id']}: bids {r['bids']}、第一次報價事件 {new_bids[r['id']]}")
+
+    for action, event_types in EXPECTED_EVENTS.items():
+        expected = sum(counts[t] for t in event_types)
+        if rec.ok(action) != expected:
+            problems.append(f"{action}: {rec.ok(action)} 次成功，{'+'.join(event_types)} 事件 {expected} 筆")
+    problems.extend(f"5xx: {e}" for e in rec.errors)
+    return problems
+
+
+# ========== 報告 ==========
+
+def print_report(rec: Recorder, elapsed: float, transitions: int, locks: dict, before: dict, after: dict, pool_stats: dict):
+    print(f"{'action':<20}{'ok':>7}{'rejected':>10}{'5xx':>6}{'p50 ms':>9}{'p95 ms':>9}")
+    total = 0
+    for action in EXPECTED_EVENTS:
+        lat = sorted(rec.latencies.get(action, []))
+        if not lat:
+            continue
+        total += len(lat)
+        errors = sum(n for (a, s), n in rec.statuses.items() if a == action and s >= 500)
+        ok = rec.ok(action)
+        print(f"{action:<20}{ok:>7}{len(lat) - ok - errors:>10}{errors:>6}"
+              f"{lat[len(lat) // 2] * 1000:>9.1f}{lat[int(len(lat) * 0.95)] * 1000:>9.1f}")
+    waits = pool_stats.get("requests_wait_ms", 0) / max(pool_stats.get("requests_num", 1), 1)
+    print(f"\n{elapsed:.1f}s，{total / elapsed:.0f} 個寫入 request/s，{transitions / elapsed:.0f} 個事件/s")
+    print(f"deadlock {after['deadlocks'] - before['deadlocks']}，"
+          f"rollback {after['xact_rollback'] - before['xact_rollback']} / commit {after['xact_commit'] - before['xact_commit']}")
+    print(f"等待鎖：合計約 {locks['seconds']:.2f}s（取樣），同時最多 {locks['peak']} 條連線在等；"
+          f"借連線平均等 {waits:.1f}ms（{pool_stats.get('requests_queued', 0)} 次需要排隊）")
+
+
+async def run(args) -> int:
+    rng = random.Random(args.seed)
+    dbname = "bench_stress_bidding"
+    admin = make_conninfo(db.DATABASE_URL, dbname="postgres")
+    conninfo = await prepare_database(admin, dbname, args.scale)
+    params = conninfo_to_dict(conninfo)
+    server, port = await start_proxy(params.get("host", "localhost"), int(params.get("port", 5432)), args.rtt_ms)
+    proxied = make_conninfo(conninfo, host="127.0.0.1", port=port)
+
+    # app 的連線池改連測試資料庫（db.get_pool 第一次呼叫時才建立，這裡先放好指定大小的池子）
+    pool = AsyncConnectionPool(proxied, min_size=args.pool, max_size=args.pool, kwargs={"row_factory": dict_row}, open=False)
+    await pool.open()
+    db.DATABASE_URL, db._pool = proxied, pool
+
+    workdir = tempfile.mkdtemp(prefix="stress_bidding_")
+    cwd = os.getcwd()
+    os.chdir(workdir)  # 報價與成果檔案寫到 uploads/
+    try:
+        from main import create_app
+
+        app = create_app(prewarm=False, background=False, check_schema=False)
+        async with app.router.lifespan_context(app):
+            tag = uuid.uuid4().hex[:6]
+            clients = await asyncio.gather(*(sign_in(app, f"stress_cl_{tag}_{i}", "client") for i in range(args.clients)))
+            contractors = await asyncio.gather(*(
+                sign_in(app, f"stress_co_{tag}_{i}", "contractor") for i in range(args.contractors)
+            ))
+            print(f"{args.jobs} 個案件、{args.clients} 位委託人、{args.contractors} 位承包人同時進行，"
+                  f"連線池 {args.pool}，RTT {args.rtt_ms}ms")
+
+            rec = Recorder()
+            before = await database_counters(conninfo, dbname)
+            stop = asyncio.Event()
+            sampler = asyncio.create_task(sample_lock_waits(conninfo, dbname, stop))
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                lifecycle(
+                    rec, pool, rng.choice(clients), contractors,
+                    rng.choice(contractors) if rng.random() < args.invited else None, rng, args,
+                )
+                for _ in range(args.jobs)
+            ))
+            elapsed = time.perf_counter() - start
+            stop.set()
+            locks = await sampler
+            pool_stats = pool.get_stats()
+
+            async with pool.connection() as conn:
+                problems = await check_invariants(conn, rec)
+                cur = await conn.execute(
+                    "SELECT COUNT(*) AS n FROM job_events e JOIN jobs j ON j.id = e.job_id WHERE j.title LIKE 'stress-%%'"
+                )
+                transitions = (await cur.fetchone())["n"]
+            for user in [*clients, *contractors]:
+                await user.http.aclose()
+
+        await asyncio.sleep(1)  # 連線關閉後 pg_stat_database 才會更新
+        after = await database_counters(conninfo, dbname)
+        print_report(rec, elapsed, transitions, locks, before, after, pool_stats)
+        if problems:
+            print(f"\n不一致 {len(problems)} 項：")
+            for p in problems[:50]:
+                print(f"  {p}")
+            return 1
+        print("\n不變量檢查通過")
+        return 0
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+        server.close()
+        await pool.close()
+        async with await psycopg.AsyncConnection.connect(admin, autocommit=True) as conn:
+            await conn.execute(f'DROP DATABASE IF EXISTS "{dbname}" WITH (FORCE)')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=1_000, help="測試資料庫預先灌入的案件數")
+    parser.add_argument("--jobs", type=int, default=200, help="同時進行的案件數")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--contractors", type=int, default=300)
+    parser.add_argument("--bidders", type=int, default=8, help="每個案件有幾位承包人報價")
+    parser.add_argument("--rebids", type=int, default=3, help="每位承包人最多報價幾次")
+    parser.add_argument("--accepts", type=int, default=3, help="委託人同時送出幾次選標")
+    parser.add_argument("--rounds", type=int, default=3, help="上傳 / 審核最多幾輪")
+    parser.add_argument("--invited", type=float, default=0.3, help="邀請制案件的比例")
+    parser.add_argument("--window", type=float, default=0.05, help="同一個案件的操作錯開的最長秒數")
+    parser.add_argument("--pool", type=int, default=20, help="app 的連線池大小")
+    parser.add_argument("--rtt-ms", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    sys.exit(asyncio.run(run(parser.parse_args())))
@@ -0,0 +1,121 @@
+# 背景工作佇列（tasks.py）的 benchmark
+#   throughput  先灌 N 個工作，再用不同的 worker 數 × concurrency 清空佇列，看每秒完成幾個；
+#               同時檢查有沒有工作被執行兩次（SKIP LOCKED 領取不應該重複）
+#   latency     worker 閒置時新增一個工作，到處理函式開始執行要多久（LISTEN / NOTIFY 喚醒，
+#               不必等 POLL_SECONDS 的輪詢）
+#
+# 用法：python -m bench.task_queue [--tasks 20000] [--configs 1x1,1x8,4x8,8x16] [--work-ms 0]
+# 會另外建立 / 刪除一個測試資料庫，不會動到正式資料。
+import argparse
+import asyncio
+import statistics
+import time
+
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+import tasks
+from db import DATABASE_URL
+from explain_check import prepare_database
+
+KIND = "bench.noop"
+
+executed: list[int] = []
+latencies: list[float] = []
+work_seconds = 0.0
+
+
+async def noop(payload: dict) -> None:
+    if "enqueued_at" in payload:
+        latencies.append(time.time() - payload["enqueued_at"])
+    else:
+        executed.append(payload["i"])
+    if work_seconds:
+        await asyncio.sleep(work_seconds)
+
+
+async def wait_until(predicate, timeout: float) -> bool:
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            return False
+        await asyncio.sleep(0.005)
+    return True
+
+
+async def throughput(pool, workers: int, concurrency: int, n: int) -> None:
+    executed.clear()
+    async with pool.connection() as conn:
+        await conn.execute(
+            "INSERT INTO tasks (kind, payload) SELECT %s, jsonb_build_object('i', g) FROM generate_series(1, %s) g",
+            (KIND, n),
+        )
+    ws = [tasks.Worker(concurrency, [KIND], pool=pool) for _ in range(workers)]
+    start = time.perf_counter()
+    runs = [asyncio.create_task(w.run()) for w in ws]
+    finished = await wait_until(lambda: sum(w.stats["done"] for w in ws) >= n, timeout=600)
+    elapsed = time.perf_counter() - start
+    for w in ws:
+        w.stop()
+    await asyncio.gather(*runs)
+
+    async with pool.connection() as conn:
+        cur = await conn.execute("SELECT COUNT(*) AS n FROM tasks WHERE kind = %s", (KIND,))
+        left = (await cur.fetchone())["n"]
+    duplicated = len(executed) - len(set(executed))
+    note = "" if finished else "（逾時）"
+    print(f"{f'{workers}x{concurrency}':<10}{len(set(executed)) / elapsed:>10.0f}{elapsed:>9.2f}{duplicated:>7}{left:>7}{note}")
+
+
+async def latency(pool, conninfo: str, samples: int) -> None:
+    latencies.clear()
+    worker = tasks.Worker(1, [KIND], pool=pool)
+    run = asyncio.create_task(worker.run())
+    await asyncio.sleep(0.5)  # 等 LISTEN 連上
+    async with await psycopg.AsyncConnection.connect(conninfo, autocommit=True) as conn:
+        for i in range(samples):
+            await tasks.enqueue(conn, KIND, {"enqueued_at": time.time()})
+            await wait_until(lambda: len(latencies) > i, timeout=tasks.POLL_SECONDS * 2)
+            await asyncio.sleep(0.02)
+    worker.stop()
+    await run
+
+    ms = sorted(x * 1000 for x in latencies)
+    print(f"閒置 worker 開始執行新工作：p50 {statistics.median(ms):.1f}ms，p95 {ms[int(len(ms) * 0.95)]:.1f}ms，"
+          f"最慢 {ms[-1]:.1f}ms（{len(ms)}/{samples} 筆；輪詢間隔 {tasks.POLL_SECONDS:.0f}s）")
+
+
+async def main(args) -> None:
+    global work_seconds
+    work_seconds = args.work_ms / 1000
+    tasks.register(KIND, noop, max_attempts=1)
+
+    dbname = "bench_task_queue"
+    admin = make_conninfo(DATABASE_URL, dbname="postgres")
+    conninfo = await prepare_database(admin, dbname, args.scale)
+    configs = [tuple(int(x) for x in c.split("x")) for c in args.configs.split(",")]
+    max_size = max(w * c + w for w, c in configs)
+    pool = AsyncConnectionPool(conninfo, min_size=4, max_size=max_size, kwargs={"row_factory": dict_row}, open=False)
+    await pool.open()
+    try:
+        print(f"{args.tasks} 個工作，每個執行 {args.work_ms}ms")
+        print(f"{'workers':<10}{'tasks/s':>10}{'secs':>9}{'dup':>7}{'left':>7}")
+        for workers, concurrency in configs:
+            await throughput(pool, workers, concurrency, args.tasks)
+        await latency(pool, conninfo, args.samples)
+    finally:
+        await pool.close()
+        async with await psycopg.AsyncConnection.connect(admin, autocommit=True) as conn:
+            await conn.execute(f'DROP DATABASE IF EXISTS "{dbname}"')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=1_000)
+    parser.add_argument("--tasks", type=int, default=20_000)
+    parser.add_argument("--configs", default="1x1,1x8,4x8,8x16", help="worker 數 x 每個 worker 的 concurrency")
+    parser.add_argument("--work-ms", type=float, default=0)
+    parser.add_argument("--samples", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
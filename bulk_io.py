@@ -0,0 +1,493 @@
+# 大量匯入 / 匯出（users、jobs、bids、job_events、job_result_files），CSV 或 NDJSON
+#
+# 匯出：COPY (SELECT ...) TO STDOUT 串流寫檔，依 id 排序。
+# 匯入：檔案逐行讀取，以 COPY 串流寫進暫存表（欄位全部是 TEXT），之後都在資料庫裡整批處理：
+#   1. 格式檢查：每個欄位能不能轉成目標型別（pg_input_is_valid，PostgreSQL 16 以上才有，較舊的版本直接拒絕匯入）
+#   2. 內容檢查：與 job_new / bid_new 相同的限制（標題 / 內容長度、預算範圍、截止日、
+#      委託人 / 承包人存在、不能投標自己的案件 ...）加上檔案內 / 資料庫裡的重複，一條 UPDATE 標記每列的錯誤
+#   3. 通過的資料列用一條 INSERT ... SELECT 寫入，同一條 SQL 產生對應的事件：
+#      jobs → JOB_CREATED / JOB_INVITED，bids → BID_SUBMITTED
+# Python 端一次只保留一列，記憶體用量與檔案大小無關。全部在同一個 transaction 裡，
+# 有任何一列不合法就整批不寫入（--skip-invalid 時只略過不合法的列）。
+#
+# 事件時間與資料列的 created_at 相同，沒有時用匯入當下（與欄位的 DEFAULT NOW() 相同）；需要的月份 partition 會先建好。
+# 一般匯入的案件一律是新案件（pending，有邀請承包人時是 invited），狀態由事件決定；
+# 要原封不動搬移整個資料庫（含已結案的案件）時用 --raw：依檔案內容寫入、不產生事件，
+# 五張表都匯入後執行 python replay.py --dry-run 確認 projection 與事件一致。
+# job_events / job_result_files 本身就是紀錄，一律照檔案內容寫入。
+# 指定 id 時保留原本的 id，匯入後把 sequence 推到最大值之後。
+#
+# 用法：
+#   python bulk_io.py export jobs -o jobs.csv
+#   python bulk_io.py export job_events --format ndjson -o events.ndjson
+#   python bulk_io.py import jobs partner_jobs.csv [--skip-invalid] [--dry-run]
+#   python bulk_io.py import bids partner_bids.ndjson
+#   python bulk_io.py import jobs jobs.csv --raw
+import argparse
+import asyncio
+import csv
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional
+
+import psycopg
+from psycopg import sql
+
+from db import DATABASE_URL
+from job_state import CREATIONS, TRANSITIONS
+
+MAX_REPORTED_ERRORS = 20
+MIN_SERVER_VERSION = 160000  # pg_input_is_valid
+JOB_STATUSES = ("pending", "invited", "accepted", "uploaded", "rejected", "closed")
+EVENT_TYPES = sorted([*CREATIONS, *TRANSITIONS])
+
+
+@dataclass(frozen=True)
+class Table:
+    name: str
+    columns: dict[str, str]                        # 欄位 → 型別（匯出的欄位、匯入時的轉型）
+    required: tuple[str, ...]                      # 匯入檔必須有的欄位
+    checks: tuple[tuple[str, str], ...]            # (不合法的條件, 錯誤訊息)，依序檢查，只回報第一個
+    new_only: tuple[tuple[str, str], ...] = ()     # 只在一般匯入（非 --raw）時檢查
+    joins: str = ""                                # 檢查時要參考的其他表（t 是轉型後的匯入資料）
+    unique: Optional[str] = None                   # 檔案內不可重複的欄位
+    # NOT NULL 欄位是空值時代入的值（與資料表的 DEFAULT 相同）：檔案裡只有部分列有這個欄位時，
+    # 其他列不會被寫成 NULL
+    defaults: dict[str, str] = field(default_factory=dict)
+    raw_columns: tuple[str, ...] = ()              # 只有 --raw 才能匯入的欄位（一般匯入時由事件決定）
+    events: Optional[str] = None                   # 一般匯入：寫入後產生事件的 SQL（引用 inserted CTE）
+    event_returning: str = ""                      # inserted CTE 要 RETURNING 的欄位
+
+
+# id 有指定時不能與檔案內其他列或資料庫裡的重複
+def _id_checks(table: str) -> tuple[tuple[str, str], ...]:
+    return (
+        ("t.id IS NOT NULL AND count(*) OVER (PARTITION BY t.id) > 1", "id 在檔案內重複"),
+        (f"t.id IS NOT NULL AND EXISTS (SELECT 1 FROM {table} x WHERE x.id = t.id)", "id 已存在"),
+    )
+
+
+TABLES = {
+    "users": Table(
+        "users",
+        {"id": "int", "username": "text", "password_hash": "text", "role": "text", "created_at": "timestamptz"},
+        required=("username", "password_hash", "role"),
+        checks=(
+            ("t.username IS NULL OR t.username = ''", "缺少 username"),
+            ("t.password_hash IS NULL OR t.password_hash = ''", "缺少 password_hash"),
+            ("t.role IS NULL OR t.role NOT IN ('client', 'contractor')", "role 需為 client 或 contractor"),
+            ("t.dup > 1", "username 在檔案內重複"),
+            ("EXISTS (SELECT 1 FROM users u WHERE u.username = t.username)", "username 已存在"),
+            *_id_checks("users"),
+        ),
+        unique="t.username",
+        defaults={"created_at": "NOW()"},
+    ),
+    "jobs": Table(
+        "jobs",
+        {
+            "id": "int", "title": "text", "content": "text", "client_id": "int", "contractor_id": "int",
+            "status": "text", "budget": "int", "due_date": "date", "report_file": "text", "version": "int",
+            "created_at": "timestamptz", "updated_at": "timestamptz",
+        },
+        required=("title", "content", "client_id", "due_date"),
+        # 與 routes_client.job_new 相同；一般匯入時截止日不得早於建立當天（建立時間沒給就是今天）
+        checks=(
+            ("t.title IS NULL OR char_length(t.title) NOT BETWEEN 1 AND 100", "標題長度需為 1~100"),
+            ("t.content IS NULL OR char_length(t.content) NOT BETWEEN 1 AND 5000", "內容長度需為 1~5000"),
+            ("t.budget IS NOT NULL AND t.budget NOT BETWEEN 0 AND 999999999", "預算需為 0~999,999,999"),
+            ("t.due_date IS NULL", "必須設定投標截止日"),
+            ("cl.id IS NULL", "委託人不存在"),
+            ("t.contractor_id IS NOT NULL AND co.id IS NULL", "承包人不存在"),
+            ("t.contractor_id = t.client_id", "不能邀請自己"),
+            (f"t.status IS NOT NULL AND t.status NOT IN ({', '.join(repr(s) for s in JOB_STATUSES)})", "狀態錯誤"),
+            *_id_checks("jobs"),
+        ),
+        new_only=(("t.due_date < COALESCE(t.created_at, NOW())::date", "投標截止日不得早於建立日"),),
+        joins="""
+            LEFT JOIN users cl ON cl.id = t.client_id AND cl.role = 'client'
+            LEFT JOIN users co ON co.id = t.contractor_id AND co.role = 'contractor'
+        """,
+        defaults={"status": "'pending'", "version": "0", "created_at": "NOW()", "updated_at": "NOW()"},
+        raw_columns=("status", "report_file", "version", "updated_at"),
+        event_returning="id, client_id, contractor_id, title, created_at",
+        # 訊息與 job_new 相同
+        events="""
+            INSERT INTO job_events (job_id, actor_id, event_type, message, description, payload, created_at)
+            SELECT i.id, i.client_id,
+                   CASE WHEN i.contractor_id IS NULL THEN 'JOB_CREATED' ELSE 'JOB_INVITED' END,
+                   CASE WHEN i.contractor_id IS NULL THEN '案件「' || i.title || '」' ELSE '邀請 ' || co.username END,
+                   CASE WHEN i.contractor_id IS NULL
+                        THEN '委託人 ' || cl.username || ' 建立了新案件「' || i.title || '」'
+                        ELSE '委託人 ' || cl.username || ' 邀請 ' || co.username || ' 承接案件「' || i.title || '」' END,
+                   jsonb_strip_nulls(jsonb_build_object('contractor_id', i.contractor_id, 'imported', true)),
+                   i.created_at
+            FROM inserted i
+            JOIN users cl ON cl.id = i.client_id
+            LEFT JOIN users co ON co.id = i.contractor_id
+            ORDER BY i.id
+        """,
+    ),
+    "bids": Table(
+        "bids",
+        {
+            "id": "int", "job_id": "int", "contractor_id": "int", "price": "int", "note": "text",
+            "proposal_file": "text", "proposal_original_name": "text", "created_at": "timestamptz",
+        },
+        required=("job_id", "contractor_id", "price"),
+        checks=(
+            ("t.price IS NULL OR t.price NOT BETWEEN 0 AND 999999999", "金額需為 0~999,999,999"),
+            ("j.id IS NULL", "案件不存在"),
+            ("co.id IS NULL", "承包人不存在"),
+            ("j.client_id = t.contractor_id", "不能投標自己的案件"),
+            ("t.dup > 1", "同一個承包人對同一個案件重複報價"),
+            ("EXISTS (SELECT 1 FROM bids b WHERE b.job_id = t.job_id AND b.contractor_id = t.contractor_id)", "報價已存在"),
+            *_id_checks("bids"),
+        ),
+        # 與 BID_SUBMITTED 的條件相同，以報價時間判斷截止日
+        new_only=(
+            ("j.status <> 'pending'", "此案件不開放投標"),
+            ("j.due_date < COALESCE(t.created_at, NOW())::date", "此案件投標已截止"),
+        ),
+        joins="""
+            LEFT JOIN jobs j ON j.id = t.job_id
+            LEFT JOIN users co ON co.id = t.contractor_id AND co.role = 'contractor'
+        """,
+        unique="t.job_id, t.contractor_id",
+        defaults={"note": "''", "created_at": "NOW()"},
+        event_returning="id, job_id, contractor_id, price, note, proposal_file, proposal_original_name, created_at",
+        events="""
+            INSERT INTO job_events (job_id, actor_id, event_type, message, description, payload, created_at)
+            SELECT i.job_id, i.contractor_id, 'BID_SUBMITTED', '報價 $' || i.price,
+                   '承包人 ' || co.username || ' 報價 $' || i.price || '。備註：' || i.note,
+                   jsonb_build_object('price', i.price, 'note', i.note, 'proposal_file', i.proposal_file,
+                                      'proposal_original_name', i.proposal_original_name,
+                                      'new_bid', true, 'imported', true),
+                   i.created_at
+            FROM inserted i
+            JOIN users co ON co.id = i.contractor_id
+            ORDER BY i.id
+        """,
+    ),
+    "job_events": Table(
+        "job_events",
+        {
+            "id": "bigint", "job_id": "int", "actor_id": "int", "event_type": "text", "message": "text",
+            "description": "text", "created_at": "timestamptz", "payload": "jsonb",
+        },
+        required=("job_id", "event_type"),
+        checks=(
+            ("j.id IS NULL", "案件不存在"),
+            ("t.actor_id IS NOT NULL AND a.id IS NULL", "actor 不存在"),
+            (f"t.event_type IS NULL OR t.event_type NOT IN ({', '.join(repr(e) for e in EVENT_TYPES)})", "事件類型錯誤"),
+            *_id_checks("job_events"),
+        ),
+        joins="""
+            LEFT JOIN jobs j ON j.id = t.job_id
+            LEFT JOIN users a ON a.id = t.actor_id
+        """,
+        defaults={"payload": "'{}'::jsonb", "created_at": "NOW()"},
+    ),
+    "job_result_files": Table(
+        "job_result_files",
+        {
+            "id": "int", "job_id": "int", "contractor_id": "int", "version": "int", "file_path": "text",
+            "original_name": "text", "uploaded_at": "timestamptz",
+        },
+        required=("job_id", "contractor_id", "version", "file_path"),
+        checks=(
+            ("j.id IS NULL", "案件不存在"),
+            ("co.id IS NULL", "承包人不存在"),
+            ("t.version IS NULL OR t.version < 1", "版本號需大於 0"),
+            ("t.file_path IS NULL OR t.file_path = ''", "缺少 file_path"),
+            *_id_checks("job_result_files"),
+        ),
+        defaults={"uploaded_at": "NOW()"},
+        joins="""
+            LEFT JOIN jobs j ON j.id = t.job_id
+            LEFT JOIN users co ON co.id = t.contractor_id AND co.role = 'contractor'
+        """,
+    ),
+}
+
+# 這些表的匯入會寫 job_events，需要先建好對應月份的 partition
+EVENT_TIME_COLUMN = {"jobs": "created_at", "bids": "created_at", "job_events": "created_at"}
+
+
+def detect_format(path: Optional[Path], given: Optional[str]) -> str:
+    if given:
+        return given
+    if path is not None and path.suffix.lower() in (".ndjson", ".jsonl"):
+        return "ndjson"
+    return "csv"
+
+
+# ========== 匯出 ==========
+
+async def export(conn, table: Table, out, fmt: str) -> int:
+    columns = sql.SQL(", ").join(map(sql.Identifier, table.columns))
+    select = sql.SQL("SELECT {} FROM {} ORDER BY id").format(columns, sql.Identifier(table.name))
+    if fmt == "csv":
+        query = sql.SQL("COPY ({}) TO STDOUT (FORMAT csv, HEADER)").format(select)
+    else:
+        # text 格式的 COPY 只會把 JSON 裡的反斜線變成兩個（JSON 本身沒有換行、tab），寫出前還原
+        query = sql.SQL("COPY (SELECT row_to_json(r) FROM ({}) r) TO STDOUT").format(select)
+    size = 0
+    async with conn.cursor() as cur:
+        async with cur.copy(query) as copy:
+            async for data in copy:
+                data = bytes(data)
+                if fmt == "ndjson":
+                    data = data.replace(b"\\\\", b"\\")
+                out.write(data)
+                size += len(data)
+    return size
+
+
+# ========== 匯入 ==========
+
+# 不合法的匯入檔；result 是目前為止的檢查結果（含前幾列的錯誤）
+class InvalidImport(ValueError):
+    def __init__(self, message: str, result: Optional[dict] = None):
+        super().__init__(message)
+        self.result = result or {"invalid": 0, "errors": []}
+
+
+def read_records(path: Path, fmt: str) -> Iterator[tuple[int, dict]]:
+    with path.open(encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            # 與 COPY 的 CSV 相同：空欄位是 NULL
+            for line, row in enumerate(csv.DictReader(f), start=2):
+                yield line, {k: (v if v != "" else None) for k, v in row.items()}
+        else:
+            for line, text in enumerate(f, start=1):
+                if text.strip():
+                    try:
+                        yield line, json.loads(text)
+                    except json.JSONDecodeError as e:
+                        raise InvalidImport(f"第 {line} 行不是合法的 JSON：{e}") from None
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _typed_select(table: Table) -> sql.Composable:
+    items = []
+    for col, typ in table.columns.items():
+        expr = sql.SQL("{}::{}").format(sql.Identifier(col), sql.SQL(typ))
+        if col in table.defaults:
+            expr = sql.SQL("COALESCE({}, {})").format(expr, sql.SQL(table.defaults[col]))
+        items.append(sql.SQL("{} AS {}").format(expr, sql.Identifier(col)))
+    return sql.SQL("SELECT line, {} FROM bulk_staging WHERE error IS NULL").format(sql.SQL(", ").join(items))
+
+
+async def _load(conn, table: Table, path: Path, fmt: str, raw: bool) -> tuple[int, set[str]]:
+    allowed = set(table.columns) - (set() if raw else set(table.raw_columns))
+    await conn.execute(
+        sql.SQL("CREATE TEMP TABLE bulk_staging (line BIGINT, error TEXT, {}) ON COMMIT DROP").format(
+            sql.SQL(", ").join(sql.SQL("{} TEXT").format(sql.Identifier(c)) for c in table.columns)
+        )
+    )
+    names = list(table.columns)
+    copy_sql = sql.SQL("COPY bulk_staging (line, {}) FROM STDIN").format(
+        sql.SQL(", ").join(map(sql.Identifier, names))
+    )
+    present: set[str] = set()
+    count = 0
+    async with conn.cursor() as cur:
+        async with cur.copy(copy_sql) as copy:
+            for line, record in read_records(path, fmt):
+                unknown = set(record) - allowed
+                if unknown:
+                    hint = "（只有 --raw 才能指定）" if unknown <= set(table.columns) else ""
+                    raise InvalidImport(f"第 {line} 行有不支援的欄位：{', '.join(sorted(unknown))}{hint}")
+                present.update(k for k, v in record.items() if v is not None)
+                await copy.write_row((line, *(_text(record.get(c)) for c in names)))
+                count += 1
+    missing = set(table.required) - present
+    if count and missing:
+        raise InvalidImport(f"缺少必要欄位：{', '.join(sorted(missing))}")
+    return count, present
+
+
+async def _validate(conn, table: Table, raw: bool) -> None:
+    # 1. 格式
+    formats = [
+        sql.SQL("WHEN {c} IS NOT NULL AND NOT pg_input_is_valid({c}, {t}) THEN {msg}").format(
+            c=sql.Identifier(col), t=sql.Literal(typ), msg=sql.Literal(f"{col} 格式錯誤")
+        )
+        for col, typ in table.columns.items()
+        if typ != "text"
+    ]
+    if formats:
+        await conn.execute(sql.SQL("UPDATE bulk_staging SET error = CASE {} END").format(sql.SQL(" ").join(formats)))
+
+    # 2. 內容（只看格式正確的列，欄位已轉型）
+    checks = [*table.checks, *(() if raw else table.new_only)]
+    cases = sql.SQL(" ").join(
+        sql.SQL("WHEN {} THEN {}").format(sql.SQL(cond), sql.Literal(msg)) for cond, msg in checks
+    )
+    dup = sql.SQL(f"count(*) OVER (PARTITION BY {table.unique})" if table.unique else "1")
+    await conn.execute(
+        sql.SQL(
+            """
+            UPDATE bulk_staging s SET error = v.error
+            FROM (
+                SELECT t.line, CASE {cases} END AS error
+                FROM (SELECT t.*, {dup} AS dup FROM ({typed}) t) t
+                {joins}
+            ) v
+            WHERE s.line = v.line AND v.error IS NOT NULL
+            """
+        ).format(cases=cases, dup=dup, typed=_typed_select(table), joins=sql.SQL(table.joins))
+    )
+
+
+async def _ensure_partitions(conn, table: Table) -> None:
+    col = EVENT_TIME_COLUMN.get(table.name)
+    if col is None:
+        return
+    await conn.execute(
+        sql.SQL(
+            """
+            SELECT job_events_create_partition(m)
+            FROM (SELECT DISTINCT (date_trunc('month', COALESCE({col}, NOW()) AT TIME ZONE 'UTC'))::date AS m
+                  FROM ({typed}) t) months
+            """
+        ).format(col=sql.Identifier(col), typed=_typed_select(table))
+    )
+
+
+async def _insert(conn, table: Table, present: set[str], raw: bool) -> tuple[int, int]:
+    # 有預設值的欄位一律寫入（COALESCE 後不會是 NULL）；只有 --raw 才能寫的欄位，一般匯入時由下面決定
+    writable = set(table.columns) - (set() if raw else set(table.raw_columns))
+    columns = [c for c in table.columns if c in writable and (c in present or c in table.defaults)]
+    targets = [sql.Identifier(c) for c in columns]
+    values = [sql.SQL("t.{}").format(sql.Identifier(c)) for c in columns]
+    if table.name == "jobs" and not raw:
+        # 狀態由建立事件決定，與 job_new 相同
+        targets.append(sql.Identifier("status"))
+        values.append(sql.SQL("CASE WHEN t.contractor_id IS NULL THEN 'pending' ELSE 'invited' END"))
+    insert = sql.SQL("INSERT INTO {} ({}) SELECT {} FROM ({}) t ORDER BY t.line").format(
+        sql.Identifier(table.name), sql.SQL(", ").join(targets), sql.SQL(", ").join(values), _typed_select(table)
+    )
+
+    if raw or table.events is None:
+        cur = await conn.execute(insert)
+        inserted, events = cur.rowcount, 0
+    else:
+        # 事件時間用寫入的 created_at（沒有指定時是 NOW()）
+        cur = await conn.execute(
+            sql.SQL("WITH inserted AS ({} RETURNING {}) {} RETURNING 1").format(
+                insert, sql.SQL(table.event_returning), sql.SQL(table.events)
+            )
+        )
+        events = cur.rowcount
+        inserted = events
+
+    if "id" in present:
+        await conn.execute(
+            sql.SQL("SELECT setval(pg_get_serial_sequence({t}, 'id'), GREATEST((SELECT MAX(id) FROM {i}), 1))").format(
+                t=sql.Literal(table.name), i=sql.Identifier(table.name)
+            )
+        )
+    return inserted, events
+
+
+async def import_file(
+    conn, table: Table, path: Path, fmt: str, raw: bool = False, skip_invalid: bool = False, dry_run: bool = False
+) -> dict:
+    if conn.info.server_version < MIN_SERVER_VERSION:
+        raise psycopg.NotSupportedError(
+            f"匯入的格式檢查需要 PostgreSQL 16 以上（pg_input_is_valid），目前是 {conn.info.server_version}"
+        )
+    result = {"rows": 0, "invalid": 0, "inserted": 0, "events": 0, "errors": []}
+    async with conn.transaction(force_rollback=dry_run):
+        result["rows"], present = await _load(conn, table, path, fmt, raw)
+        await _validate(conn, table, raw)
+
+        cur = await conn.execute("SELECT COUNT(*) FROM bulk_staging WHERE error IS NOT NULL")
+        (result["invalid"],) = await cur.fetchone()
+        cur = await conn.execute(
+            "SELECT line, error FROM bulk_staging WHERE error IS NOT NULL ORDER BY line LIMIT %s",
+            (MAX_REPORTED_ERRORS,),
+        )
+        result["errors"] = await cur.fetchall()
+        if result["invalid"] and not skip_invalid:
+            raise InvalidImport(f"{result['invalid']} 列不合法，全部不寫入（--skip-invalid 只略過不合法的列）", result)
+
+        await _ensure_partitions(conn, table)
+        result["inserted"], result["events"] = await _insert(conn, table, present, raw)
+    return result
+
+
+def print_errors(result: dict) -> None:
+    for line, error in result["errors"]:
+        print(f"  第 {line} 行：{error}")
+    if result["invalid"] > len(result["errors"]):
+        print(f"  ...共 {result['invalid']} 列")
+
+
+async def main(args) -> int:
+    table = TABLES[args.table]
+    async with await psycopg.AsyncConnection.connect(DATABASE_URL, autocommit=True) as conn:
+        start = time.perf_counter()
+        if args.command == "export":
+            fmt = detect_format(args.output, args.format)
+            if args.output is None:
+                size = await export(conn, table, sys.stdout.buffer, fmt)
+            else:
+                with args.output.open("wb") as out:
+                    size = await export(conn, table, out, fmt)
+            print(f"匯出 {table.name}：{size:,} bytes，{time.perf_counter() - start:.1f}s", file=sys.stderr)
+            return 0
+
+        fmt = detect_format(args.file, args.format)
+        try:
+            result = await import_file(conn, table, args.file, fmt, args.raw, args.skip_invalid, args.dry_run)
+        except InvalidImport as e:
+            print(f"匯入失敗：{e}")
+            print_errors(e.result)
+            return 1
+        except psycopg.Error as e:
+            print(f"匯入失敗：{e}")
+            return 1
+
+        elapsed = time.perf_counter() - start
+        print(f"{'（dry-run，未寫入）' if args.dry_run else ''}{table.name}：讀取 {result['rows']} 列，"
+              f"寫入 {result['inserted']} 列，產生事件 {result['events']} 筆，"
+              f"略過不合法 {result['invalid']} 列，{elapsed:.1f}s（{result['rows'] / max(elapsed, 1e-9):,.0f} 列/s）")
+        print_errors(result)
+        if args.raw and table.name in ("jobs", "bids"):
+            print("--raw 不會產生事件：事件一併匯入後請執行 python replay.py --dry-run 確認一致")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="大量匯入 / 匯出")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="匯出一張表")
+    p.add_argument("table", choices=TABLES)
+    p.add_argument("-o", "--output", type=Path, help="輸出檔（預設 stdout）")
+    p.add_argument("--format", choices=("csv", "ndjson"), help="預設依副檔名，.ndjson / .jsonl 以外都是 CSV")
+
+    p = sub.add_parser("import", help="匯入一個檔案")
+    p.add_argument("table", choices=TABLES)
+    p.add_argument("file", type=Path)
+    p.add_argument("--format", choices=("csv", "ndjson"), help="預設依副檔名，.ndjson / .jsonl 以外都是 CSV")
+    p.add_argument("--raw", action="store_true", help="依檔案內容寫入（含狀態等欄位），不產生事件")
+    p.add_argument("--skip-invalid", action="store_true", help="略過不合法的列，其餘照常寫入")
+    p.add_argument("--dry-run", action="store_true", help="只檢查，不寫入")
+
+    sys.exit(asyncio.run(main(parser.parse_args())))
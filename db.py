@@ -1,6 +1,18 @@
-from psycopg_pool import AsyncConnectionPool  # 使用 connection pool，匯入的不是psycopg單一連線，而是psycopg_pool連線池
+import asyncio
+import itertools
+import logging
+import os
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass, field
+
+import psycopg
+from fastapi import Request
+from psycopg_pool import AsyncConnectionPool, PoolTimeout  # 使用 connection pool，匯入的不是psycopg單一連線，而是psycopg_pool連線池
 # Async 這個字首代表是非同步，才能跟async def的FastAPI完美配合，不會卡住伺服器
 from psycopg.rows import dict_row             
+
+import tracing
 #是輔助工具，預設情況下，psycopg 查詢資料庫會元組 (tuple)，必須用 row[0], row[1] 這種方式存取資料。
 #dict_row 會讓查詢結果變成字典，方便用 row['id'], row['username'] 這種更直覺的方式存取。
 
@@ -20,21 +32,36 @@ DATABASE_URL = f"dbname={defaultDB} user={dbUser} password={dbPassword} host={db
 #None 表示一開始還沒建立。
 #| None = None: 一開始是 None。代表連線池並不是在程式一啟動時就建立，而是延遲建立 (Lazy Creation)。
 _pool: AsyncConnectionPool | None = None
+_pool_lock = asyncio.Lock()  # 避免同時有兩個地方第一次取用時各建一個 pool
+
+#取得連線池；背景工作（例如 rollup.py）不經過 FastAPI 時也用這個取得連線
+async def get_pool() -> AsyncConnectionPool:
+    global _pool
+    if _pool is not None:
+        return _pool
+    async with _pool_lock:
+        if _pool is None:
+            # lazy create, 等到 main.py 來呼叫時再啟用 _pool，好處是啟動伺服器時不會浪費連線資源。
+            pool = AsyncConnectionPool(
+                conninfo=DATABASE_URL,
+                kwargs={"row_factory": dict_row},  #把 dict_row 功能加進去的地方，讓這個池子所有的查詢預設都回傳字典。
+                open=False  # 不直接開啟
+            )
+            await pool.open()  #建立並開啟連線池。
+            _pool = pool
+    return _pool
+
 
 #取得 DB 連線物件
 #是整個檔案的核心，也是 main.py 中 Depends(getDB) 實際呼叫的地方。
 async def getDB():
-    global _pool
-    if _pool is None:
-        # lazy create, 等到 main.py 來呼叫時再啟用 _pool，好處是啟動伺服器時不會浪費連線資源。
-        _pool = AsyncConnectionPool(
-            conninfo=DATABASE_URL,
-            kwargs={"row_factory": dict_row},  #把 dict_row 功能加進去的地方，讓這個池子所有的查詢預設都回傳字典。
-            open=False  # 不直接開啟
-        )
-        await _pool.open()  #建立並開啟連線池。
+    pool = await get_pool()
     # 使用 with context manager，當結束時自動關閉連線
-    async with _pool.connection() as conn: #每當 FastAPI 執行一個請求、依賴 getDB 時，就會從連線池取一個連線，執行 SQL，自動歸還給池子，能避免連線洩漏
+    # （借連線等了多久會記錄成 tracing 的 pool.acquire span）
+    async with AsyncExitStack() as stack:
+        with tracing.span("pool.acquire", pool="primary"):
+            conn = await stack.enter_async_context(pool.connection())
+        #每當 FastAPI 執行一個請求、依賴 getDB 時，就會從連線池取一個連線，執行 SQL，自動歸還給池子，能避免連線洩漏
         #_pool.connection()：這行指令會向連線池要一個可用的資料庫連線。
         #async with ... as conn：是一個非同步上下文管理器，它做了兩件最重要的事：
         #進入時：成功從池子裡取得一個連線，並把它命名為 conn。
@@ -45,11 +72,133 @@ async def getDB():
         #API 函式執行完畢後（無論成功或失敗），getDB 會從 yield 的地方繼續，也就是 async with 區塊的結尾，這時連線就會自動被歸還。
         yield conn
 
+# ========== 唯讀副本（read replica） ==========
+# REPLICA_URLS 設定一或多個副本的連線字串（以 ; 分隔），沒設定時所有查詢都走主庫。
+# 只讀的 GET handler 改用 getReadDB，會輪流分到副本；以下情況改走主庫：
+#   1. 同一個 session 剛做過寫入（POST 等，見 main.py），PRIMARY_STICKY_SECONDS 秒內都讀主庫，
+#      避免 redirect 之後在副本上看不到自己剛寫入的資料
+#   2. 副本延遲超過 REPLICA_MAX_LAG_SECONDS，或連不上（每 REPLICA_CHECK_SECONDS 秒重新檢查一次）
+REPLICA_URLS = [u.strip() for u in os.environ.get("REPLICA_URLS", "").split(";") if u.strip()]
+PRIMARY_STICKY_SECONDS = 5.0
+REPLICA_MAX_LAG_SECONDS = 2.0
+REPLICA_CHECK_SECONDS = 5.0
+REPLICA_CONNECT_TIMEOUT = 2.0
+STICKY_SESSION_KEY = "primary_until"
+
+log = logging.getLogger(__name__)
+
+# 副本上「最後一筆已套用的交易」距今幾秒；WAL 都已套用完表示沒有延遲，
+# 與主庫斷線（沒有在 streaming）時就算收到的資料已套用完也視為延遲
+_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+         AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 'Infinity')
+END::float8 AS lag
+"""
+
+
+@dataclass
+class Replica:
+    pool: AsyncConnectionPool
+    lag: float = 0.0
+    healthy: bool = True  # 第一次檢查完成前先當作可用，連不上時由 mark_down 標記
+    checked_at: float = 0.0
+    # 背景檢查的 task：event loop 只保留 task 的弱參照，沒有存起來可能在執行途中被回收
+    _checking: asyncio.Task | None = field(default=None, repr=False)
+
+    # 距離上次檢查超過 REPLICA_CHECK_SECONDS 就在背景重新查詢延遲，request 本身不等檢查結果；
+    # 上一次檢查還沒結束（例如連線逾時中）就不再開新的
+    def usable(self) -> bool:
+        now = time.monotonic()
+        if now - self.checked_at >= REPLICA_CHECK_SECONDS and (self._checking is None or self._checking.done()):
+            self.checked_at = now
+            self._checking = asyncio.create_task(self._check())
+        return self.healthy
+
+    async def _check(self) -> None:
+        try:
+            async with self.pool.connection(timeout=REPLICA_CONNECT_TIMEOUT) as conn:
+                row = await (await conn.execute(_LAG_SQL)).fetchone()
+            self.lag = row["lag"]
+            self.healthy = self.lag <= REPLICA_MAX_LAG_SECONDS
+        except (PoolTimeout, psycopg.OperationalError):
+            self.healthy = False
+        except Exception:
+            # 預期外的錯誤（SQL、權限等）也當作不可用，並留下紀錄，不會變成沒人處理的 task 例外
+            log.exception("副本延遲檢查失敗：%s", self.pool.name)
+            self.healthy = False
+
+    def mark_down(self) -> None:
+        self.healthy = False
+        self.checked_at = time.monotonic()
+
+
+_replicas: list[Replica] | None = None
+_rotation = itertools.count()
+
+
+async def get_replicas() -> list[Replica]:
+    global _replicas
+    if _replicas is not None:
+        return _replicas
+    async with _pool_lock:
+        if _replicas is None:
+            replicas = []
+            for url in REPLICA_URLS:
+                pool = AsyncConnectionPool(conninfo=url, kwargs={"row_factory": dict_row}, open=False)
+                await pool.open(wait=False)  # 副本連不上不影響啟動，之後會被判定為不可用
+                replicas.append(Replica(pool))
+            _replicas = replicas
+    return _replicas
+
+
+# 寫入之後呼叫：這個 session 在接下來幾秒內的讀取都走主庫
+def stick_to_primary(session: dict) -> None:
+    session[STICKY_SESSION_KEY] = time.time() + PRIMARY_STICKY_SECONDS
+
+
+async def _read_connection(stack: AsyncExitStack, request: Request):
+    replicas = await get_replicas()
+    if replicas and request.session.get(STICKY_SESSION_KEY, 0) < time.time():
+        start = next(_rotation)
+        for i in range(len(replicas)):
+            replica = replicas[(start + i) % len(replicas)]
+            if not replica.usable():
+                continue
+            try:
+                with tracing.span("pool.acquire", pool="replica"):
+                    return await stack.enter_async_context(replica.pool.connection(timeout=REPLICA_CONNECT_TIMEOUT))
+            except (PoolTimeout, psycopg.OperationalError):
+                replica.mark_down()
+    pool = await get_pool()
+    with tracing.span("pool.acquire", pool="primary"):
+        return await stack.enter_async_context(pool.connection())
+
+
+#只讀的 handler 用這個取得連線：有可用的副本就分到副本，否則用主庫
+async def getReadDB(request: Request):
+    async with AsyncExitStack() as stack:
+        yield await _read_connection(stack, request)
+
+
+# 同 getReadDB，但不經過 Depends：StreamingResponse 的內容在 handler 回傳之後才產生，
+# 要在產生內容的過程中自己借連線（查完就歸還）
+@asynccontextmanager
+async def read_connection(request: Request):
+    async with AsyncExitStack() as stack:
+        yield await _read_connection(stack, request)
+
+
 # 關閉 Pool（優雅關機），當伺服器關閉時，自動釋放連線資源，避免資料庫殘留 session。
 async def close_pool():
-    global _pool
+    global _pool, _replicas
     if _pool is not None:
         await _pool.close()
         _pool = None
+    for replica in _replicas or []:
+        await replica.pool.close()
+    _replicas = None
 #if _pool is not None:：檢查連線池是否被建立過。
 #await _pool.close()：如果建立過，就呼叫 close()。這個指令會關閉池中所有的資料庫連線，並釋放資源。
@@ -1,3 +1,4 @@
+import os
 from typing import Dict
 
 from fastapi import Depends, HTTPException, Request
@@ -25,3 +26,13 @@ def require_role(expected_role: str):
         # 角色正確就回傳 user
         return user
     return dep
+
+
+# 內部診斷用的端點（快取統計等）只開放給管理者：ADMIN_USERS 環境變數，逗號分隔的帳號；沒設定時沒有人可以看
+ADMIN_USERS = {name.strip() for name in os.environ.get("ADMIN_USERS", "").split(",") if name.strip()}
+
+
+def require_admin(user=Depends(session_user)):
+    if user["username"] not in ADMIN_USERS:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return user
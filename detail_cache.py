@@ -0,0 +1,133 @@
+# 案件詳情（/job/{id}/detail）的快取
+#
+# 案件詳情只有在案件寫入新事件時才會改變（job_state.py 的每個狀態轉換、報價都會寫事件），
+# 所以快取與角色無關的部分（案件、依價格排序的全部報價、成果檔案版本、最近一次退件理由），
+# 以 job_detail_key 查到的 (version, 事件數, 最新事件 id) 當作版本：
+#   每個 request 先查 key（一條 index-only scan），與快取相同就直接用，不同才重新讀取；
+#   依角色篩選報價（委託人看全部 / 得標那筆、承包人只看自己的）在 routes_job 裡用記憶體完成。
+# 只比最新事件 id 不夠：同一個案件的報價可以同時進行，id 較小的事件可能比較晚 commit，
+# 所以另外比對事件數。
+#
+# 每個 process 各自一份，依最近使用（LRU）淘汰，總大小不超過 DETAIL_CACHE_MB。
+# 命中率等統計見 /stats/detail-cache（ADMIN_USERS 裡的管理者才能看）。
+import os
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass, fields, is_dataclass
+from typing import Optional
+
+import repo
+from models import BidRow, DetailKeyRow, JobDetailRow, RejectionRow, ResultFileRow
+
+MAX_BYTES = int(float(os.environ.get("DETAIL_CACHE_MB", "32")) * 1024 * 1024)
+# 單一案件超過總量的這個比例就不快取（報價特別多的案件不要把其他案件都擠掉）
+MAX_ENTRY_FRACTION = 0.1
+
+
+@dataclass(slots=True)
+class DetailEntry:
+    key: tuple[int, int, Optional[int]]
+    job: JobDetailRow
+    bids: list[BidRow]                    # 全部報價，依價格排序
+    result_files: list[ResultFileRow]
+    last_rejection: Optional[RejectionRow]
+    size: int = 0
+
+
+# 粗估佔用的記憶體：物件本身加上各欄位的值（字串佔大部分）
+def approx_size(obj) -> int:
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(approx_size(x) for x in obj)
+    if is_dataclass(obj):
+        return sys.getsizeof(obj) + sum(approx_size(getattr(obj, f.name)) for f in fields(obj))
+    return sys.getsizeof(obj)
+
+
+class DetailCache:
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[int, DetailEntry] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0        # 沒有快取
+        self.stale = 0         # 有快取但案件已經有新事件
+        self.evictions = 0
+        self.too_large = 0
+
+    def get(self, job_id: int, key: tuple) -> Optional[DetailEntry]:
+        entry = self.entries.get(job_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.key != key:
+            self.stale += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(job_id)
+        return entry
+
+    def put(self, job_id: int, entry: DetailEntry) -> None:
+        self.discard(job_id)
+        entry.size = approx_size(entry)
+        if entry.size > self.max_bytes * MAX_ENTRY_FRACTION:
+            self.too_large += 1
+            return
+        self.entries[job_id] = entry
+        self.bytes += entry.size
+        while self.bytes > self.max_bytes:
+            _, old = self.entries.popitem(last=False)
+            self.bytes -= old.size
+            self.evictions += 1
+
+    def discard(self, job_id: int) -> None:
+        old = self.entries.pop(job_id, None)
+        if old is not None:
+            self.bytes -= old.size
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.stale
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "too_large": self.too_large,
+        }
+
+
+cache = DetailCache()
+
+
+# 查 key → 命中就回傳快取，否則重新讀取並放進快取；案件不存在時回傳 None
+# （先查 key 再讀資料：讀到的資料只會比 key 新，之後 key 改變就會重新讀取，不會拿到舊資料）
+async def get_detail(conn, job_id: int) -> Optional[DetailEntry]:
+    row: Optional[DetailKeyRow] = await repo.fetchone(conn, "job_detail_key", job_id=job_id)
+    if row is None:
+        return None
+    key = (row.version, row.events, row.last_event_id)
+    entry = cache.get(job_id, key) if cache.max_bytes > 0 else None
+    if entry is not None:
+        return entry
+
+    job = await repo.fetchone(conn, "job_detail", job_id=job_id)
+    if job is None:
+        return None
+    bids = await repo.fetchall(conn, "job_bids", job_id=job_id)
+    result_files = await repo.fetchall(conn, "job_result_files", job_id=job_id)
+    last_rejection = None
+    if job.status == "rejected":
+        last_rejection = await repo.fetchone(
+            conn, "job_last_rejection", job_id=job_id, job_created_at=job.created_at
+        )
+    entry = DetailEntry(key, job, bids, result_files, last_rejection)
+    if cache.max_bytes > 0:
+        cache.put(job_id, entry)
+    return entry
@@ -0,0 +1,378 @@
+# 查詢計畫回歸檢查
+#
+# 把 repo.py 登錄的所有 SQL 收集起來，在本機另外建立的測試資料庫
+# （每個資料量各一個，跑完 migration 後用 generate_series 灌資料）執行
+# EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)，檢查：
+#   1. 大表（reltuples 超過門檻）上的 Seq Scan
+#   2. 估計列數與實際列數差太多（row estimate blowup）
+#   3. 跟 explain_baseline.json 比較，cost 變大超過容忍倍數
+# 1、2 的問題除非列在 ACCEPTED_FINDINGS（並寫明原因），一律算回歸；baseline 只記錄 cost，
+# --update-baseline 不會把新出現的問題當成已接受。
+# 寫入型的 SQL（INSERT / UPDATE）會在 transaction 裡執行後 rollback，不會留下資料。
+#
+# 用法：
+#   python explain_check.py                    檢查，有新問題或 cost 回歸時 exit code = 1（可直接當測試跑）
+#   python explain_check.py --update-baseline  重新產生 baseline
+#   python explain_check.py --scales 1000,50000
+import argparse
+import asyncio
+import fnmatch
+import json
+import re
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Optional
+
+import psycopg
+from psycopg.conninfo import make_conninfo
+
+from db import DATABASE_URL
+import job_state  # noqa: F401  登錄狀態轉換的 statement
+import rollup  # noqa: F401  登錄統計 rollup 的 statement
+import tasks  # noqa: F401  登錄背景工作佇列的 statement
+from migrate import migrate
+from repo import STATEMENTS
+
+ROOT = Path(__file__).resolve().parent
+BASELINE_FILE = ROOT / "explain_baseline.json"
+
+DEFAULT_SCALES = [1_000, 20_000]   # jobs 筆數
+SEQ_SCAN_MIN_ROWS = 5_000          # 超過這個列數的表不該被 Seq Scan
+BLOWUP_RATIO = 100                 # 估計 / 實際列數相差超過這個倍數就標記
+COST_TOLERANCE = 1.5               # cost 超過 baseline 的幾倍算回歸
+
+# 已知而且可以接受的問題：statement → {問題: 原因}，兩邊都可以用萬用字元，不分資料量。
+# 要加進來請寫清楚為什麼這個計畫在正式環境的資料量下也沒問題。
+_ROLLUP_BATCH = "測試資料只有幾千到幾萬個事件，一批（BATCH_SIZE = 5000）就涵蓋整個 partition"
+ACCEPTED_FINDINGS = {
+    "rollup:*": {
+        "seq_scan:job_events_*": _ROLLUP_BATCH + "，Seq Scan 是正確的計畫；正式環境一批只佔 partition 的一小段，會走 primary key",
+        "row_estimate:*": "整批事件 GROUP BY 後的列數無法從統計資料估計；背景工作，不影響 request",
+    },
+    "rollup:stats_contractors": {
+        "seq_scan:jobs": _ROLLUP_BATCH + "，一批事件對到的案件接近整張 jobs，hash join 比逐筆查 primary key 便宜；背景工作",
+    },
+    "rollup:contractor_profiles": {
+        "seq_scan:jobs": _ROLLUP_BATCH + "，一批事件對到的案件接近整張 jobs，hash join 比逐筆查 primary key 便宜；背景工作",
+    },
+    "contractor_recommend": {
+        "row_estimate:*": "全文檢索（@@ / ts_rank）的選擇度沒有統計資料可以估計；兩個候選來源各有 LIMIT，列數有上限",
+    },
+    "contractor_open_jobs": {
+        "row_estimate:BitmapOr:-": "due_date IS NULL OR due_date >= CURRENT_DATE 拆成兩段 index 條件，"
+                                   "IS NULL 那段實際是 0 筆，估計值最少 1 筆造成的倍數差，不影響計畫",
+    },
+}
+
+
+# ========== 收集 SQL ==========
+
+_PARAM = re.compile(r"%\((\w+)\)s")
+
+
+def collect_statements() -> list[dict]:
+    # 所有 SQL 都登錄在 repo.STATEMENTS，參數是具名的 %(name)s，用名稱決定樣本值
+    return [
+        {"id": stmt.name, "sql": stmt.sql, "params": sorted(set(_PARAM.findall(stmt.sql)))}
+        for stmt in STATEMENTS.values()
+    ]
+
+
+# ========== 測試資料 ==========
+
+SEED_SQL = """
+INSERT INTO users (username, password_hash, role)
+SELECT 'client_' || g, 'x', 'client' FROM generate_series(1, %(clients)s) g;
+
+INSERT INTO users (username, password_hash, role)
+SELECT 'contractor_' || g, 'x', 'contractor' FROM generate_series(1, %(contractors)s) g;
+
+-- 大部分案件已結案，只有少數還在 pending / 進行中，接近實際營運的分布
+INSERT INTO jobs (title, content, client_id, contractor_id, status, budget, due_date, created_at, updated_at)
+SELECT 'job ' || g, 'content of job ' || g,
+       1 + g %% %(clients)s,
+       CASE WHEN g %% 20 = 0 THEN NULL ELSE %(clients)s + 1 + g %% %(contractors)s END,
+       CASE g %% 20 WHEN 0 THEN 'pending' WHEN 1 THEN 'invited' WHEN 2 THEN 'accepted'
+                    WHEN 3 THEN 'uploaded' WHEN 4 THEN 'rejected' ELSE 'closed' END,
+       1000 + g %% 50000,
+       CURRENT_DATE + (g %% 60) - 30,
+       NOW() - make_interval(mins => %(jobs)s - g),
+       NOW() - make_interval(mins => %(jobs)s - g)
+FROM generate_series(1, %(jobs)s) g;
+
+INSERT INTO bids (job_id, contractor_id, price, note, proposal_file, proposal_original_name, created_at)
+SELECT j.id, %(clients)s + 1 + (j.id + k) %% %(contractors)s, 900 + (j.id * k) %% 60000,
+       'note', 'proposal_' || j.id || '_' || k || '.pdf', 'p.pdf', j.created_at + make_interval(mins => k)
+FROM jobs j, generate_series(0, 4) k
+WHERE j.status <> 'invited'
+ON CONFLICT (job_id, contractor_id) DO NOTHING;
+
+-- 灌進去的事件最早到 jobs 筆數分鐘以前，先把涵蓋的月份 partition 建好
+SELECT job_events_create_partition(m::date)
+FROM generate_series(date_trunc('month', NOW() - make_interval(mins => %(jobs)s)), NOW(), interval '1 month') m;
+
+INSERT INTO job_events (job_id, actor_id, event_type, message, description, created_at)
+SELECT id, client_id, 'JOB_CREATED', 'created', 'created', created_at FROM jobs;
+
+INSERT INTO job_events (job_id, actor_id, event_type, message, description, created_at)
+SELECT job_id, contractor_id, 'BID_SUBMITTED', 'bid', 'bid', created_at FROM bids;
+
+INSERT INTO job_events (job_id, actor_id, event_type, message, description, created_at)
+SELECT id, client_id, 'BID_SELECTED', 'selected', 'selected', created_at + interval '1 hour'
+FROM jobs WHERE status IN ('accepted', 'uploaded', 'rejected', 'closed');
+
+INSERT INTO job_result_files (job_id, contractor_id, version, file_path, original_name, uploaded_at)
+SELECT id, contractor_id, v, 'report_' || id || '_' || v || '.pdf', 'r.pdf', created_at + make_interval(hours => 1 + v)
+FROM jobs, generate_series(1, 2) v
+WHERE status IN ('uploaded', 'rejected', 'closed');
+
+INSERT INTO job_events (job_id, actor_id, event_type, message, description, created_at)
+SELECT id, client_id, 'JOB_REJECTED', 'rejected', 'rejected', created_at + interval '2 hours'
+FROM jobs WHERE status = 'rejected';
+
+INSERT INTO job_events (job_id, actor_id, event_type, message, description, created_at)
+SELECT id, client_id, 'JOB_CLOSED', 'closed', 'closed', created_at + interval '4 hours'
+FROM jobs WHERE status = 'closed';
+
+-- 承包人 profile 正式環境由 rollup 依事件累加，這裡直接從灌好的資料算出來
+INSERT INTO contractor_profiles (contractor_id, username, bids, bids_won, jobs_closed, jobs_rejected, priced, price_sum, document)
+SELECT u.id, u.username, COALESCE(b.n, 0), COALESCE(w.won, 0), COALESCE(w.closed, 0), COALESCE(w.rejected, 0),
+       COALESCE(b.n, 0), COALESCE(b.price_sum, 0), COALESCE(b.document, '')
+FROM users u
+LEFT JOIN (
+    SELECT b.contractor_id, COUNT(*) AS n, SUM(b.price) AS price_sum,
+           strip(to_tsvector('simple', string_agg(j.title || ' ' || j.content, ' '))) AS document
+    FROM bids b JOIN jobs j ON j.id = b.job_id
+    GROUP BY b.contractor_id
+) b ON b.contractor_id = u.id
+LEFT JOIN (
+    SELECT contractor_id,
+           COUNT(*) FILTER (WHERE status IN ('accepted', 'uploaded', 'rejected', 'closed')) AS won,
+           COUNT(*) FILTER (WHERE status = 'closed') AS closed,
+           COUNT(*) FILTER (WHERE status = 'rejected') AS rejected
+    FROM jobs WHERE contractor_id IS NOT NULL
+    GROUP BY contractor_id
+) w ON w.contractor_id = u.id
+WHERE u.role = 'contractor';
+"""
+
+# 代入 SQL 參數的樣本值，依變數名稱對應；id 類的值在灌完資料後從資料庫挑「資料最多」的那一筆
+SAMPLE_QUERIES = {
+    "job_id": "SELECT job_id FROM bids GROUP BY job_id ORDER BY COUNT(*) DESC, job_id LIMIT 1",
+    "bid_id": "SELECT MIN(id) FROM bids",
+    "contractor_id": "SELECT contractor_id FROM bids GROUP BY contractor_id ORDER BY COUNT(*) DESC, contractor_id LIMIT 1",
+    "client_id": "SELECT client_id FROM jobs GROUP BY client_id ORDER BY COUNT(*) DESC, client_id LIMIT 1",
+    "job_created_at": "SELECT created_at FROM jobs WHERE id = "
+                      "(SELECT job_id FROM bids GROUP BY job_id ORDER BY COUNT(*) DESC, job_id LIMIT 1)",
+}
+SAMPLE_ALIASES = {
+    "user_id": "client_id",
+    "actor_id": "client_id",
+}
+# 少數 statement 的 user_id 是承包人
+STATEMENT_ALIASES = {
+    "history_contractor": {"user_id": "contractor_id"},
+}
+SAMPLE_VALUES = {
+    "price": 1000,
+    "budget": 1000,
+    "version": 1,
+    "due_date": date.today(),
+    "role": "client",
+    "status": "pending",
+    "payload": "{}",
+    "job_version": 1,
+    "since": date.today() - timedelta(days=30),
+    "history_since": None,
+    "after": 0,
+    "upto": 5000,
+    "safe": 5000,
+    "fence": 5000,
+    "limit": 5000,
+    "name": "stats",
+    "event_type": "JOB_CREATED",
+    "text": "job 42 content",
+    "prefix": "contractor_1",
+    "prefix_end": "contractor_1\U0010ffff",
+    # 背景工作佇列（tasks.py）
+    "id": 1,
+    "ids": [1],
+    "kind": "rollup.refresh",
+    "kinds": ["rollup.refresh", "partitions.ensure"],
+    "slots": [1, 1],
+    "leases": [90.0, 90.0],
+    "priority": 0,
+    "delay": 0,
+    "max_attempts": 5,
+    "dedupe_key": None,
+    "worker": "explain-check",
+    "error": "explain-check",
+}
+
+
+def sample_value(statement_id: str, name: str, ids: dict):
+    name = STATEMENT_ALIASES.get(statement_id, {}).get(name) or SAMPLE_ALIASES.get(name, name)
+    if name in ids:
+        return ids[name]
+    if name in SAMPLE_VALUES:
+        return SAMPLE_VALUES[name]
+    return f"explain-check-{name}"
+
+
+async def prepare_database(admin_conninfo: str, dbname: str, scale: int) -> str:
+    async with await psycopg.AsyncConnection.connect(admin_conninfo, autocommit=True) as admin:
+        await admin.execute(f'DROP DATABASE IF EXISTS "{dbname}"')
+        await admin.execute(f'CREATE DATABASE "{dbname}"')
+
+    conninfo = make_conninfo(admin_conninfo, dbname=dbname)
+    await migrate(conninfo)
+    async with await psycopg.AsyncConnection.connect(conninfo, autocommit=True) as conn:
+        sizes = {"jobs": scale, "clients": max(10, scale // 10), "contractors": max(20, scale // 20)}
+        for statement in SEED_SQL.split(";\n"):
+            if statement.strip():
+                await conn.execute(statement, sizes)
+        await conn.execute("VACUUM ANALYZE")
+    return conninfo
+
+
+# ========== 分析計畫 ==========
+
+def walk_plan(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk_plan(child)
+
+
+def analyze_plan(plan: dict, table_rows: dict) -> tuple[list[str], dict]:
+    findings = []
+    root = plan["Plan"]
+    for node in walk_plan(root):
+        relation = node.get("Relation Name")
+        if node["Node Type"] == "Seq Scan" and table_rows.get(relation, 0) >= SEQ_SCAN_MIN_ROWS:
+            findings.append(f"seq_scan:{relation}")
+
+        if "Actual Rows" in node and node.get("Actual Loops", 0) > 0:
+            estimated = node["Plan Rows"] + 1
+            actual = node["Actual Rows"] + 1
+            if max(estimated, actual) / min(estimated, actual) >= BLOWUP_RATIO:
+                findings.append(f"row_estimate:{node['Node Type']}:{relation or '-'}")
+
+    metrics = {
+        "cost": root["Total Cost"],
+        "buffers": root.get("Shared Hit Blocks", 0) + root.get("Shared Read Blocks", 0),
+        "time_ms": round(plan.get("Execution Time", 0.0), 3),
+    }
+    return sorted(set(findings)), metrics
+
+
+async def explain_all(conninfo: str, statements: list[dict]) -> dict:
+    results = {}
+    async with await psycopg.AsyncConnection.connect(conninfo) as conn:
+        cur = await conn.execute("SELECT relname, reltuples::bigint FROM pg_class WHERE relkind IN ('r', 'p')")
+        table_rows = dict(await cur.fetchall())
+
+        ids = {}
+        for name, query in SAMPLE_QUERIES.items():
+            cur = await conn.execute(query)
+            ids[name] = (await cur.fetchone())[0]
+        await conn.rollback()
+
+        for stmt in statements:
+            params = {name: sample_value(stmt["id"], name, ids) for name in stmt["params"]}
+            try:
+                cur = await conn.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + stmt["sql"], params)
+                (plan,) = (await cur.fetchone())[0]
+                findings, metrics = analyze_plan(plan, table_rows)
+                results[stmt["id"]] = {"findings": findings, **metrics}
+            except psycopg.Error as e:
+                results[stmt["id"]] = {"error": str(e).splitlines()[0]}
+            finally:
+                # 寫入型 SQL 也真的執行過了，一律 rollback
+                await conn.rollback()
+    return results
+
+
+# ========== 與 baseline 比較 ==========
+
+# 已接受的問題回傳原因，否則回傳 None；key 是 "資料量/statement"
+def accepted_reason(key: str, finding: str) -> Optional[str]:
+    statement_id = key.partition("/")[2]
+    for stmt_pattern, findings in ACCEPTED_FINDINGS.items():
+        if not fnmatch.fnmatchcase(statement_id, stmt_pattern):
+            continue
+        for pattern, reason in findings.items():
+            if fnmatch.fnmatchcase(finding, pattern):
+                return reason
+    return None
+
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    regressions = []
+    for key, res in results.items():
+        base = baseline.get(key)
+        if "error" in res:
+            regressions.append(f"{key}: 執行失敗 {res['error']}")
+            continue
+        for finding in res["findings"]:
+            if accepted_reason(key, finding) is None:
+                regressions.append(f"{key}: {finding}")
+        if base is None:
+            regressions.append(f"{key}: baseline 沒有這個 statement（請用 --update-baseline 更新）")
+            continue
+        if res["cost"] > base["cost"] * COST_TOLERANCE:
+            regressions.append(f"{key}: cost {base['cost']} -> {res['cost']}")
+    return regressions
+
+
+async def run_check(scales: list[int] = DEFAULT_SCALES, admin_conninfo: str = DATABASE_URL,
+                    keep: bool = False) -> dict:
+    statements = collect_statements()
+    results = {}
+    for scale in scales:
+        dbname = f"explain_check_{scale}"
+        conninfo = await prepare_database(make_conninfo(admin_conninfo, dbname="postgres"), dbname, scale)
+        try:
+            for key, res in (await explain_all(conninfo, statements)).items():
+                results[f"{scale}/{key}"] = res
+        finally:
+            if not keep:
+                async with await psycopg.AsyncConnection.connect(
+                    make_conninfo(admin_conninfo, dbname="postgres"), autocommit=True
+                ) as admin:
+                    await admin.execute(f'DROP DATABASE IF EXISTS "{dbname}"')
+    return results
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="EXPLAIN 所有 router 裡的 SQL 並檢查計畫回歸")
+    parser.add_argument("--scales", default=",".join(map(str, DEFAULT_SCALES)))
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--keep", action="store_true", help="保留測試資料庫，方便手動查看")
+    args = parser.parse_args(argv)
+
+    scales = [int(s) for s in args.scales.split(",") if s]
+    results = asyncio.run(run_check(scales, keep=args.keep))
+
+    for key, res in results.items():
+        for finding in res.get("findings", []):
+            print(f"{key}: {finding}" + ("（已接受，見 ACCEPTED_FINDINGS）" if accepted_reason(key, finding) else ""))
+
+    if args.update_baseline:
+        # baseline 只記錄 cost 等數字；問題是否可以接受只看 ACCEPTED_FINDINGS
+        costs = {key: {k: v for k, v in res.items() if k != "findings"} for key, res in results.items()}
+        BASELINE_FILE.write_text(json.dumps(costs, indent=2, ensure_ascii=False, sort_keys=True) + "\n",
+                                 encoding="utf-8")
+        print(f"已更新 {BASELINE_FILE.name}（{len(results)} 筆）")
+        return 0
+
+    baseline = json.loads(BASELINE_FILE.read_text(encoding="utf-8")) if BASELINE_FILE.exists() else {}
+    regressions = compare(results, baseline)
+    for line in regressions:
+        print("REGRESSION " + line)
+    print(f"檢查 {len(results)} 筆，回歸 {len(regressions)} 筆")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,42 @@
+# JSON 序列化（給 responses.FastJSONResponse 與 tracing 的輸出共用）
+#
+# 由 orjson 直接序列化 models.py 的 slots dataclass 與 date / datetime；
+# 沒裝 orjson 時退回標準 json（較慢，但輸出相同）。
+# 獨立成一個模組，responses 與 tracing 都只 import 這裡，彼此不互相 import。
+import dataclasses
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 依環境而定
+    orjson = None
+
+
+def _decimal(obj: Decimal):
+    # 與 FastAPI 的 jsonable_encoder 一致：整數值輸出 int，其餘輸出 float
+    return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+
+
+def _orjson_default(obj: Any):
+    if isinstance(obj, Decimal):
+        return _decimal(obj)
+    raise TypeError(f"無法序列化 {type(obj).__name__}")
+
+
+def _json_default(obj: Any):
+    if dataclasses.is_dataclass(obj):
+        return {f.name: getattr(obj, f.name) for f in dataclasses.fields(obj)}
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return _decimal(obj)
+    raise TypeError(f"無法序列化 {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,198 @@
+# 案件狀態機
+#
+# 案件狀態只能透過這裡改變：
+#   pending ──BID_SELECTED──> accepted ──REPORT_UPLOADED──> uploaded ──JOB_CLOSED──> closed
+#   invited ──INVITE_ACCEPTED──> accepted                   uploaded ──JOB_REJECTED──> rejected
+#   invited ──INVITE_DECLINED──> pending                    rejected ──REPORT_RE_UPLOADED──> uploaded
+# job_events 是唯一的事實來源，jobs 的 status / contractor_id / report_file
+# 只是由事件推導出來的 projection。每個轉換都是「一條 SQL」：
+#   條件式 UPDATE jobs（狀態與 guard 不符就 0 筆，成功時 version + 1）→ 只有更新成功時才 INSERT job_events。
+# 因此不合法的轉換不會留下事件，事件與 projection 也不會不一致。
+# 整批重建 projection 請用 replay.py。
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from fastapi import HTTPException
+from psycopg.types.json import Jsonb
+
+import repo
+from models import IdRow
+
+
+class InvalidTransition(HTTPException):
+    def __init__(self, event_type: str, job_id: int):
+        super().__init__(status_code=409, detail=f"案件 #{job_id} 目前的狀態不允許 {event_type}")
+
+
+@dataclass(frozen=True)
+class Transition:
+    from_states: tuple[str, ...]
+    to_state: Optional[str]        # None：狀態不變，只檢查條件並鎖住案件（例如投標）
+    guard: str = ""                # 額外條件，可使用 jobs 欄位與具名參數
+    sets: str = ""                 # 額外要更新的 projection 欄位
+    also: str = ""                 # 額外的 CTE（可引用 target）
+    lock: str = "FOR UPDATE"       # to_state 為 None 時鎖住案件的方式
+    payload: str = "%(payload)s"   # 寫進事件的 payload（可引用 also 裡的 CTE）
+
+
+# 建立案件的事件 → 初始狀態
+CREATIONS = {
+    "JOB_CREATED": "pending",
+    "JOB_INVITED": "invited",
+}
+
+# 成果檔案：版本號在 target 鎖住案件之後才計算，與狀態、事件在同一條 SQL 寫入；
+# job_result_files (job_id, version) 是 unique，萬一仍然算出重複的版本號，整條 SQL 失敗，不會留下兩個同版本的檔案
+_STORE_RESULT_FILE = """
+        stored AS (
+            INSERT INTO job_result_files (job_id, contractor_id, version, file_path, original_name)
+            SELECT target.id, %(actor_id)s,
+                   (SELECT COALESCE(MAX(f.version), 0) + 1 FROM job_result_files f WHERE f.job_id = target.id),
+                   %(report_file)s, %(original_name)s
+            FROM target
+            RETURNING version
+        ),"""
+_STORED_VERSION = "%(payload)s || jsonb_build_object('version', (SELECT version FROM stored))"
+
+# 報價：寫入 / 更新報價，與事件在同一條 SQL。
+# 報價數沒有另外的計數器（同時第一次報價的人會排隊等那一列的鎖），列表直接數 bids（見 repo.py）。
+_UPSERT_BID = """
+        upserted AS (
+            INSERT INTO bids (job_id, contractor_id, price, note, proposal_file, proposal_original_name)
+            SELECT id, %(actor_id)s, %(price)s, %(note)s, %(proposal_file)s, %(proposal_original_name)s FROM target
+            ON CONFLICT (job_id, contractor_id)
+            DO UPDATE SET
+                price = EXCLUDED.price,
+                note = EXCLUDED.note,
+                proposal_file = EXCLUDED.proposal_file,
+                proposal_original_name = EXCLUDED.proposal_original_name
+            RETURNING job_id, (xmax = 0) AS inserted
+        ),"""
+
+TRANSITIONS = {
+    # 報價不改狀態，但仍以 FOR SHARE 鎖住案件。不上鎖時條件是用語句開始時的快照判斷，
+    # 與還沒 commit 的選標（BID_SELECTED）同時執行會看到 pending 而寫入，選標後仍多出一筆報價；
+    # 上鎖時會等選標結束，再用最新的一列重新檢查條件（此時已不是 pending、版本號也變了）而失敗。
+    # 共享鎖之間互不衝突，報價彼此不等待；代價是多人同時報價時會產生 MultiXact。
+    # job_version 是表單讀到的版本號（必填），案件之後被改過就不接受
+    "BID_SUBMITTED": Transition(
+        ("pending",), None,
+        guard="""client_id <> %(actor_id)s AND (due_date IS NULL OR due_date >= CURRENT_DATE)
+            AND version = %(job_version)s::int""",
+        lock="FOR SHARE",
+        also=_UPSERT_BID,
+        payload="%(payload)s || jsonb_build_object('new_bid', (SELECT inserted FROM upserted))",
+    ),
+    # 選中的報價在鎖住之後仍須存在且價格未被改過（選標前的查詢沒有上鎖）
+    "BID_SELECTED": Transition(
+        ("pending",), "accepted",
+        guard="""client_id = %(actor_id)s AND (due_date IS NULL OR due_date <= CURRENT_DATE)
+            AND EXISTS (SELECT 1 FROM bids b WHERE b.id = %(bid_id)s AND b.job_id = jobs.id
+                        AND b.contractor_id = %(contractor_id)s AND b.price = %(price)s)""",
+        sets="contractor_id = %(contractor_id)s",
+    ),
+    "INVITE_ACCEPTED": Transition(("invited",), "accepted", guard="contractor_id = %(actor_id)s"),
+    "INVITE_DECLINED": Transition(
+        ("invited",), "pending", guard="contractor_id = %(actor_id)s", sets="contractor_id = NULL"
+    ),
+    # 第一次上傳一定是從 accepted，之後被退件才會是 rejected；版本紀錄與狀態一起寫入
+    "REPORT_UPLOADED": Transition(
+        ("accepted",), "uploaded",
+        guard="contractor_id = %(actor_id)s", sets="report_file = %(report_file)s",
+        also=_STORE_RESULT_FILE, payload=_STORED_VERSION,
+    ),
+    "REPORT_RE_UPLOADED": Transition(
+        ("rejected",), "uploaded",
+        guard="contractor_id = %(actor_id)s", sets="report_file = %(report_file)s",
+        also=_STORE_RESULT_FILE, payload=_STORED_VERSION,
+    ),
+    "JOB_REJECTED": Transition(("uploaded",), "rejected", guard="client_id = %(actor_id)s"),
+    "JOB_CLOSED": Transition(("uploaded",), "closed", guard="client_id = %(actor_id)s"),
+}
+
+
+def _transition_sql(event_type: str, t: Transition) -> str:
+    states = ", ".join(f"'{s}'" for s in t.from_states)
+    where = f"id = %(job_id)s AND status IN ({states})" + (f" AND {t.guard}" if t.guard else "")
+    if t.to_state is None:
+        target = f"SELECT id FROM jobs WHERE {where} {t.lock}"
+    else:
+        sets = f"status = '{t.to_state}', version = version + 1, updated_at = NOW()" + (f", {t.sets}" if t.sets else "")
+        target = f"UPDATE jobs SET {sets} WHERE {where} RETURNING id"
+    return f"""
+    WITH target AS (
+        {target}
+    ),{t.also}
+    appended AS (
+        INSERT INTO job_events (job_id, actor_id, event_type, message, description, payload)
+        SELECT id, %(actor_id)s, '{event_type}', %(message)s, %(description)s, {t.payload} FROM target
+        RETURNING id
+    )
+    SELECT id FROM appended
+    """
+
+
+for _event_type, _t in TRANSITIONS.items():
+    repo.statement(f"event:{_event_type}", _transition_sql(_event_type, _t), IdRow)
+
+repo.statement(
+    "event:create_job",
+    """
+    WITH created AS (
+        INSERT INTO jobs (title, content, client_id, status, budget, due_date, contractor_id)
+        VALUES (%(title)s, %(content)s, %(client_id)s, %(status)s, %(budget)s, %(due_date)s, %(contractor_id)s)
+        RETURNING id
+    ),
+    appended AS (
+        INSERT INTO job_events (job_id, actor_id, event_type, message, description, payload)
+        SELECT id, %(client_id)s, %(event_type)s, %(message)s, %(description)s, %(payload)s FROM created
+    )
+    SELECT id FROM created
+    """,
+    IdRow,
+)
+
+
+async def create_job(
+    conn,
+    event_type: str,
+    *,
+    title: str,
+    content: str,
+    client_id: int,
+    budget: Optional[int],
+    due_date,
+    contractor_id: Optional[int],
+    message: str,
+    description: str,
+) -> int:
+    row = await repo.fetchone(
+        conn, "event:create_job",
+        title=title, content=content, client_id=client_id, status=CREATIONS[event_type],
+        budget=budget, due_date=due_date, contractor_id=contractor_id,
+        event_type=event_type, message=message, description=description,
+        payload=Jsonb({"contractor_id": contractor_id} if contractor_id else {}),
+    )
+    return row.id
+
+
+# 套用一個狀態轉換，回傳新事件的 id；狀態或條件不符時丟出 InvalidTransition（409）
+# payload 的欄位同時作為 SQL 參數（contractor_id、report_file、price ...）並存進事件
+async def apply(
+    conn,
+    event_type: str,
+    *,
+    job_id: int,
+    actor_id: int,
+    message: str,
+    description: str,
+    **payload: Any,
+) -> int:
+    row = await repo.fetchone(
+        conn, f"event:{event_type}",
+        job_id=job_id, actor_id=actor_id, message=message, description=description,
+        payload=Jsonb(payload), **payload,
+    )
+    if row is None:
+        raise InvalidTransition(event_type, job_id)
+    return row.id
@@ -1,3 +1,11 @@
+import time
+
+# 行程開始 import main 的時間點，啟動分析（STARTUP_PROFILE=1）用來算 import 與第一個 request 花了多久
+_IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+import logging
+import os
 from pathlib import Path
 
 from fastapi import FastAPI, Request
@@ -5,70 +13,202 @@ from fastapi.responses import RedirectResponse, Response
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 
-from deps import session_user
-from routes_auth import router as auth_router
-from routes_client import router as client_router
-from routes_contractor import router as contractor_router
-from routes_job import router as job_router
-
-
-app = FastAPI()
-
-
-# ========== 全域防快取 ==========
-@app.middleware("http")
-async def add_no_cache_header(request: Request, call_next):
-    response: Response = await call_next(request)
-
-    if not request.url.path.startswith(("/static", "/uploads", "/favicon.ico")):
-        response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
-    return response
-
-
-# ========== Session ==========
-app.add_middleware(
-    SessionMiddleware,
-    secret_key="mysecretkey",
-    same_site="lax",
-    https_only=False,
-)
-
-
-# ========== 首頁導向 ==========
-@app.get("/")
-async def index(request: Request):
-    uid = request.session.get("user_id")
-    role = request.session.get("role")
-    if not uid:
-        return RedirectResponse(url="/loginForm.html", status_code=302)
-    return RedirectResponse(url="/clientJobs.html" if role == "client" else "/contractorMyJobs.html", status_code=302)
-
-
-# ========== 掛載各個 router ==========
-app.include_router(auth_router)
-app.include_router(client_router)
-app.include_router(contractor_router)
-app.include_router(job_router)
-
+import tracing
+from db import close_pool, stick_to_primary
+from responses import FastJSONResponse
+
+log = logging.getLogger(__name__)
+
+WARMUP_RETRY_SECONDS = 2.0
+READ_ONLY_POSTS = frozenset({"/contractors/recommend"})
+
+
+def _ms(since: float) -> float:
+    return round((time.perf_counter() - since) * 1000, 1)
+
+
+# 啟動後在背景執行：預熱 → 回報 ready → （有開啟時）才啟動背景工作 worker（rollup / partition 維護等，見 tasks.py），
+# 避免背景工作在預熱期間搶連線。資料庫暫時連不上時每隔幾秒重試，期間 /ready 維持 503。
+# worker 預設不在 app 裡執行：正式環境用 python -m tasks 另外啟動（可以單獨調整數量，不佔 web 的連線池）；
+# 單機開發不想另開行程時設定 BACKGROUND_TASKS=1 在 app 裡一起執行。
+async def _warm_then_start(app: FastAPI, prewarm: bool, background: bool) -> None:
+    import warmup
+
+    startup = app.state.startup
+    while prewarm:
+        try:
+            startup["warmup"] = await warmup.prewarm(app)
+            break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            startup["error"] = str(e)
+            log.warning("預熱失敗，%s 秒後重試", WARMUP_RETRY_SECONDS, exc_info=True)
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+    startup.pop("error", None)
+    startup["ready_ms"] = _ms(_IMPORT_STARTED)
+    app.state.ready = True
+    if app.state.profile:
+        print(f"[startup] ready：啟動後 {startup['ready_ms']} ms，預熱 {startup.get('warmup')}")
+
+    if background:
+        import tasks
+
+        app.state.background_tasks = [asyncio.create_task(tasks.Worker().run())]
+
+
+def create_app(
+    *,
+    prewarm: bool = os.environ.get("PREWARM", "1") != "0",
+    background: bool = os.environ.get("BACKGROUND_TASKS", "0") == "1",
+    check_schema: bool = os.environ.get("SKIP_SCHEMA_CHECK") != "1",
+    profile: bool = os.environ.get("STARTUP_PROFILE") == "1",
+    server_render: bool = os.environ.get("SERVER_RENDER") == "1",
+) -> FastAPI:
+    created = time.perf_counter()
+    app = FastAPI()
+    app.state.ready = False
+    app.state.profile = profile
+    app.state.background_tasks = []
+    app.state.startup = {"import_ms": round((created - _IMPORT_STARTED) * 1000, 1), "first_request_ms": None}
+
+    # ========== 全域防快取 ==========
+    @app.middleware("http")
+    async def add_no_cache_header(request: Request, call_next):
+        response: Response = await call_next(request)
+
+        if not request.url.path.startswith(("/static", "/uploads", "/favicon.ico")):
+            response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+            response.headers["Pragma"] = "no-cache"
+            response.headers["Expires"] = "0"
+        return response
+
+    # ========== 寫入後暫時只讀主庫 ==========
+    # 寫入成功（含 302 redirect）後，同一個 session 接下來幾秒的 getReadDB 都走主庫，
+    # 避免副本還沒追上時看不到自己剛寫入的資料。必須在 SessionMiddleware 內層才拿得到 session。
+    # READ_ONLY_POSTS 是只因為 body 太長才用 POST 的查詢，不算寫入。
+    @app.middleware("http")
+    async def read_your_writes(request: Request, call_next):
+        response: Response = await call_next(request)
+        if (
+            request.method not in ("GET", "HEAD", "OPTIONS")
+            and request.url.path not in READ_ONLY_POSTS
+            and response.status_code < 400
+        ):
+            stick_to_primary(request.session)
+        return response
+
+    # ========== 啟動分析：第一個 request ==========
+    if profile:
+        @app.middleware("http")
+        async def first_request(request: Request, call_next):
+            startup = app.state.startup
+            if startup["first_request_ms"] is not None:
+                return await call_next(request)
+            start = time.perf_counter()
+            response: Response = await call_next(request)
+            startup["first_request_ms"] = _ms(start)
+            startup["first_request_at_ms"] = _ms(_IMPORT_STARTED)
+            print(
+                f"[startup] 第一個 request {request.method} {request.url.path}：{startup['first_request_ms']} ms，"
+                f"距離 import main {startup['first_request_at_ms']} ms"
+            )
+            return response
+
+    # ========== Session ==========
+    app.add_middleware(
+        SessionMiddleware,
+        secret_key="mysecretkey",
+        same_site="lax",
+        https_only=False,
+    )
+
+    # ========== request ID / tracing（最外層，見 tracing.py） ==========
+    app.add_middleware(tracing.TracingMiddleware)
+
+    # ========== 首頁導向 ==========
+    @app.get("/")
+    async def index(request: Request):
+        uid = request.session.get("user_id")
+        role = request.session.get("role")
+        if not uid:
+            return RedirectResponse(url="/loginForm.html", status_code=302)
+        return RedirectResponse(url="/clientJobs.html" if role == "client" else "/contractorMyJobs.html", status_code=302)
+
+    # ========== readiness（給負載平衡 / autoscaling 的健康檢查） ==========
+    # 預熱完成前回傳 503，不必等預熱的 liveness 檢查直接打任何頁面即可
+    @app.get("/ready")
+    async def ready():
+        return FastJSONResponse(
+            {"ready": app.state.ready, "startup": app.state.startup},
+            status_code=200 if app.state.ready else 503,
+        )
+
+    # ========== 掛載各個 router ==========
+    # router（連同 repo、job_state 等相依模組）在建立 app 時才 import，import main 本身只載入框架
+    from routes_auth import router as auth_router
+    from routes_bootstrap import router as bootstrap_router
+    from routes_client import router as client_router
+    from routes_contractor import router as contractor_router
+    from routes_job import router as job_router
+    from routes_stats import router as stats_router
+
+    app.include_router(auth_router)
+    app.include_router(client_router)
+    app.include_router(contractor_router)
+    app.include_router(job_router)
+    app.include_router(stats_router)
+    app.include_router(bootstrap_router)
+
+    # ========== 伺服器端渲染的列表頁（見 pages.py），要在靜態檔案之前掛上才會優先比對 ==========
+    if server_render:
+        from routes_pages import router as pages_router
+
+        app.include_router(pages_router)
+
+    # ========== 靜態檔案 ==========
+    uploads_dir = Path("uploads")
+    uploads_dir.mkdir(exist_ok=True)
+    app.mount("/uploads", StaticFiles(directory=uploads_dir), name="uploads")
+
+    static_dir = Path("www")
+    static_dir.mkdir(exist_ok=True)
+    app.mount("/", StaticFiles(directory=str(static_dir)), name="static")
+
+    # ========== 啟動 ==========
+    # 缺 migration（例如少了熱門查詢要用的索引）就直接拒絕啟動，請先執行 python migrate.py；
+    # 之後的預熱與背景工作不擋住啟動，完成與否看 /ready
+    @app.on_event("startup")
+    async def _startup():
+        if check_schema:
+            from migrate import ensure_current
+
+            await ensure_current()
+        app.state.warmup_task = asyncio.create_task(_warm_then_start(app, prewarm, background))
+
+    # ========== 關機：停止背景工作、關閉連線池 ==========
+    # 等背景工作真的結束（worker 會把做到一半的工作放回佇列）才關閉連線池
+    @app.on_event("shutdown")
+    async def _shutdown():
+        running = [t for t in [getattr(app.state, "warmup_task", None), *app.state.background_tasks] if t is not None]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        await close_pool()
 
-# ========== 靜態檔案 ==========
-uploads_dir = Path("uploads")
-uploads_dir.mkdir(exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=uploads_dir), name="uploads")
+    app.state.startup["create_ms"] = _ms(created)
+    return app
 
-static_dir = Path("www")
-static_dir.mkdir(exist_ok=True)
-app.mount("/", StaticFiles(directory=str(static_dir)), name="static")
 
+_app = None
 
-# ========== 關閉連線池 ==========
-try:
-    from db import close_pool
 
-    @app.on_event("shutdown")
-    async def _shutdown():
-        await close_pool()
-except Exception:
-    pass
+# uvicorn main:app 第一次讀取 main.app 時才建立（只建立一次）；
+# uvicorn main:create_app --factory 不會讀 main.app，不會多建一個 app
+def __getattr__(name: str):
+    global _app
+    if name != "app":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _app is None:
+        _app = create_app()
+    return _app
@@ -0,0 +1,188 @@
+# 資料庫 schema 版本管理（migration runner）
+#
+# migrations/ 底下每個檔案是一個版本：NNNN_說明.sql，依編號順序套用，
+# 套用過的版本記錄在 schema_migrations 表。
+# 檔案第一行若是 "-- migrate:no-transaction"，會逐條 statement 在 autocommit 下執行
+# （CREATE INDEX CONCURRENTLY 不能放在 transaction 裡）。
+# no-transaction 檔案裡 "-- migrate:each-partition 表名" 之後的 statement 會對那張 partitioned table 的
+# 每個 partition 各執行一次，{partition} 換成 partition 名稱（partitioned table 不能直接 CONCURRENTLY 建索引，
+# 要先 ON ONLY 建在母表上，再逐個 partition 建好後 ATTACH）。
+#
+# 用法：
+#   python migrate.py          套用所有尚未執行的版本
+#   python migrate.py --check  只檢查 schema 是否為最新，不是的話 exit code = 1
+import asyncio
+import re
+import sys
+from pathlib import Path
+
+import psycopg
+
+from db import DATABASE_URL
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+NO_TRANSACTION = "-- migrate:no-transaction"
+EACH_PARTITION = re.compile(r"^--\s*migrate:each-partition\s+(\w+)\s*$", re.MULTILINE)
+
+# 避免兩個程序同時跑 migration（任意固定的數字即可）
+LOCK_KEY = 20251026
+
+_INDEX_NAME = re.compile(r"INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.IGNORECASE)
+
+
+class SchemaOutdated(RuntimeError):
+    pass
+
+
+def load_migrations() -> list[tuple[int, str, Path]]:
+    items = []
+    for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        num, _, name = path.stem.partition("_")
+        if not num.isdigit():
+            continue
+        items.append((int(num), name, path))
+    return items
+
+
+def split_statements(sql: str) -> list[str]:
+    # no-transaction 檔案只放簡單的 DDL，以行尾的分號切開即可
+    statements, buf = [], []
+    for line in sql.splitlines():
+        if line.strip().startswith("--") and not buf:
+            continue
+        buf.append(line)
+        if line.rstrip().endswith(";"):
+            statements.append("\n".join(buf).strip())
+            buf = []
+    if "".join(buf).strip():
+        statements.append("\n".join(buf).strip())
+    return statements
+
+
+async def _ensure_table(conn) -> None:
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version    INT PRIMARY KEY,
+            name       TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """
+    )
+
+
+async def applied_versions(conn) -> set[int]:
+    cur = await conn.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    (exists,) = await cur.fetchone()
+    if not exists:
+        return set()
+    cur = await conn.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in await cur.fetchall()}
+
+
+async def _drop_invalid_index(conn, statement: str) -> None:
+    # CONCURRENTLY 建到一半失敗會留下 INVALID 的索引，IF NOT EXISTS 會直接跳過它，
+    # 所以重跑前先把壞掉的索引清掉。
+    m = _INDEX_NAME.search(statement)
+    if not m:
+        return
+    cur = await conn.execute(
+        """
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND NOT i.indisvalid
+        """,
+        (m.group(1),),
+    )
+    if await cur.fetchone():
+        await conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{m.group(1)}"')
+
+
+async def _partitions(conn, parent: str) -> list[str]:
+    cur = await conn.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+        ORDER BY c.relname
+        """,
+        (parent,),
+    )
+    return [row[0] for row in await cur.fetchall()]
+
+
+async def _run_no_transaction(conn, sql: str) -> None:
+    m = EACH_PARTITION.search(sql)
+    head, per_partition = (sql[:m.start()], sql[m.end():]) if m else (sql, "")
+    statements = split_statements(head)
+    if m:
+        for partition in await _partitions(conn, m.group(1)):
+            statements += [s.replace("{partition}", partition) for s in split_statements(per_partition)]
+    for statement in statements:
+        await _drop_invalid_index(conn, statement)
+        await conn.execute(statement)
+
+
+async def _apply(conn, version: int, name: str, path: Path) -> None:
+    sql = path.read_text(encoding="utf-8")
+    if sql.lstrip().startswith(NO_TRANSACTION):
+        await _run_no_transaction(conn, sql)
+        await conn.execute(
+            "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name)
+        )
+    else:
+        async with conn.transaction():
+            await conn.execute(sql)
+            await conn.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name)
+            )
+
+
+async def migrate(conninfo: str = DATABASE_URL) -> list[int]:
+    applied_now = []
+    async with await psycopg.AsyncConnection.connect(conninfo, autocommit=True) as conn:
+        await conn.execute("SELECT pg_advisory_lock(%s)", (LOCK_KEY,))
+        try:
+            await _ensure_table(conn)
+            done = await applied_versions(conn)
+            for version, name, path in load_migrations():
+                if version in done:
+                    continue
+                print(f"套用 migration {version:04d}_{name} ...")
+                await _apply(conn, version, name, path)
+                applied_now.append(version)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(%s)", (LOCK_KEY,))
+    return applied_now
+
+
+async def pending_migrations(conninfo: str = DATABASE_URL) -> list[str]:
+    async with await psycopg.AsyncConnection.connect(conninfo, autocommit=True) as conn:
+        done = await applied_versions(conn)
+    return [f"{v:04d}_{n}" for v, n, _ in load_migrations() if v not in done]
+
+
+# 啟動時呼叫：schema 不是最新就拒絕啟動，避免跑在缺索引的資料庫上
+async def ensure_current(conninfo: str = DATABASE_URL) -> None:
+    pending = await pending_migrations(conninfo)
+    if pending:
+        raise SchemaOutdated(
+            "資料庫 schema 不是最新版本，尚未套用：" + ", ".join(pending) + "（請先執行 python migrate.py）"
+        )
+
+
+def main(argv: list[str]) -> int:
+    if "--check" in argv:
+        pending = asyncio.run(pending_migrations())
+        if pending:
+            print("尚未套用：" + ", ".join(pending))
+            return 1
+        print("schema 已是最新版本")
+        return 0
+
+    applied = asyncio.run(migrate())
+    print(f"完成，本次套用 {len(applied)} 個版本")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,56 @@
+-- 初始 schema：users / jobs / bids / job_events / job_result_files
+-- 全部用 IF NOT EXISTS，已經手動建好表的資料庫也能直接納入版本管理。
+
+CREATE TABLE IF NOT EXISTS users (
+    id            SERIAL PRIMARY KEY,
+    username      TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    role          TEXT NOT NULL CHECK (role IN ('client', 'contractor')),
+    created_at    TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id            SERIAL PRIMARY KEY,
+    title         VARCHAR(100) NOT NULL,
+    content       TEXT NOT NULL,
+    client_id     INT NOT NULL REFERENCES users(id),
+    contractor_id INT REFERENCES users(id),
+    status        TEXT NOT NULL DEFAULT 'pending'
+                  CHECK (status IN ('pending', 'invited', 'accepted', 'uploaded', 'rejected', 'closed')),
+    budget        INT CHECK (budget BETWEEN 0 AND 999999999),
+    due_date      DATE,
+    report_file   TEXT,
+    created_at    TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at    TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS bids (
+    id                     SERIAL PRIMARY KEY,
+    job_id                 INT NOT NULL REFERENCES jobs(id),
+    contractor_id          INT NOT NULL REFERENCES users(id),
+    price                  INT NOT NULL CHECK (price BETWEEN 0 AND 999999999),
+    note                   TEXT NOT NULL DEFAULT '',
+    proposal_file          TEXT,
+    proposal_original_name TEXT,
+    created_at             TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS job_events (
+    id          BIGSERIAL PRIMARY KEY,
+    job_id      INT NOT NULL REFERENCES jobs(id),
+    actor_id    INT REFERENCES users(id),
+    event_type  TEXT NOT NULL,
+    message     TEXT,
+    description TEXT,
+    created_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS job_result_files (
+    id            SERIAL PRIMARY KEY,
+    job_id        INT NOT NULL REFERENCES jobs(id),
+    contractor_id INT NOT NULL REFERENCES users(id),
+    version       INT NOT NULL,
+    file_path     TEXT NOT NULL,
+    original_name TEXT,
+    uploaded_at   TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,24 @@
+-- migrate:no-transaction
+-- 熱門查詢依賴的索引，用 CONCURRENTLY 建立，線上資料庫不會被鎖表。
+-- 每個 statement 各自執行（CONCURRENTLY 不能放在 transaction 裡）。
+
+-- bid_new 的 ON CONFLICT (job_id, contractor_id) 必須有這個 unique index
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS bids_job_contractor_key ON bids (job_id, contractor_id);
+
+-- contractor_my_jobs / get_history：依承包人找報價
+CREATE INDEX CONCURRENTLY IF NOT EXISTS bids_contractor_idx ON bids (contractor_id);
+
+-- contractor_jobs：status = 'pending' AND due_date >= CURRENT_DATE
+CREATE INDEX CONCURRENTLY IF NOT EXISTS jobs_status_due_idx ON jobs (status, due_date);
+
+-- client_jobs / get_history（委託人）
+CREATE INDEX CONCURRENTLY IF NOT EXISTS jobs_client_idx ON jobs (client_id);
+
+-- contractor_my_invitations / contractor_my_jobs / get_history（承包人）
+CREATE INDEX CONCURRENTLY IF NOT EXISTS jobs_contractor_idx ON jobs (contractor_id);
+
+-- get_job_detail 的最近退件理由、get_history 的事件列表
+CREATE INDEX CONCURRENTLY IF NOT EXISTS job_events_job_created_idx ON job_events (job_id, created_at);
+
+-- job_upload 的 MAX(version)、get_job_detail 的版本列表
+CREATE INDEX CONCURRENTLY IF NOT EXISTS job_result_files_job_version_idx ON job_result_files (job_id, version);
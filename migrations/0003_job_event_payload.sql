@@ -0,0 +1,13 @@
+-- job_events 成為案件狀態的唯一來源（見 job_state.py）
+-- payload 記錄重建 projection 需要的資料：contractor_id、report_file、bid_id、price、new_bid
+ALTER TABLE job_events ADD COLUMN IF NOT EXISTS payload JSONB NOT NULL DEFAULT '{}'::jsonb;
+
+-- 每個案件的報價數 projection（取代列表查詢裡的 COUNT(*) 子查詢）
+CREATE TABLE IF NOT EXISTS job_bid_counts (
+    job_id    INT PRIMARY KEY REFERENCES jobs(id),
+    bid_count INT NOT NULL DEFAULT 0
+);
+
+INSERT INTO job_bid_counts (job_id, bid_count)
+SELECT job_id, COUNT(*) FROM bids GROUP BY job_id
+ON CONFLICT (job_id) DO UPDATE SET bid_count = EXCLUDED.bid_count;
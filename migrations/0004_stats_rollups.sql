@@ -0,0 +1,59 @@
+-- 統計 rollup（見 rollup.py）：依日期 / 委託人 / 承包人累加的計數與總和，
+-- 由 job_events 依 watermark 增量更新，/stats 端點只讀這幾張小表。
+-- 三張表的統計欄位相同，只有 key 不同。
+
+CREATE TABLE IF NOT EXISTS rollup_watermarks (
+    name          TEXT PRIMARY KEY,
+    last_event_id BIGINT NOT NULL DEFAULT 0,
+    updated_at    TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO rollup_watermarks (name) VALUES ('stats') ON CONFLICT (name) DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS stats_daily (
+    day                  DATE PRIMARY KEY,
+    jobs_created         INT NOT NULL DEFAULT 0,
+    bids_submitted       INT NOT NULL DEFAULT 0,
+    bids_selected        INT NOT NULL DEFAULT 0,
+    reports_uploaded     INT NOT NULL DEFAULT 0,
+    jobs_rejected        INT NOT NULL DEFAULT 0,
+    jobs_closed          INT NOT NULL DEFAULT 0,
+    win_priced           INT NOT NULL DEFAULT 0,
+    win_price_sum        BIGINT NOT NULL DEFAULT 0,
+    win_budget_sum       BIGINT NOT NULL DEFAULT 0,
+    win_budget_price_sum BIGINT NOT NULL DEFAULT 0,
+    select_seconds_sum   DOUBLE PRECISION NOT NULL DEFAULT 0,
+    close_seconds_sum    DOUBLE PRECISION NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS stats_clients (
+    client_id            INT PRIMARY KEY REFERENCES users(id),
+    jobs_created         INT NOT NULL DEFAULT 0,
+    bids_submitted       INT NOT NULL DEFAULT 0,
+    bids_selected        INT NOT NULL DEFAULT 0,
+    reports_uploaded     INT NOT NULL DEFAULT 0,
+    jobs_rejected        INT NOT NULL DEFAULT 0,
+    jobs_closed          INT NOT NULL DEFAULT 0,
+    win_priced           INT NOT NULL DEFAULT 0,
+    win_price_sum        BIGINT NOT NULL DEFAULT 0,
+    win_budget_sum       BIGINT NOT NULL DEFAULT 0,
+    win_budget_price_sum BIGINT NOT NULL DEFAULT 0,
+    select_seconds_sum   DOUBLE PRECISION NOT NULL DEFAULT 0,
+    close_seconds_sum    DOUBLE PRECISION NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS stats_contractors (
+    contractor_id        INT PRIMARY KEY REFERENCES users(id),
+    jobs_created         INT NOT NULL DEFAULT 0,
+    bids_submitted       INT NOT NULL DEFAULT 0,
+    bids_selected        INT NOT NULL DEFAULT 0,
+    reports_uploaded     INT NOT NULL DEFAULT 0,
+    jobs_rejected        INT NOT NULL DEFAULT 0,
+    jobs_closed          INT NOT NULL DEFAULT 0,
+    win_priced           INT NOT NULL DEFAULT 0,
+    win_price_sum        BIGINT NOT NULL DEFAULT 0,
+    win_budget_sum       BIGINT NOT NULL DEFAULT 0,
+    win_budget_price_sum BIGINT NOT NULL DEFAULT 0,
+    select_seconds_sum   DOUBLE PRECISION NOT NULL DEFAULT 0,
+    close_seconds_sum    DOUBLE PRECISION NOT NULL DEFAULT 0
+);
@@ -0,0 +1,40 @@
+-- 承包人推薦用的 profile（見 rollup.py 的 contractor_profiles 與 /contractors/recommend）
+-- 計數與報價總和由 job_events 依 watermark 增量累加；document 是報價 / 承接過的案件標題與內容
+-- （strip 過的 tsvector，只留不重複的詞，大小與累加次數無關）。
+-- score 是與文字無關的基本分數，推薦時再加上與新案件的文字相似度。
+
+CREATE TABLE IF NOT EXISTS contractor_profiles (
+    contractor_id    INT PRIMARY KEY REFERENCES users(id),
+    username         TEXT NOT NULL,
+    bids             INT NOT NULL DEFAULT 0,
+    bids_won         INT NOT NULL DEFAULT 0,
+    invites_accepted INT NOT NULL DEFAULT 0,
+    jobs_closed      INT NOT NULL DEFAULT 0,
+    jobs_rejected    INT NOT NULL DEFAULT 0,
+    priced           INT NOT NULL DEFAULT 0,
+    price_sum        BIGINT NOT NULL DEFAULT 0,
+    document         TSVECTOR NOT NULL DEFAULT ''::tsvector,
+    -- 得標率與結案率加上 (1, 2) 的平滑，沒有紀錄的新承包人各算 0.5；退件比例扣分
+    score            DOUBLE PRECISION GENERATED ALWAYS AS (
+        (bids_won + 1.0) / (bids + 2.0)
+        + (jobs_closed + 1.0) / (bids_won + invites_accepted + 2.0)
+        - 0.5 * jobs_rejected / (jobs_closed + jobs_rejected + 1.0)
+    ) STORED,
+    updated_at       TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- 帳號前綴搜尋：以 "C" collation 比大小，前綴查詢可以直接走 index range scan
+CREATE INDEX IF NOT EXISTS contractor_profiles_username_prefix_idx
+    ON contractor_profiles ((lower(username) COLLATE "C"));
+CREATE INDEX IF NOT EXISTS contractor_profiles_score_idx
+    ON contractor_profiles (score DESC, username);
+CREATE INDEX IF NOT EXISTS contractor_profiles_document_idx
+    ON contractor_profiles USING GIN (document);
+
+-- 現有承包人先建立空的 profile；之後註冊的承包人由 user_insert 一併建立
+INSERT INTO contractor_profiles (contractor_id, username)
+SELECT id, username FROM users WHERE role = 'contractor'
+ON CONFLICT (contractor_id) DO NOTHING;
+
+-- 從第一筆事件開始累加
+INSERT INTO rollup_watermarks (name) VALUES ('contractor_profiles') ON CONFLICT (name) DO NOTHING;
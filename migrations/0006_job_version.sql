@@ -0,0 +1,4 @@
+-- 案件版本號：每次狀態轉換 +1（見 job_state.py）。
+-- 報價表單帶著讀到的版本號送出，案件在這之間被改過（選標、改為邀請制等）就不接受這次報價，
+-- 報價本身不必再用 SELECT ... FOR UPDATE 鎖住案件。
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS version INT NOT NULL DEFAULT 0;
@@ -0,0 +1,61 @@
+-- job_events 改成依 created_at 每個月一個 partition（維護見 partitions.py）
+--   partition 名稱 job_events_YYYY_MM，範圍以 UTC 的月份為界；job_events_default 收超出範圍的事件，
+--   正常情況下應該是空的（partitions.py 會提前建好之後幾個月）。
+--   primary key 必須包含 partition key，改成 (id, created_at)；id 仍由原本的 sequence 產生，不會重複。
+-- 舊資料在同一個 transaction 裡搬過去，期間 job_events 會被鎖住，資料量大時請在離峰時段執行。
+
+ALTER TABLE job_events RENAME TO job_events_unpartitioned;
+
+CREATE TABLE job_events (
+    id          BIGINT NOT NULL DEFAULT nextval('job_events_id_seq'),
+    job_id      INT NOT NULL REFERENCES jobs(id),
+    actor_id    INT REFERENCES users(id),
+    event_type  TEXT NOT NULL,
+    message     TEXT,
+    description TEXT,
+    created_at  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    payload     JSONB NOT NULL DEFAULT '{}'::jsonb
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE job_events_default PARTITION OF job_events DEFAULT;
+
+-- 建立 month 所在月份的 partition，已存在時回傳 NULL。
+-- default partition 若已經收了那個月的事件（維護程式沒跑到），先搬出來再建，否則建立會失敗。
+CREATE OR REPLACE FUNCTION job_events_create_partition(month DATE) RETURNS TEXT
+LANGUAGE plpgsql AS $$
+DECLARE
+    lo   TIMESTAMPTZ := date_trunc('month', month::timestamp) AT TIME ZONE 'UTC';
+    hi   TIMESTAMPTZ := (date_trunc('month', month::timestamp) + interval '1 month') AT TIME ZONE 'UTC';
+    name TEXT := 'job_events_' || to_char(month, 'YYYY_MM');
+BEGIN
+    IF to_regclass(name) IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+    CREATE TEMP TABLE job_events_moving ON COMMIT DROP AS
+        SELECT * FROM job_events_default WHERE created_at >= lo AND created_at < hi;
+    DELETE FROM job_events_default WHERE created_at >= lo AND created_at < hi;
+    EXECUTE format('CREATE TABLE %I PARTITION OF job_events FOR VALUES FROM (%L) TO (%L)', name, lo, hi);
+    INSERT INTO job_events SELECT * FROM job_events_moving;
+    DROP TABLE job_events_moving;
+    RETURN name;
+END
+$$;
+
+-- 舊資料涵蓋的月份到下個月
+SELECT job_events_create_partition(m::date)
+FROM generate_series(
+    date_trunc('month', COALESCE((SELECT MIN(created_at) FROM job_events_unpartitioned), NOW()) AT TIME ZONE 'UTC'),
+    date_trunc('month', NOW() AT TIME ZONE 'UTC') + interval '1 month',
+    interval '1 month'
+) m;
+
+INSERT INTO job_events (id, job_id, actor_id, event_type, message, description, created_at, payload)
+SELECT id, job_id, actor_id, event_type, message, description, created_at, payload
+FROM job_events_unpartitioned;
+
+ALTER SEQUENCE job_events_id_seq OWNED BY job_events.id;
+DROP TABLE job_events_unpartitioned;
+
+-- 資料搬完再建索引（會自動建到每個 partition）
+ALTER TABLE job_events ADD PRIMARY KEY (id, created_at);
+CREATE INDEX job_events_job_created_idx ON job_events (job_id, created_at);
@@ -0,0 +1,39 @@
+-- 背景工作佇列（見 tasks.py）
+-- worker 以 SELECT ... FOR UPDATE SKIP LOCKED 領取 queued 的工作，領取後改為 running 並設定租約（locked_until），
+-- 成功就刪除；失敗時依重試次數改回 queued（run_at 往後延）或標記為 failed 保留錯誤訊息。
+-- worker 當掉時租約過期，由其他 worker 改回 queued。
+CREATE TABLE IF NOT EXISTS tasks (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+    priority SMALLINT NOT NULL DEFAULT 0,          -- 數字大的先執行
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'failed')),
+    run_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),     -- 最早可以執行的時間（延遲執行、重試的退避）
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    dedupe_key TEXT,                               -- 同一個 key 同時只會有一筆 queued / running（定期工作）
+    locked_by TEXT,
+    locked_until TIMESTAMPTZ,
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- 領取：每種工作依優先度 → 時間 → id 的順序，只索引 queued 的列
+CREATE INDEX IF NOT EXISTS tasks_ready_idx ON tasks (kind, priority DESC, run_at, id) WHERE status = 'queued';
+-- 租約過期檢查
+CREATE INDEX IF NOT EXISTS tasks_running_idx ON tasks (locked_until) WHERE status = 'running';
+CREATE UNIQUE INDEX IF NOT EXISTS tasks_dedupe_idx ON tasks (dedupe_key)
+    WHERE dedupe_key IS NOT NULL AND status IN ('queued', 'running');
+
+-- 有新工作時通知 worker（LISTEN tasks_queued）。NOTIFY 在 commit 時才送出，
+-- 在 request 的 transaction 裡 enqueue 的工作，rollback 就不會被執行也不會通知。
+CREATE OR REPLACE FUNCTION tasks_notify() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('tasks_queued', '');
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS tasks_notify ON tasks;
+CREATE TRIGGER tasks_notify AFTER INSERT ON tasks FOR EACH STATEMENT EXECUTE FUNCTION tasks_notify();
@@ -0,0 +1,11 @@
+-- migrate:no-transaction
+-- 案件詳情快取（detail_cache.py）每個 request 都會查案件的事件數與最新事件 id：
+-- COUNT(*) / MAX(id) ... WHERE job_id = ? AND created_at >= ?，這個索引讓每個 partition 只做一次 index-only scan。
+-- job_events 是 partitioned table，直接 CREATE INDEX 會在建立期間擋住寫入事件；
+-- 所以先 ON ONLY 建在母表上（不會掃資料，狀態是 invalid），再逐個 partition 用 CONCURRENTLY 建好後 ATTACH，
+-- 全部 partition 都 attach 之後母表的索引自動變成 valid。之後新建的 partition 會自動建立這個索引。
+CREATE INDEX IF NOT EXISTS job_events_job_id_idx ON ONLY job_events (job_id, id) INCLUDE (created_at);
+
+-- migrate:each-partition job_events
+CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition}_job_id_idx ON {partition} (job_id, id) INCLUDE (created_at);
+ALTER INDEX job_events_job_id_idx ATTACH PARTITION {partition}_job_id_idx;
@@ -0,0 +1,17 @@
+-- migrate:no-transaction
+-- 成果檔案的版本號在同一個案件內不可重複（job_state.py 在鎖住案件後才計算版本號，這裡再用 unique 限制擋住）。
+-- 先把以前並行上傳留下的重複版本號依上傳順序重新編號，再用 CONCURRENTLY 建 unique index、轉成 constraint，
+-- 原本的一般索引就不再需要。
+UPDATE job_result_files f SET version = r.n
+FROM (
+    SELECT id, row_number() OVER (PARTITION BY job_id ORDER BY version, uploaded_at, id) AS n
+    FROM job_result_files
+    WHERE job_id IN (SELECT job_id FROM job_result_files GROUP BY job_id, version HAVING COUNT(*) > 1)
+) r
+WHERE f.id = r.id AND f.version <> r.n;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS job_result_files_job_version_key ON job_result_files (job_id, version);
+
+DO $$ BEGIN IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'job_result_files_job_version_key') THEN ALTER TABLE job_result_files ADD CONSTRAINT job_result_files_job_version_key UNIQUE USING INDEX job_result_files_job_version_key; END IF; END $$;
+
+DROP INDEX CONCURRENTLY IF EXISTS job_result_files_job_version_idx;
@@ -0,0 +1,9 @@
+-- rollup 的 watermark 改用 fence 判斷哪些事件不會再出現（見 rollup.py），不再依寫入時間猜測交易是否已經 commit。
+--   safe_event_id   不超過這個 id 的事件都已經 commit 或 rollback，可以累加
+--   fence_event_id  上次記下的「發到的最後一個 id」，fence_xid 之前的交易都結束後變成 safe_event_id
+ALTER TABLE rollup_watermarks
+    ADD COLUMN IF NOT EXISTS safe_event_id  BIGINT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS fence_event_id BIGINT,
+    ADD COLUMN IF NOT EXISTS fence_xid      xid8;
+
+UPDATE rollup_watermarks SET safe_event_id = last_event_id WHERE safe_event_id < last_event_id;
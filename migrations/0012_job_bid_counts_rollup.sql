@@ -0,0 +1,7 @@
+-- 報價數（job_bid_counts）改由 rollup 依 BID_SUBMITTED 事件累加（見 rollup.py），報價本身不再更新這張表。
+-- 目前的報價數是報價時同步累加的，watermark 從現在發到的最後一個事件 id 開始；
+-- 部署期間舊版程式還在寫的報價可能被多算一次，部署完可以用 python replay.py 校正。
+INSERT INTO rollup_watermarks (name, last_event_id, safe_event_id)
+SELECT 'job_bid_counts', v.id, v.id
+FROM (SELECT COALESCE(pg_sequence_last_value('job_events_id_seq'), 0) AS id) v
+ON CONFLICT (name) DO NOTHING;
@@ -0,0 +1,4 @@
+-- 報價數改為列表查詢時直接數 bids（(job_id, contractor_id) 的 unique index，見 repo.py），
+-- 報價 commit 當下就是正確的數字；不再需要 job_bid_counts 與累加它的 rollup（0012）。
+DELETE FROM rollup_watermarks WHERE name = 'job_bid_counts';
+DROP TABLE IF EXISTS job_bid_counts;
@@ -0,0 +1,17 @@
+-- migrate:no-transaction
+-- 0001 的 CHECK 寫在 CREATE TABLE IF NOT EXISTS 裡，納入版本管理前就手動建好表的資料庫不會有。
+-- 這裡補上同名（PostgreSQL 預設命名）的 constraint，兩種安裝最後的 schema 相同；已經有的就跳過。
+-- 先以 NOT VALID 加上（只短暫鎖表、不掃描既有資料），各自 commit 之後再 VALIDATE（掃描時不擋讀寫）。
+-- VALIDATE 失敗表示既有資料不符合，修正資料後重新執行 python migrate.py 即可。
+DO $$ BEGIN IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'users'::regclass AND conname = 'users_role_check') THEN ALTER TABLE users ADD CONSTRAINT users_role_check CHECK (role IN ('client', 'contractor')) NOT VALID; END IF; END $$;
+
+DO $$ BEGIN IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'jobs'::regclass AND conname = 'jobs_status_check') THEN ALTER TABLE jobs ADD CONSTRAINT jobs_status_check CHECK (status IN ('pending', 'invited', 'accepted', 'uploaded', 'rejected', 'closed')) NOT VALID; END IF; END $$;
+
+DO $$ BEGIN IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'jobs'::regclass AND conname = 'jobs_budget_check') THEN ALTER TABLE jobs ADD CONSTRAINT jobs_budget_check CHECK (budget BETWEEN 0 AND 999999999) NOT VALID; END IF; END $$;
+
+DO $$ BEGIN IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'bids'::regclass AND conname = 'bids_price_check') THEN ALTER TABLE bids ADD CONSTRAINT bids_price_check CHECK (price BETWEEN 0 AND 999999999) NOT VALID; END IF; END $$;
+
+ALTER TABLE users VALIDATE CONSTRAINT users_role_check;
+ALTER TABLE jobs VALIDATE CONSTRAINT jobs_status_check;
+ALTER TABLE jobs VALIDATE CONSTRAINT jobs_budget_check;
+ALTER TABLE bids VALIDATE CONSTRAINT bids_price_check;
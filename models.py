@@ -0,0 +1,224 @@
+# 查詢結果的資料列型別
+# 取代原本的 dict_row：每種查詢結果對應一個 slots dataclass，欄位名稱 = SELECT 出來的欄位名稱，
+# 由 repo.py 用 psycopg 的 class_row 直接建構。比 dict 省記憶體，屬性存取也比 key 查找快，
+# FastAPI 回傳時會自動轉成 JSON 物件，前端拿到的欄位與原本相同。
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Optional
+
+
+@dataclass(slots=True)
+class IdRow:
+    id: int
+
+
+@dataclass(slots=True)
+class UsernameRow:
+    username: str
+
+
+@dataclass(slots=True)
+class LoginRow:
+    id: int
+    role: str
+    username: str
+
+
+@dataclass(slots=True)
+class ContractorOption:
+    id: int
+    username: str
+
+
+@dataclass(slots=True)
+class ClientJobRow:
+    id: int
+    title: str
+    status: str
+    created_at: datetime
+    bid_count: int
+    contractor_name: Optional[str]
+
+
+@dataclass(slots=True)
+class OpenJobRow:
+    id: int
+    title: str
+    status: str
+    version: int
+    created_at: datetime
+    client_name: str
+    bid_count: int
+    my_bid_price: Optional[int]
+
+
+@dataclass(slots=True)
+class MyJobRow:
+    id: int
+    title: str
+    status: str
+    updated_at: datetime
+    client_name: str
+    my_bid_price: Optional[int]
+    am_i_winner: Optional[bool]
+
+
+@dataclass(slots=True)
+class InvitationRow:
+    id: int
+    title: str
+    budget: Optional[int]
+    due_date: Optional[date]
+    created_at: datetime
+    client_name: str
+
+
+@dataclass(slots=True)
+class JobStateRow:
+    id: int
+    client_id: int
+    status: str
+    due_date: Optional[date]
+    version: int
+
+
+@dataclass(slots=True)
+class BidAcceptLookupRow:
+    status: str
+    due_date: Optional[date]
+    contractor_id: Optional[int]
+    price: Optional[int]
+    contractor_username: Optional[str]
+
+
+@dataclass(slots=True)
+class UploadLookupRow:
+    status: str
+
+
+@dataclass(slots=True)
+class JobDetailRow:
+    id: int
+    title: str
+    content: str
+    client_id: int
+    contractor_id: Optional[int]
+    status: str
+    version: int
+    budget: Optional[int]
+    due_date: Optional[date]
+    report_file: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+    client_name: str
+    contractor_name: Optional[str]
+
+
+@dataclass(slots=True)
+class BidRow:
+    id: int
+    price: int
+    note: str
+    contractor_id: int
+    contractor_name: str
+    created_at: datetime
+    proposal_file: Optional[str]
+    proposal_original_name: Optional[str]
+
+
+# 案件詳情快取的 key（見 detail_cache.py）
+@dataclass(slots=True)
+class DetailKeyRow:
+    version: int
+    events: int
+    last_event_id: Optional[int]
+
+
+@dataclass(slots=True)
+class RejectionRow:
+    message: Optional[str]
+
+
+@dataclass(slots=True)
+class ResultFileRow:
+    id: int
+    version: int
+    file_path: str
+    original_name: Optional[str]
+    uploaded_at: datetime
+    contractor_id: int
+
+
+@dataclass(slots=True)
+class EventRow:
+    id: int
+    job_id: int
+    actor_id: Optional[int]
+    event_type: str
+    message: Optional[str]
+    description: Optional[str]
+    created_at: datetime
+    job_title: str
+    actor_name: Optional[str]
+
+
+@dataclass(slots=True)
+class RollupMarkRow:
+    last_event_id: int
+    safe_event_id: int
+    fence_event_id: Optional[int]
+    fence_passed: bool
+
+
+@dataclass(slots=True)
+class StatsRow:
+    jobs_created: int
+    bids_submitted: int
+    bids_selected: int
+    reports_uploaded: int
+    jobs_rejected: int
+    jobs_closed: int
+    win_priced: int
+    win_price_sum: int
+    win_budget_sum: int
+    win_budget_price_sum: int
+    select_seconds_sum: float
+    close_seconds_sum: float
+
+
+@dataclass(slots=True)
+class StatsDayRow(StatsRow):
+    day: date
+
+
+@dataclass(slots=True)
+class ContractorRecommendation:
+    id: int
+    username: str
+    bids: int
+    bids_won: int
+    invites_accepted: int
+    jobs_closed: int
+    jobs_rejected: int
+    win_rate: Optional[float]
+    closure_rate: Optional[float]
+    avg_price: Optional[int]
+    relevance: float
+    score: float
+
+
+@dataclass(slots=True)
+class TaskRow:
+    id: int
+    kind: str
+    payload: dict
+    attempts: int
+    max_attempts: int
+
+
+@dataclass(slots=True)
+class TaskStatusRow:
+    kind: str
+    status: str
+    count: int
+    next_run_at: datetime
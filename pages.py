@@ -0,0 +1,85 @@
+# 伺服器端渲染（SERVER_RENDER=1）：第一個回應就是填好資料的完整頁面
+#
+# 原本 www/ 的頁面載入後還要依序 fetch /me 與資料 API 才畫得出表格（共三次往返），
+# 高延遲的行動網路上很明顯。這裡不另外維護一份樣板：直接用 www/ 裡同一個 HTML，
+# 啟動時在「登入身分」（<span id="who" ...>）與表格的 <tbody> 切成固定的幾段字串快取起來，
+# 每一列用預先定義好的 format 字串產生（見 routes_pages.py）。
+# 回應用 StreamingResponse：先送出表格之前的部分（瀏覽器可以先載入 CSS），
+# 資料列用 server-side cursor 每次讀 BATCH_ROWS 筆，讀到一批就送出一批，長列表不必整個讀進記憶體。
+# 頁面裡的 JS 看到 <tbody data-rendered> 就不再 fetch。
+import html
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Callable
+
+from fastapi.responses import StreamingResponse
+
+log = logging.getLogger(__name__)
+
+WWW_DIR = Path("www")
+BATCH_ROWS = 200
+
+WHO_TAG = '<span id="who" class="who-tag">'
+EMPTY_TBODY = "<tbody></tbody>"
+
+
+def esc(value) -> str:
+    return "" if value is None else html.escape(str(value))
+
+
+@dataclass(frozen=True, slots=True)
+class Page:
+    name: str
+    columns: int
+    before_who: str   # 到 <span id="who"> 為止
+    before_rows: str  # 登入身分之後到 <tbody data-rendered> 為止
+    after_rows: str   # </tbody> 之後
+
+    # 表格前的部分（含登入身分），與 loadMe 顯示的文字相同
+    def head(self, user: dict) -> str:
+        return self.before_who + esc(f"登入中：{user['role']} {user['username']}") + self.before_rows
+
+    def message_row(self, text: str, css: str = "text-muted") -> str:
+        return f'<tr><td colspan="{self.columns}" class="{css}">{esc(text)}</td></tr>\n'
+
+
+def compile_page(name: str, table_id: str) -> Page:
+    text = (WWW_DIR / name).read_text(encoding="utf-8")
+    who_at = text.index(WHO_TAG) + len(WHO_TAG)
+    table_at = text.index(f'id="{table_id}"')
+    tbody_at = text.index(EMPTY_TBODY, table_at)
+    columns = text.count("<th>", table_at, tbody_at)
+    return Page(
+        name,
+        columns,
+        text[:who_at],
+        text[who_at:tbody_at] + '<tbody data-rendered="server">\n',
+        "</tbody>" + text[tbody_at + len(EMPTY_TBODY):],
+    )
+
+
+def render(
+    page: Page,
+    user: dict,
+    load: Callable[[], AsyncIterator[list]],
+    row: Callable[[object], str],
+    empty: str,
+) -> StreamingResponse:
+    async def body() -> AsyncIterator[str]:
+        yield page.head(user)
+        count = 0
+        try:
+            async for rows in load():
+                count += len(rows)
+                yield "".join(row(r) for r in rows)
+        except Exception:
+            # 狀態碼已經送出，錯誤顯示在表格裡（已送出的資料列保留）；細節只記在 log，不顯示給使用者
+            log.exception("伺服器端渲染 %s 失敗：user_id=%s", page.name, user.get("user_id"))
+            yield page.message_row("載入失敗，請重新整理再試", "error-text")
+        else:
+            if not count:
+                yield page.message_row(empty)
+        yield page.after_rows
+
+    return StreamingResponse(body(), media_type="text/html; charset=utf-8")
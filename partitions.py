@@ -0,0 +1,186 @@
+# job_events 的 partition 維護（每個月一個 partition，見 migrations/0007_partition_job_events.sql）
+#
+#   ensure：建立這個月到之後 AHEAD_MONTHS 個月的 partition（背景工作 partitions.ensure 每天執行一次，見 tasks.py）
+#   archive：把超過保留期限的 partition 從 job_events 卸下（DETACH），移到 archive schema；
+#            指定 --export 時另外匯出成 CSV 再刪除資料表
+#
+# 卸下的事件不會再出現在歷史紀錄、案件詳情與 replay 裡，所以只卸下「事件全部屬於已結案案件、
+# 而且統計 rollup 都已經累加過」的 partition，其餘的跳過並列出原因。
+#
+# 用法：
+#   python partitions.py                                 建立之後幾個月的 partition
+#   python partitions.py --archive-older-than 24         卸下 24 個月以前的 partition，移到 archive schema
+#   python partitions.py --archive-older-than 24 --export archive/   匯出 CSV 後刪除
+#   python partitions.py --archive-older-than 24 --dry-run           只列出會處理哪些
+import argparse
+import asyncio
+import logging
+import re
+import sys
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+import psycopg
+from psycopg import sql
+from psycopg.rows import tuple_row
+
+from db import DATABASE_URL, get_pool
+
+log = logging.getLogger(__name__)
+
+AHEAD_MONTHS = 3
+INTERVAL_SECONDS = 24 * 3600
+ARCHIVE_SCHEMA = "archive"
+
+_PARTITION_NAME = re.compile(r"^job_events_(\d{4})_(\d{2})$")
+
+
+def add_months(month: date, n: int) -> date:
+    y, m = divmod(month.year * 12 + month.month - 1 + n, 12)
+    return date(y, m + 1, 1)
+
+
+def this_month() -> date:
+    today = datetime.now(timezone.utc).date()
+    return today.replace(day=1)
+
+
+# 建立這個月到之後 ahead 個月的 partition，回傳新建的名稱
+async def ensure_partitions(conn, ahead: int = AHEAD_MONTHS) -> list[str]:
+    created = []
+    start = this_month()
+    # 連線池的連線預設回傳 dict，這裡固定用 tuple
+    async with conn.transaction(), conn.cursor(row_factory=tuple_row) as cur:
+        for n in range(ahead + 1):
+            await cur.execute("SELECT job_events_create_partition(%s)", (add_months(start, n),))
+            (name,) = await cur.fetchone()
+            if name:
+                created.append(name)
+    return created
+
+
+# 目前掛在 job_events 底下的月份 partition：[(名稱, 月份)]，依月份排序
+async def list_partitions(conn) -> list[tuple[str, date]]:
+    cur = await conn.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'job_events'::regclass
+        """
+    )
+    items = []
+    for (name,) in await cur.fetchall():
+        m = _PARTITION_NAME.match(name)
+        if m:
+            items.append((name, date(int(m.group(1)), int(m.group(2)), 1)))
+    return sorted(items, key=lambda item: item[1])
+
+
+# 不能卸下的原因；可以卸下時回傳 None
+async def _archive_blocker(conn, name: str) -> Optional[str]:
+    cur = await conn.execute(
+        sql.SQL(
+            """
+            SELECT
+                EXISTS (SELECT 1 FROM {part} e JOIN jobs j ON j.id = e.job_id WHERE j.status <> 'closed'),
+                (SELECT MAX(id) FROM {part}) > (SELECT MIN(last_event_id) FROM rollup_watermarks)
+            """
+        ).format(part=sql.Identifier(name))
+    )
+    open_jobs, not_rolled_up = await cur.fetchone()
+    if open_jobs:
+        return "含有尚未結案案件的事件"
+    if not_rolled_up:
+        return "統計 rollup 尚未累加完"
+    return None
+
+
+async def _export(conn, name: str, export_dir: Path) -> int:
+    path = export_dir / f"{name}.csv"
+    size = 0
+    with path.open("wb") as f:
+        async with conn.cursor() as cur:
+            query = sql.SQL("COPY {part} TO STDOUT (FORMAT csv, HEADER)").format(
+                part=sql.Identifier(ARCHIVE_SCHEMA, name)
+            )
+            async with cur.copy(query) as copy:
+                async for data in copy:
+                    f.write(data)
+                    size += len(data)
+    return size
+
+
+# 卸下 older_than 個月以前的 partition，回傳 [(名稱, 結果)]
+async def archive_partitions(
+    conn, older_than: int, export_dir: Optional[Path] = None, dry_run: bool = False
+) -> list[tuple[str, str]]:
+    cutoff = add_months(this_month(), -older_than)
+    results = []
+    for name, month in await list_partitions(conn):
+        if month >= cutoff:
+            break
+        blocker = await _archive_blocker(conn, name)
+        if blocker:
+            results.append((name, f"跳過：{blocker}"))
+            continue
+        if dry_run:
+            results.append((name, "將卸下"))
+            continue
+
+        # DETACH 需要短暫鎖住 job_events；卸下與搬移在同一個 transaction 裡
+        async with conn.transaction():
+            await conn.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(ARCHIVE_SCHEMA)))
+            await conn.execute(sql.SQL("ALTER TABLE job_events DETACH PARTITION {}").format(sql.Identifier(name)))
+            await conn.execute(
+                sql.SQL("ALTER TABLE {} SET SCHEMA {}").format(sql.Identifier(name), sql.Identifier(ARCHIVE_SCHEMA))
+            )
+        if export_dir is None:
+            results.append((name, f"已移到 {ARCHIVE_SCHEMA}.{name}"))
+            continue
+
+        size = await _export(conn, name, export_dir)
+        await conn.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(ARCHIVE_SCHEMA, name)))
+        results.append((name, f"已匯出 {export_dir / (name + '.csv')}（{size:,} bytes）並刪除"))
+    return results
+
+
+# 背景工作（見 tasks.py）：每天確認一次之後幾個月的 partition 都已建立
+async def ensure_task(payload: dict) -> None:
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        for name in await ensure_partitions(conn):
+            log.info("已建立 partition %s", name)
+
+
+TASKS = {
+    "partitions.ensure": {"run": ensure_task, "every": INTERVAL_SECONDS, "concurrency": 1},
+}
+
+
+async def main(args) -> int:
+    async with await psycopg.AsyncConnection.connect(DATABASE_URL, autocommit=True) as conn:
+        for name in await ensure_partitions(conn, args.ahead):
+            print(f"已建立 partition {name}")
+
+        if args.archive_older_than is not None:
+            if args.export:
+                args.export.mkdir(parents=True, exist_ok=True)
+            results = await archive_partitions(conn, args.archive_older_than, args.export, args.dry_run)
+            for name, result in results:
+                print(f"{name}: {result}")
+            if not results:
+                print(f"沒有 {args.archive_older_than} 個月以前的 partition")
+
+        for name, _ in await list_partitions(conn):
+            print(f"  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="job_events 的 partition 維護")
+    parser.add_argument("--ahead", type=int, default=AHEAD_MONTHS, help="預先建立之後幾個月的 partition")
+    parser.add_argument("--archive-older-than", type=int, metavar="MONTHS", help="卸下幾個月以前的 partition")
+    parser.add_argument("--export", type=Path, metavar="DIR", help="卸下的 partition 匯出成 CSV 後刪除")
+    parser.add_argument("--dry-run", action="store_true")
+    sys.exit(asyncio.run(main(parser.parse_args())))
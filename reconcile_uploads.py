@@ -0,0 +1,257 @@
+# uploads/ 裡沒有被資料庫參照的檔案（孤兒檔）的盤點與清理
+#
+# 孤兒檔的來源：bid_new 先寫檔再寫資料庫，寫入失敗（已截止、已選標）時留下的提案書；
+# 重新報價時被新檔案取代的舊提案書；以前版本留下的檔案。
+# 資料庫參照的檔案：bids.proposal_file、jobs.report_file、job_result_files.file_path（都是 uploads/ 底下的檔名）。
+#
+# 做法：兩邊都依檔名排序後合併比對，記憶體用量與檔案數量無關
+#   磁碟  os.scandir 逐筆讀取，每 CHUNK 筆排序後寫到暫存檔，最後用 heapq.merge 合併（外部排序）
+#   資料庫 三張表的檔名 UNION 後 ORDER BY ... COLLATE "C"，用 server-side cursor 分批讀取
+#          （UTF-8 的位元組順序就是 Python 字串的比較順序，兩邊的排序一致）
+# 只處理最後修改時間超過 GRACE_HOURS 的孤兒檔：剛寫好、transaction 還沒 commit 的檔案不會被誤判。
+#
+# 用法：
+#   python reconcile_uploads.py                        只列出孤兒檔與可回收的空間，不動檔案
+#   python reconcile_uploads.py --quarantine           移到 uploads_quarantine/（不再對外提供，需要時可以搬回來）
+#   python reconcile_uploads.py --delete               直接刪除
+#   python reconcile_uploads.py --dir uploads_quarantine --grace-hours 720 --delete
+#                                                      移到隔離區超過 30 天的檔案刪除
+# 背景工作 uploads.reconcile 每天盤點一次（見 tasks.py），預設只列出孤兒檔、不動檔案；
+# 要自動移到隔離區必須明確設定 RECONCILE_UPLOADS_ACTION=quarantine。
+import argparse
+import asyncio
+import errno
+import heapq
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+import psycopg
+from psycopg.rows import tuple_row
+
+from db import DATABASE_URL, get_pool
+
+UPLOADS_DIR = Path("uploads")
+QUARANTINE_DIR = Path("uploads_quarantine")
+GRACE_HOURS = 24.0
+CHUNK = 100_000         # 外部排序每一段的筆數，也是 cursor 每次讀取的筆數
+SAMPLES = 20            # 報告裡列出幾個檔名
+INTERVAL_SECONDS = 24 * 3600
+# 背景工作的處理方式：report（預設，只盤點）/ quarantine；背景工作不提供 delete
+TASK_ACTION = os.environ.get("RECONCILE_UPLOADS_ACTION", "report")
+
+REFERENCES_SQL = """
+SELECT name COLLATE "C" AS name FROM (
+    SELECT proposal_file AS name FROM bids WHERE proposal_file IS NOT NULL
+    UNION
+    SELECT report_file FROM jobs WHERE report_file IS NOT NULL
+    UNION
+    SELECT file_path FROM job_result_files
+) refs
+ORDER BY 1
+"""
+
+
+@dataclass
+class Report:
+    files: int = 0
+    bytes: int = 0
+    referenced: int = 0
+    orphans: int = 0
+    orphan_bytes: int = 0
+    recent: int = 0             # 還在 grace period 內的孤兒檔，這次不處理
+    missing: int = 0            # 資料庫有參照、磁碟上卻沒有的檔案
+    reclaimed: int = 0
+    reclaimed_bytes: int = 0
+    orphan_samples: list[str] = field(default_factory=list)
+    missing_samples: list[str] = field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
+
+
+# ========== 磁碟：外部排序 ==========
+
+def _spill(batch: list) -> Iterator[tuple]:
+    f = tempfile.TemporaryFile("w+", encoding="utf-8")
+    for item in batch:
+        f.write(json.dumps(item) + "\n")
+    f.seek(0)
+
+    def read():
+        with f:
+            for line in f:
+                yield tuple(json.loads(line))
+
+    return read()
+
+
+# (檔名, 大小, 修改時間)，依檔名排序；只列一般檔案（不含子目錄、symlink）
+def sorted_listing(directory: Path, chunk: int = CHUNK) -> Iterator[tuple[str, int, float]]:
+    runs, batch = [], []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            st = entry.stat(follow_symlinks=False)
+            batch.append((entry.name, st.st_size, st.st_mtime))
+            if len(batch) >= chunk:
+                batch.sort()
+                runs.append(_spill(batch))
+                batch = []
+    batch.sort()
+    if not runs:
+        yield from batch
+    else:
+        yield from heapq.merge(*runs, batch)
+
+
+# ========== 處理孤兒檔 ==========
+
+def _quarantine(path: Path, quarantine_dir: Path) -> None:
+    target = quarantine_dir / path.name
+    try:
+        os.replace(path, target)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(path, target)  # 隔離區在另一個檔案系統：複製後刪除
+    os.utime(target)  # 修改時間改為移入的時間，清理隔離區時依這個時間計算
+
+
+def _handle(path: Path, action: str, quarantine_dir: Path) -> bool:
+    try:
+        if action == "delete":
+            path.unlink()
+        else:
+            _quarantine(path, quarantine_dir)
+    except FileNotFoundError:
+        return False  # 已經被別人處理掉
+    return True
+
+
+async def reconcile(
+    conn,
+    uploads_dir: Path = UPLOADS_DIR,
+    *,
+    action: str = "report",           # report / quarantine / delete
+    quarantine_dir: Path = QUARANTINE_DIR,
+    grace_hours: float = GRACE_HOURS,
+    chunk: int = CHUNK,
+) -> Report:
+    if action not in ("report", "quarantine", "delete"):
+        raise ValueError(f"unknown action: {action}")
+    if action == "quarantine":
+        quarantine_dir.mkdir(parents=True, exist_ok=True)
+    cutoff = time.time() - grace_hours * 3600
+    report = Report()
+
+    def missing(name: str) -> None:
+        report.missing += 1
+        if len(report.missing_samples) < SAMPLES:
+            report.missing_samples.append(name)
+
+    async with conn.transaction():
+        async with conn.cursor(name="upload_references", row_factory=tuple_row) as cur:
+            cur.itersize = min(chunk, 10_000)
+            await cur.execute(REFERENCES_SQL)
+            refs = aiter(cur)
+            ref = await anext(refs, None)
+
+            for name, size, mtime in sorted_listing(uploads_dir, chunk):
+                report.files += 1
+                report.bytes += size
+                if report.files % 1000 == 0:
+                    await asyncio.sleep(0)  # 在 app 的 worker 裡執行時，讓其他 request 有機會處理
+                while ref is not None and ref[0] < name:
+                    missing(ref[0])
+                    ref = await anext(refs, None)
+                if ref is not None and ref[0] == name:
+                    report.referenced += 1
+                    ref = await anext(refs, None)
+                    continue
+
+                if mtime > cutoff:
+                    report.recent += 1
+                    continue
+                report.orphans += 1
+                report.orphan_bytes += size
+                if len(report.orphan_samples) < SAMPLES:
+                    report.orphan_samples.append(name)
+                if action == "report":
+                    continue
+                try:
+                    if _handle(uploads_dir / name, action, quarantine_dir):
+                        report.reclaimed += 1
+                        report.reclaimed_bytes += size
+                except OSError as e:
+                    report.errors.append(f"{name}: {e}")
+
+            while ref is not None:
+                missing(ref[0])
+                ref = await anext(refs, None)
+    return report
+
+
+def print_report(report: Report, action: str, uploads_dir: Path) -> None:
+    print(f"{uploads_dir}/：{report.files:,} 個檔案，{report.bytes:,} bytes；資料庫參照 {report.referenced:,} 個")
+    print(f"孤兒檔 {report.orphans:,} 個，{report.orphan_bytes:,} bytes"
+          f"（另有 {report.recent:,} 個還在 grace period 內，這次不處理）")
+    for name in report.orphan_samples:
+        print(f"  {name}")
+    if report.orphans > len(report.orphan_samples):
+        print(f"  ...（共 {report.orphans:,} 個）")
+    if action != "report":
+        verb = "刪除" if action == "delete" else "移到隔離區"
+        print(f"已{verb} {report.reclaimed:,} 個，回收 {report.reclaimed_bytes:,} bytes")
+    if report.missing:
+        print(f"資料庫有參照、檔案卻不存在：{report.missing:,} 個")
+        for name in report.missing_samples:
+            print(f"  {name}")
+    for error in report.errors:
+        print(f"處理失敗：{error}")
+
+
+# 背景工作（見 tasks.py）：每天盤點一次，有孤兒檔或缺檔才印出報告；
+# 只有設定 RECONCILE_UPLOADS_ACTION=quarantine（或工作的 payload 指定）才會移動檔案
+async def reconcile_task(payload: dict) -> None:
+    action = payload.get("action", TASK_ACTION)
+    if action not in ("report", "quarantine"):
+        raise ValueError(f"uploads.reconcile 只支援 report / quarantine：{action}")
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        report = await reconcile(conn, action=action, grace_hours=payload.get("grace_hours", GRACE_HOURS))
+    if report.orphans or report.missing or report.errors:
+        print_report(report, action, UPLOADS_DIR)
+
+
+TASKS = {
+    "uploads.reconcile": {"run": reconcile_task, "every": INTERVAL_SECONDS, "concurrency": 1, "timeout": 3600.0},
+}
+
+
+async def main(args) -> int:
+    action = "delete" if args.delete else "quarantine" if args.quarantine else "report"
+    async with await psycopg.AsyncConnection.connect(DATABASE_URL) as conn:
+        report = await reconcile(
+            conn, args.dir, action=action, quarantine_dir=args.quarantine_dir,
+            grace_hours=args.grace_hours, chunk=args.chunk,
+        )
+    print_report(report, action, args.dir)
+    return 1 if report.errors else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="盤點與清理 uploads/ 裡沒有被資料庫參照的檔案")
+    parser.add_argument("--dir", type=Path, default=UPLOADS_DIR, help="要盤點的目錄")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--quarantine", action="store_true", help="孤兒檔移到隔離區")
+    group.add_argument("--delete", action="store_true", help="孤兒檔直接刪除")
+    parser.add_argument("--quarantine-dir", type=Path, default=QUARANTINE_DIR)
+    parser.add_argument("--grace-hours", type=float, default=GRACE_HOURS, help="最後修改超過幾小時的孤兒檔才處理")
+    parser.add_argument("--chunk", type=int, default=CHUNK, help="外部排序每一段的筆數")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,169 @@
+# 從 job_events 重播，整批重建案件的 projection
+#   jobs.status / jobs.contractor_id / jobs.report_file
+#
+# 事件以 server-side cursor 依 (job_id, id) 串流讀出，在記憶體裡一次只保留一個案件的狀態，
+# 結果用 COPY 寫進暫存表，最後用一條 UPDATE 套回去，不會逐筆更新。
+# 舊資料的事件沒有 payload（0003 之前寫入的），推不出承包人或檔案時保留目前的欄位值。
+# 報價數不是 projection，列表直接從 bids 計算（見 repo.py），不需要重建。
+# 第一個事件不是建立事件（JOB_CREATED / JOB_INVITED）的案件不重建：較早的事件所在的 partition
+# 已經被 partitions.py 封存（DETACH 或匯出後刪除），剩下的事件推出來的狀態不完整。
+#
+# 用法：
+#   python replay.py             重建並寫回
+#   python replay.py --dry-run   只回報會改變幾筆，不寫回
+#   python replay.py --job 42    只重播單一案件
+import argparse
+import asyncio
+import sys
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import psycopg
+
+from db import DATABASE_URL
+from job_state import CREATIONS, TRANSITIONS
+
+UNKNOWN = object()  # 事件裡沒有足夠資訊，維持 jobs 目前的值
+
+# 各事件對 projection 欄位的影響（狀態本身由 job_state 的 CREATIONS / TRANSITIONS 決定）
+CONTRACTOR_FROM_PAYLOAD = {"JOB_INVITED", "BID_SELECTED"}
+CONTRACTOR_CLEARED = {"JOB_CREATED", "INVITE_DECLINED"}
+REPORT_FROM_PAYLOAD = {"REPORT_UPLOADED", "REPORT_RE_UPLOADED"}
+
+
+@dataclass
+class Projection:
+    job_id: int
+    status: Optional[str] = None
+    contractor_id: Any = UNKNOWN
+    report_file: Any = UNKNOWN
+    anomalies: int = 0
+    events: int = 0
+    complete: bool = False  # 從建立事件開始重播（事件沒有被封存掉）
+
+    def apply(self, event_type: str, payload: dict) -> None:
+        self.events += 1
+        if self.events == 1:
+            self.complete = event_type in CREATIONS
+        if event_type in CREATIONS:
+            if self.status is not None:
+                self.anomalies += 1
+            self.status = CREATIONS[event_type]
+        elif event_type in TRANSITIONS:
+            t = TRANSITIONS[event_type]
+            if self.status not in t.from_states:
+                self.anomalies += 1
+            if t.to_state is not None:
+                self.status = t.to_state
+        else:
+            self.anomalies += 1
+            return
+
+        if event_type in CONTRACTOR_FROM_PAYLOAD:
+            self.contractor_id = payload.get("contractor_id", UNKNOWN)
+        elif event_type in CONTRACTOR_CLEARED:
+            self.contractor_id = None
+        if event_type in REPORT_FROM_PAYLOAD:
+            self.report_file = payload.get("report_file", UNKNOWN)
+
+    def copy_row(self) -> tuple:
+        return (
+            self.job_id,
+            self.status,
+            self.contractor_id is not UNKNOWN,
+            None if self.contractor_id is UNKNOWN else self.contractor_id,
+            self.report_file is not UNKNOWN,
+            None if self.report_file is UNKNOWN else self.report_file,
+        )
+
+
+async def stream_projections(conn, job_id: Optional[int]):
+    where = "WHERE job_id = %(job_id)s" if job_id is not None else ""
+    current: Optional[Projection] = None
+    async with conn.transaction():
+        async with conn.cursor(name="replay_events") as cur:
+            await cur.execute(
+                f"SELECT job_id, event_type, payload FROM job_events {where} ORDER BY job_id, id",
+                {"job_id": job_id},
+            )
+            async for ev_job_id, event_type, payload in cur:
+                if current is None or current.job_id != ev_job_id:
+                    if current is not None:
+                        yield current
+                    current = Projection(ev_job_id)
+                current.apply(event_type, payload or {})
+    if current is not None:
+        yield current
+
+
+async def replay(conninfo: str = DATABASE_URL, job_id: Optional[int] = None, dry_run: bool = False) -> dict:
+    stats = Counter()
+    statuses = Counter()
+    async with await psycopg.AsyncConnection.connect(conninfo) as reader, \
+            await psycopg.AsyncConnection.connect(conninfo) as writer:
+        await writer.execute(
+            """
+            CREATE TEMP TABLE replay_projection (
+                job_id INT PRIMARY KEY, status TEXT,
+                contractor_known BOOLEAN, contractor_id INT,
+                report_known BOOLEAN, report_file TEXT
+            ) ON COMMIT DROP
+            """
+        )
+        async with writer.cursor().copy(
+            "COPY replay_projection (job_id, status, contractor_known, contractor_id,"
+            " report_known, report_file) FROM STDIN"
+        ) as copy:
+            async for p in stream_projections(reader, job_id):
+                if not p.complete:
+                    stats["incomplete"] += 1
+                    continue
+                await copy.write_row(p.copy_row())
+                stats["jobs"] += 1
+                stats["anomalies"] += p.anomalies
+                statuses[p.status] += 1
+
+        cur = await writer.execute(
+            """
+            UPDATE jobs j SET
+                status = r.status,
+                version = j.version + 1,
+                contractor_id = CASE WHEN r.contractor_known THEN r.contractor_id ELSE j.contractor_id END,
+                report_file = CASE WHEN r.report_known THEN r.report_file ELSE j.report_file END
+            FROM replay_projection r
+            WHERE j.id = r.job_id
+              AND (j.status IS DISTINCT FROM r.status
+                   OR (r.contractor_known AND j.contractor_id IS DISTINCT FROM r.contractor_id)
+                   OR (r.report_known AND j.report_file IS DISTINCT FROM r.report_file))
+            """
+        )
+        stats["jobs_changed"] = cur.rowcount
+
+        if dry_run:
+            await writer.rollback()
+        else:
+            await writer.commit()
+
+    return {"stats": dict(stats), "statuses": dict(statuses)}
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="從 job_events 重建案件 projection")
+    parser.add_argument("--job", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(replay(job_id=args.job, dry_run=args.dry_run))
+    s = result["stats"]
+    print(f"案件 {s.get('jobs', 0)} 筆，不合法的轉換 {s.get('anomalies', 0)} 筆")
+    if s.get("incomplete"):
+        print(f"建立事件已被封存、沒有重建的案件 {s['incomplete']} 筆")
+    print(f"{'（dry-run）' if args.dry_run else ''}狀態/承包人/檔案需修正 {s.get('jobs_changed', 0)} 筆")
+    for status, n in sorted(result["statuses"].items(), key=lambda kv: -kv[1]):
+        print(f"  {status}: {n}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,398 @@
+# 資料存取層：所有 SQL 都集中在這裡，以「名稱」登錄成 Statement。
+#
+# handler 不再自己組 SQL 字串，而是：
+#     job = await repo.fetchone(conn, "job_detail", job_id=job_id)
+# 好處：
+#   1. 每個 statement 都用 prepare=True 執行，psycopg 會在每條連線上建立 server-side
+#      prepared statement，之後同一條連線再執行時不用重新 parse / plan。
+#   2. 查詢結果直接建成 models.py 裡的 slots dataclass，而不是 dict。
+#   3. explain_check.py 可以直接從 STATEMENTS 取得所有 SQL。
+# SQL 參數一律用 %(name)s 具名參數。
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Optional
+
+from psycopg.rows import class_row, dict_row
+
+import tracing
+
+from models import (
+    BidAcceptLookupRow,
+    BidRow,
+    ClientJobRow,
+    ContractorOption,
+    DetailKeyRow,
+    EventRow,
+    IdRow,
+    InvitationRow,
+    JobDetailRow,
+    JobStateRow,
+    LoginRow,
+    MyJobRow,
+    OpenJobRow,
+    RejectionRow,
+    ResultFileRow,
+    UploadLookupRow,
+    UsernameRow,
+)
+
+
+@dataclass(frozen=True, slots=True)
+class Statement:
+    name: str
+    sql: str
+    row: Optional[type] = None  # None 表示不回傳資料列（INSERT / UPDATE）
+
+
+STATEMENTS: dict[str, Statement] = {}
+
+
+def statement(name: str, sql: str, row: Optional[type] = None) -> Statement:
+    if name in STATEMENTS:
+        raise ValueError(f"statement {name!r} 重複登錄")
+    stmt = Statement(name, sql, row)
+    STATEMENTS[name] = stmt
+    return stmt
+
+
+def _row_factory(stmt: Statement):
+    return class_row(stmt.row) if stmt.row is not None else dict_row
+
+
+# 每次執行都是一個 tracing span（statement 名稱、列數），沒被抽樣的 request 不會記錄
+async def fetchall(conn, name: str, /, **params: Any) -> list:
+    stmt = STATEMENTS[name]
+    with tracing.span("sql", statement=name) as span:
+        async with conn.cursor(row_factory=_row_factory(stmt)) as cur:
+            await cur.execute(stmt.sql, params, prepare=True)
+            rows = await cur.fetchall()
+        span.set(rows=len(rows))
+    return rows
+
+
+# 長列表用：server-side（named）cursor 每次 fetchmany 一批，一批一批交給呼叫端，
+# 不必等整個結果集讀進記憶體。named cursor 只在 transaction 裡有效，整個讀取期間會佔住連線
+async def stream(conn, name: str, /, batch_size: int, **params: Any) -> AsyncIterator[list]:
+    stmt = STATEMENTS[name]
+    with tracing.span("sql", statement=name) as span:
+        total = 0
+        async with conn.transaction():
+            async with conn.cursor(name=f"stream_{name}", row_factory=_row_factory(stmt)) as cur:
+                await cur.execute(stmt.sql, params)
+                while rows := await cur.fetchmany(batch_size):
+                    total += len(rows)
+                    yield rows
+        span.set(rows=total)
+
+
+async def fetchone(conn, name: str, /, **params: Any):
+    stmt = STATEMENTS[name]
+    with tracing.span("sql", statement=name) as span:
+        async with conn.cursor(row_factory=_row_factory(stmt)) as cur:
+            await cur.execute(stmt.sql, params, prepare=True)
+            row = await cur.fetchone()
+        span.set(rows=int(row is not None))
+    return row
+
+
+async def execute(conn, name: str, /, **params: Any) -> int:
+    stmt = STATEMENTS[name]
+    with tracing.span("sql", statement=name) as span:
+        async with conn.cursor() as cur:
+            await cur.execute(stmt.sql, params, prepare=True)
+            rowcount = cur.rowcount
+        span.set(rows=rowcount)
+    return rowcount
+
+
+# ========== 使用者 / 登入 ==========
+
+# 承包人註冊時一併建立推薦用的 profile（見 rollup.py）
+statement(
+    "user_insert",
+    """
+    WITH created AS (
+        INSERT INTO users (username, password_hash, role)
+        VALUES (%(username)s, %(password_hash)s, %(role)s)
+        RETURNING id, username, role
+    )
+    INSERT INTO contractor_profiles (contractor_id, username)
+    SELECT id, username FROM created WHERE role = 'contractor'
+    """,
+)
+
+statement(
+    "user_login",
+    "SELECT id, role, username FROM users WHERE username = %(username)s AND password_hash = %(password_hash)s",
+    LoginRow,
+)
+
+statement(
+    "contractor_username",
+    "SELECT username FROM users WHERE id = %(contractor_id)s AND role = 'contractor'",
+    UsernameRow,
+)
+
+statement(
+    "contractors_list",
+    "SELECT id, username FROM users WHERE role = 'contractor' ORDER BY username",
+    ContractorOption,
+)
+
+
+# ========== 案件列表 ==========
+# 報價數直接數 bids：(job_id, contractor_id) 的 unique index 可以 index-only scan，
+# 報價 commit 的當下就是正確的數字，也不需要一列讓同時報價的人搶著更新的計數器
+
+statement(
+    "client_jobs",
+    """
+    SELECT j.id, j.title, j.status, j.created_at,
+           (SELECT COUNT(*) FROM bids b WHERE b.job_id = j.id)::int AS bid_count,
+           u_con.username AS contractor_name
+    FROM jobs j
+    LEFT JOIN users u_con ON j.contractor_id = u_con.id
+    WHERE j.client_id = %(client_id)s
+    ORDER BY j.id DESC
+    """,
+    ClientJobRow,
+)
+
+statement(
+    "contractor_open_jobs",
+    """
+    SELECT
+        j.id, j.title, j.status, j.version, j.created_at,
+        u.username AS client_name,
+        (SELECT COUNT(*) FROM bids b WHERE b.job_id = j.id)::int AS bid_count,
+        mb.price AS my_bid_price
+    FROM jobs j
+    JOIN users u ON u.id = j.client_id
+    LEFT JOIN LATERAL (
+        SELECT price FROM bids WHERE job_id = j.id AND contractor_id = %(contractor_id)s LIMIT 1
+    ) mb ON TRUE
+    WHERE j.status = 'pending'
+      AND j.client_id <> %(contractor_id)s
+      AND (j.due_date IS NULL OR j.due_date >= CURRENT_DATE)
+    ORDER BY j.id DESC
+    """,
+    OpenJobRow,
+)
+
+statement(
+    "contractor_my_jobs",
+    """
+    SELECT
+        j.id, j.title, j.status, j.updated_at,
+        u.username AS client_name,
+        b.price AS my_bid_price,
+        (j.contractor_id = %(contractor_id)s) AS am_i_winner
+    FROM jobs j
+    LEFT JOIN bids b ON b.job_id = j.id AND b.contractor_id = %(contractor_id)s
+    JOIN users u ON u.id = j.client_id
+    -- 報價過的案件與得標 / 接受邀請的案件，兩邊各走自己的索引，再用陣列以 primary key 找案件
+    -- （寫成 OR 條件或 JOIN 子查詢都會掃整張 jobs）
+    WHERE j.id = ANY(ARRAY(
+        SELECT job_id FROM bids WHERE contractor_id = %(contractor_id)s
+        UNION
+        SELECT id FROM jobs WHERE contractor_id = %(contractor_id)s AND status <> 'invited'
+    ))
+    ORDER BY j.updated_at DESC
+    """,
+    MyJobRow,
+)
+
+statement(
+    "contractor_my_invitations",
+    """
+    SELECT
+        j.id, j.title, j.budget, j.due_date, j.created_at,
+        u.username AS client_name
+    FROM jobs j
+    JOIN users u ON u.id = j.client_id
+    WHERE j.status = 'invited'
+      AND j.contractor_id = %(contractor_id)s
+    ORDER BY j.created_at DESC
+    """,
+    InvitationRow,
+)
+
+
+# ========== 案件鎖定 / 檢查 ==========
+# 狀態轉換（UPDATE jobs + INSERT job_events）由 job_state.py 產生並登錄。
+# 選標、上傳結案檔案先用下面的唯讀查詢做檢查（不上鎖），
+# 真正上鎖的只有狀態轉換那一條 SQL，它的 guard 會在鎖住之後再確認一次。
+
+# 報價失敗時用來說明原因（不上鎖，報價本身由 event:BID_SUBMITTED 一條 SQL 完成）
+statement(
+    "job_bid_check",
+    "SELECT id, client_id, status, due_date, version FROM jobs WHERE id = %(job_id)s",
+    JobStateRow,
+)
+
+# 選標前的檢查：案件、被選中的報價與承包人帳號一次查出（報價不屬於此案件時 bid 欄位為 NULL）
+statement(
+    "bid_accept_lookup",
+    """
+    SELECT j.status, j.due_date, b.contractor_id, b.price, u.username AS contractor_username
+    FROM jobs j
+    LEFT JOIN bids b ON b.id = %(bid_id)s AND b.job_id = j.id
+    LEFT JOIN users u ON u.id = b.contractor_id
+    WHERE j.id = %(job_id)s AND j.client_id = %(client_id)s
+    """,
+    BidAcceptLookupRow,
+)
+
+# 上傳結案檔案前的檢查：只查案件狀態（不上鎖）；成果檔案的版本號在 REPORT_UPLOADED 寫入時才決定（見 job_state.py）
+statement(
+    "upload_lookup",
+    """
+    SELECT j.status
+    FROM jobs j
+    WHERE j.id = %(job_id)s AND j.contractor_id = %(contractor_id)s
+    """,
+    UploadLookupRow,
+)
+
+statement(
+    "job_lock_uploaded_for_client",
+    "SELECT id FROM jobs WHERE id = %(job_id)s AND client_id = %(client_id)s AND status = 'uploaded' FOR UPDATE",
+    IdRow,
+)
+
+statement(
+    "job_lock_invited_for_contractor",
+    "SELECT id FROM jobs WHERE id = %(job_id)s AND contractor_id = %(contractor_id)s AND status = 'invited' FOR UPDATE",
+    IdRow,
+)
+
+
+# ========== 報價 ==========
+
+# 案件的全部報價（案件詳情快取，依角色篩選見 routes_job.job_detail_view）
+statement(
+    "job_bids",
+    """
+    SELECT b.id, b.price, b.note, b.contractor_id,
+           u.username AS contractor_name,
+           b.created_at,
+           b.proposal_file,
+           b.proposal_original_name
+    FROM bids b
+    JOIN users u ON u.id = b.contractor_id
+    WHERE b.job_id = %(job_id)s
+    ORDER BY b.price ASC, b.id
+    """,
+    BidRow,
+)
+
+
+# ========== 結案檔案 ==========
+
+statement(
+    "job_result_files",
+    """
+    SELECT id, version, file_path, original_name, uploaded_at, contractor_id
+    FROM job_result_files
+    WHERE job_id = %(job_id)s
+    ORDER BY version ASC
+    """,
+    ResultFileRow,
+)
+
+
+# ========== 案件詳情 / 歷史紀錄 ==========
+
+statement(
+    "job_detail",
+    """
+    SELECT j.id, j.title, j.content, j.client_id, j.contractor_id, j.status, j.version, j.budget,
+           j.due_date, j.report_file, j.created_at, j.updated_at,
+           u.username AS client_name, u_con.username AS contractor_name
+    FROM jobs j
+    JOIN users u ON u.id = j.client_id
+    LEFT JOIN users u_con ON j.contractor_id = u_con.id
+    WHERE j.id = %(job_id)s
+    """,
+    JobDetailRow,
+)
+
+# 案件詳情快取的 key：案件內容、報價、成果檔案的每次變更都會寫入事件（job_state.py），
+# replay.py 修正案件時則是 version + 1。事件依 created_at 分 partition，以案件建立時間當下限。
+statement(
+    "job_detail_key",
+    """
+    SELECT j.version, e.events, e.last_event_id
+    FROM jobs j
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS events, MAX(id) AS last_event_id
+        FROM job_events
+        WHERE job_id = j.id AND created_at >= j.created_at
+    ) e
+    WHERE j.id = %(job_id)s
+    """,
+    DetailKeyRow,
+)
+
+statement(
+    "job_last_rejection",
+    """
+    SELECT message
+    FROM job_events
+    WHERE job_id = %(job_id)s AND event_type = 'JOB_REJECTED' AND created_at >= %(job_created_at)s
+    ORDER BY created_at DESC
+    LIMIT 1
+    """,
+    RejectionRow,
+)
+
+# job_events 依 created_at 分月 partition（見 partitions.py）：事件不會早於案件建立，
+# 以相關案件中最早的 created_at 當下限，執行時就只掃那之後的 partition。
+# history_since 是呼叫端另外指定的下限（只補新事件時用），NULL 時 GREATEST 會忽略它
+_EVENT_COLUMNS = """
+    e.id, e.job_id, e.actor_id, e.event_type, e.message, e.description, e.created_at,
+    j.title AS job_title, u.username AS actor_name
+"""
+
+statement(
+    "history_client",
+    f"""
+    SELECT {_EVENT_COLUMNS}
+    FROM job_events e
+    JOIN jobs j ON e.job_id = j.id
+    LEFT JOIN users u ON e.actor_id = u.id
+    WHERE j.client_id = %(user_id)s
+      AND e.created_at >= GREATEST(
+          (SELECT MIN(created_at) FROM jobs WHERE client_id = %(user_id)s), %(history_since)s::timestamptz
+      )
+    ORDER BY e.created_at DESC
+    """,
+    EventRow,
+)
+
+statement(
+    "history_contractor",
+    f"""
+    WITH mine AS (
+        SELECT ARRAY(
+            SELECT job_id FROM bids WHERE contractor_id = %(user_id)s
+            UNION
+            SELECT id FROM jobs WHERE contractor_id = %(user_id)s
+        ) AS ids
+    )
+    SELECT {_EVENT_COLUMNS}
+    FROM mine
+    JOIN jobs j ON j.id = ANY(mine.ids)
+    JOIN job_events e ON e.job_id = j.id
+    LEFT JOIN users u ON e.actor_id = u.id
+    -- 以陣列比對案件 id，jobs 與 job_events 都走索引（用 IN (CTE) 時會 hash join 整張 jobs）
+    WHERE e.created_at >= GREATEST(
+        (SELECT MIN(created_at) FROM jobs, mine WHERE id = ANY(mine.ids)), %(history_since)s::timestamptz
+    )
+    AND (
+        e.event_type <> 'BID_SUBMITTED'
+        OR (e.event_type = 'BID_SUBMITTED' AND e.actor_id = %(user_id)s)
+    )
+    ORDER BY e.created_at DESC
+    """,
+    EventRow,
+)
@@ -0,0 +1,23 @@
+# 快速 JSON 回應
+#
+# 路由直接 return dict 時，FastAPI 會先跑 jsonable_encoder 把每一個值（包含 datetime）走過一遍，
+# 再交給 json.dumps，資料列一多（/history、/contractor/jobs）序列化就吃掉大部分 CPU。
+# 列表類的端點改成直接回傳 FastJSONResponse(...)：跳過 jsonable_encoder，
+# 由 orjson 直接序列化 models.py 的 slots dataclass 與 date / datetime。
+# 序列化本身在 fast_json.py（沒裝 orjson 時退回標準 json，較慢但輸出相同）。
+from typing import Any
+
+from fastapi.responses import Response
+
+import tracing
+from fast_json import dumps
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        with tracing.span("json.render") as span:
+            body = dumps(content)
+            span.set(bytes=len(body))
+        return body
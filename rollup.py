@@ -0,0 +1,396 @@
+# 統計 rollup：依 watermark 增量累加 job_events 到
+#   stats：stats_daily / stats_clients / stats_contractors
+#   contractor_profiles：承包人推薦用的 profile（/contractors/recommend）
+#
+# 每個 rollup 有自己的 watermark（rollup_watermarks.name），每次 refresh 只處理 id 大於 watermark 的一批事件：
+#   1. 鎖住 rollup_watermarks 的那一列（多個程序同時跑也只有一個在累加）
+#   2. 取出下一批事件的 id，只處理不超過 safe_event_id 的部分（見下方「fence」），
+#      避免比較早拿到 id、但還沒 commit 的交易被 watermark 跳過
+#   3. 每張表各一條 INSERT ... ON CONFLICT DO UPDATE 把這批的計數加上去，最後推進 watermark
+# 全部在同一個 transaction 裡，中途失敗不會重複累加。
+# /stats 端點只讀這幾張小表，與歷史資料量無關。
+#
+# fence：事件 id 是 sequence 依序發的，但 commit 的順序不一定，不能只靠寫入時間判斷（交易可能拖很久才 commit）。
+# 每次 refresh 記下「目前發到的最後一個 id」與當下 snapshot 的 xmax（還沒發出去的第一個 xid）；
+# 等到之後某次 refresh 的 snapshot xmin 超過這個 xmax，當時進行中的交易都已結束（commit 或 rollback），
+# 不超過那個 id 的事件就不會再出現，safe_event_id 才推進到那裡。
+# 寫事件的 SQL 都是先改 jobs / bids（已經拿到 xid）才取得事件 id，所以拿到 id 的交易一定在 xmax 之前。
+#
+# 用法：python rollup.py       追到最新為止
+# 由背景工作 worker 定期執行（rollup.refresh，見 tasks.py；python -m tasks 或 BACKGROUND_TASKS=1 的 app）
+import asyncio
+import sys
+from datetime import date, timedelta
+from typing import Optional
+
+import repo
+from db import close_pool, get_pool
+from models import ContractorRecommendation, IdRow, RollupMarkRow, StatsDayRow, StatsRow
+
+BATCH_SIZE = 5_000
+INTERVAL_SECONDS = 30
+
+# 統計欄位 → 這批事件的彙總算式（batch 的欄位見 _BATCH）
+METRICS = {
+    "jobs_created": "COUNT(*) FILTER (WHERE event_type IN ('JOB_CREATED', 'JOB_INVITED'))",
+    # 同一個承包人重新報價不重複計算；0003 以前的事件沒有 new_bid，視為新報價
+    "bids_submitted": "COUNT(*) FILTER (WHERE event_type = 'BID_SUBMITTED' AND COALESCE((payload->>'new_bid')::boolean, TRUE))",
+    "bids_selected": "COUNT(*) FILTER (WHERE event_type = 'BID_SELECTED')",
+    "reports_uploaded": "COUNT(*) FILTER (WHERE event_type IN ('REPORT_UPLOADED', 'REPORT_RE_UPLOADED'))",
+    "jobs_rejected": "COUNT(*) FILTER (WHERE event_type = 'JOB_REJECTED')",
+    "jobs_closed": "COUNT(*) FILTER (WHERE event_type = 'JOB_CLOSED')",
+    "win_priced": "COUNT(*) FILTER (WHERE event_type = 'BID_SELECTED' AND win_price IS NOT NULL)",
+    "win_price_sum": "COALESCE(SUM(win_price), 0)",
+    "win_budget_sum": "COALESCE(SUM(budget) FILTER (WHERE win_price IS NOT NULL), 0)",
+    "win_budget_price_sum": "COALESCE(SUM(win_price) FILTER (WHERE budget IS NOT NULL), 0)",
+    "select_seconds_sum": "COALESCE(SUM(EXTRACT(EPOCH FROM created_at - job_created_at)) FILTER (WHERE event_type = 'BID_SELECTED'), 0)",
+    "close_seconds_sum": "COALESCE(SUM(EXTRACT(EPOCH FROM created_at - job_created_at)) FILTER (WHERE event_type = 'JOB_CLOSED'), 0)",
+}
+
+_BATCH = """
+    SELECT e.event_type, e.created_at, e.payload,
+           CASE WHEN e.event_type = 'BID_SELECTED' THEN (e.payload->>'price')::bigint END AS win_price,
+           j.budget, j.created_at AS job_created_at, j.client_id,
+           -- 報價事件算在報價的承包人身上，建立案件不算任何承包人，
+           -- 其餘算在得標的承包人（選標之後就不會再變）
+           CASE WHEN e.event_type = 'BID_SUBMITTED' THEN e.actor_id
+                WHEN e.event_type IN ('JOB_CREATED', 'JOB_INVITED') THEN NULL
+                ELSE COALESCE((e.payload->>'contractor_id')::int, j.contractor_id) END AS contractor_key
+    FROM job_events e
+    JOIN jobs j ON j.id = e.job_id
+    WHERE e.id > %(after)s AND e.id <= %(upto)s
+"""
+
+# rollup 表 → (key 欄位, batch 裡對應的算式)
+TARGETS = {
+    "stats_daily": ("day", "created_at::date"),
+    "stats_clients": ("client_id", "client_id"),
+    "stats_contractors": ("contractor_id", "contractor_key"),
+}
+
+
+def _accumulate_sql(table: str, key: str, key_expr: str) -> str:
+    columns = ", ".join(METRICS)
+    aggregates = ",\n           ".join(f"{expr} AS {col}" for col, expr in METRICS.items())
+    updates = ",\n        ".join(f"{col} = {table}.{col} + EXCLUDED.{col}" for col in METRICS)
+    return f"""
+    WITH batch AS ({_BATCH})
+    INSERT INTO {table} ({key}, {columns})
+    SELECT {key_expr},
+           {aggregates}
+    FROM batch
+    WHERE {key_expr} IS NOT NULL
+    GROUP BY 1
+    ON CONFLICT ({key}) DO UPDATE SET
+        {updates}
+    """
+
+
+for _table, (_key, _expr) in TARGETS.items():
+    repo.statement(f"rollup:{_table}", _accumulate_sql(_table, _key, _expr))
+
+
+# ========== 承包人 profile ==========
+# 報價 / 接受邀請的案件文字併進 document；得標、結案、退件算在當時的承包人身上
+PROFILE_TEXT_CHARS = 2_000
+
+repo.statement(
+    "rollup:contractor_profiles",
+    f"""
+    WITH batch AS (
+        SELECT e.event_type, e.payload, j.title, j.content,
+               CASE WHEN e.event_type IN ('BID_SUBMITTED', 'INVITE_ACCEPTED') THEN e.actor_id
+                    WHEN e.event_type = 'BID_SELECTED' THEN (e.payload->>'contractor_id')::int
+                    WHEN e.event_type IN ('JOB_CLOSED', 'JOB_REJECTED')
+                        THEN COALESCE((e.payload->>'contractor_id')::int, j.contractor_id)
+               END AS contractor_id
+        FROM job_events e
+        JOIN jobs j ON j.id = e.job_id
+        WHERE e.id > %(after)s AND e.id <= %(upto)s
+    ),
+    per AS (
+        SELECT contractor_id,
+               COUNT(*) FILTER (WHERE event_type = 'BID_SUBMITTED' AND COALESCE((payload->>'new_bid')::boolean, TRUE)) AS bids,
+               COUNT(*) FILTER (WHERE event_type = 'BID_SELECTED') AS bids_won,
+               COUNT(*) FILTER (WHERE event_type = 'INVITE_ACCEPTED') AS invites_accepted,
+               COUNT(*) FILTER (WHERE event_type = 'JOB_CLOSED') AS jobs_closed,
+               COUNT(*) FILTER (WHERE event_type = 'JOB_REJECTED') AS jobs_rejected,
+               COUNT(*) FILTER (WHERE event_type = 'BID_SUBMITTED' AND payload ? 'price') AS priced,
+               COALESCE(SUM((payload->>'price')::bigint) FILTER (WHERE event_type = 'BID_SUBMITTED'), 0) AS price_sum,
+               strip(to_tsvector('simple', COALESCE(string_agg(
+                   DISTINCT left(title || ' ' || content, {PROFILE_TEXT_CHARS}), ' '
+               ) FILTER (WHERE event_type IN ('BID_SUBMITTED', 'INVITE_ACCEPTED')), ''))) AS document
+        FROM batch
+        WHERE contractor_id IS NOT NULL
+        GROUP BY contractor_id
+    )
+    INSERT INTO contractor_profiles AS p (
+        contractor_id, username, bids, bids_won, invites_accepted, jobs_closed, jobs_rejected,
+        priced, price_sum, document
+    )
+    SELECT per.contractor_id, u.username, per.bids, per.bids_won, per.invites_accepted,
+           per.jobs_closed, per.jobs_rejected, per.priced, per.price_sum, per.document
+    FROM per
+    JOIN users u ON u.id = per.contractor_id
+    ON CONFLICT (contractor_id) DO UPDATE SET
+        bids = p.bids + EXCLUDED.bids,
+        bids_won = p.bids_won + EXCLUDED.bids_won,
+        invites_accepted = p.invites_accepted + EXCLUDED.invites_accepted,
+        jobs_closed = p.jobs_closed + EXCLUDED.jobs_closed,
+        jobs_rejected = p.jobs_rejected + EXCLUDED.jobs_rejected,
+        priced = p.priced + EXCLUDED.priced,
+        price_sum = p.price_sum + EXCLUDED.price_sum,
+        document = strip(p.document || EXCLUDED.document),
+        updated_at = NOW()
+    """,
+)
+
+# watermark 名稱 → 每批要執行的累加 statement
+ROLLUPS = {
+    "stats": [f"rollup:{table}" for table in TARGETS],
+    "contractor_profiles": ["rollup:contractor_profiles"],
+}
+
+repo.statement(
+    "rollup:lock_watermark",
+    """
+    SELECT last_event_id, safe_event_id, fence_event_id,
+           fence_xid IS NULL OR fence_xid <= pg_snapshot_xmin(pg_current_snapshot()) AS fence_passed
+    FROM rollup_watermarks
+    WHERE name = %(name)s
+    FOR UPDATE
+    """,
+    RollupMarkRow,
+)
+
+# 先讀出發到的最後一個 id，下一條 statement 才取 snapshot（順序不能反過來）
+repo.statement(
+    "rollup:last_event_id",
+    "SELECT pg_sequence_last_value('job_events_id_seq') AS id",
+    IdRow,
+)
+
+repo.statement(
+    "rollup:set_fence",
+    """
+    UPDATE rollup_watermarks
+    SET safe_event_id = %(safe)s, fence_event_id = %(fence)s,
+        fence_xid = pg_snapshot_xmax(pg_current_snapshot())
+    WHERE name = %(name)s
+    """,
+)
+
+repo.statement(
+    "rollup:next_events",
+    """
+    SELECT id
+    FROM job_events
+    WHERE id > %(after)s AND id <= %(safe)s
+    ORDER BY id
+    LIMIT %(limit)s
+    """,
+    IdRow,
+)
+
+repo.statement(
+    "rollup:advance",
+    "UPDATE rollup_watermarks SET last_event_id = %(upto)s, updated_at = NOW() WHERE name = %(name)s",
+)
+
+_SUMS = ",\n           ".join(
+    f"COALESCE(SUM({col}), 0)::{'float8' if col.endswith('seconds_sum') else 'bigint'} AS {col}" for col in METRICS
+)
+
+repo.statement(
+    "stats_totals",
+    f"""
+    SELECT {_SUMS}
+    FROM stats_daily
+    WHERE day >= %(since)s
+    """,
+    StatsRow,
+)
+
+repo.statement(
+    "stats_days",
+    f"SELECT day, {', '.join(METRICS)} FROM stats_daily WHERE day >= %(since)s ORDER BY day",
+    StatsDayRow,
+)
+
+repo.statement(
+    "stats_client",
+    f"SELECT {', '.join(METRICS)} FROM stats_clients WHERE client_id = %(user_id)s",
+    StatsRow,
+)
+
+repo.statement(
+    "stats_contractor",
+    f"SELECT {', '.join(METRICS)} FROM stats_contractors WHERE contractor_id = %(user_id)s",
+    StatsRow,
+)
+
+
+# ========== 承包人推薦 ==========
+# 排序分數 = profile.score + 2 × 與新案件文字的相似度（ts_rank，依 document 長度正規化）。
+# 沒有前綴時只從「基本分數前 N 名」與「文字相符前 N 名」兩個 index 查詢的聯集裡排序，
+# 不必對所有承包人計算相似度；有前綴時只看帳號符合前綴的承包人。
+RECOMMEND_POOL = 200
+
+_RECOMMEND_COLUMNS = """
+    p.contractor_id AS id, p.username, p.bids, p.bids_won, p.invites_accepted,
+    p.jobs_closed, p.jobs_rejected,
+    round(p.bids_won::numeric / NULLIF(p.bids, 0), 2)::float8 AS win_rate,
+    round(p.jobs_closed::numeric / NULLIF(p.bids_won + p.invites_accepted, 0), 2)::float8 AS closure_rate,
+    (p.price_sum / NULLIF(p.priced, 0))::bigint AS avg_price,
+    COALESCE(ts_rank(p.document, q.query, 1), 0)::float8 AS relevance
+"""
+
+# 與 document 用同一個 parser 切詞，再把 AND 換成 OR：任一詞相符就算
+_QUERY = """
+    q AS (SELECT replace(plainto_tsquery('simple', %(text)s)::text, ' & ', ' | ')::tsquery AS query)
+"""
+
+repo.statement(
+    "contractor_recommend",
+    f"""
+    WITH {_QUERY},
+    candidates AS (
+        (SELECT contractor_id FROM contractor_profiles ORDER BY score DESC, username LIMIT {RECOMMEND_POOL})
+        UNION
+        (SELECT p.contractor_id FROM contractor_profiles p, q
+         WHERE p.document @@ q.query
+         ORDER BY ts_rank(p.document, q.query, 1) DESC
+         LIMIT {RECOMMEND_POOL})
+    ),
+    ranked AS (
+        SELECT {_RECOMMEND_COLUMNS}, p.score
+        FROM candidates c
+        JOIN contractor_profiles p ON p.contractor_id = c.contractor_id
+        CROSS JOIN q
+    )
+    SELECT * FROM ranked
+    ORDER BY score + 2 * relevance DESC, username
+    LIMIT %(limit)s
+    """,
+    ContractorRecommendation,
+)
+
+repo.statement(
+    "contractor_search",
+    f"""
+    WITH {_QUERY},
+    ranked AS (
+        SELECT {_RECOMMEND_COLUMNS}, p.score
+        FROM contractor_profiles p
+        CROSS JOIN q
+        WHERE lower(p.username) COLLATE "C" >= %(prefix)s
+          AND lower(p.username) COLLATE "C" < %(prefix_end)s
+    )
+    SELECT * FROM ranked
+    ORDER BY score + 2 * relevance DESC, username
+    LIMIT %(limit)s
+    """,
+    ContractorRecommendation,
+)
+
+
+# 新案件的標題 / 內容 → 比對用的文字；空白時回傳 None（相似度一律 0）
+def job_text(title: Optional[str], content: Optional[str]) -> Optional[str]:
+    text = " ".join(t.strip() for t in (title, content) if t and t.strip())
+    return text[:PROFILE_TEXT_CHARS] or None
+
+
+# 帳號前綴 → "C" collation 下的 [prefix, prefix_end) 範圍
+def prefix_range(prefix: str) -> tuple[str, str]:
+    prefix = prefix.lower()
+    return prefix, prefix + "\U0010ffff"
+
+
+# 處理某個 rollup 的一批事件，回傳這次累加了幾筆
+async def refresh(conn, name: str = "stats", batch_size: int = BATCH_SIZE) -> int:
+    async with conn.transaction():
+        mark = await repo.fetchone(conn, "rollup:lock_watermark", name=name)
+        if mark is None:
+            return 0
+        after, safe = mark.last_event_id, mark.safe_event_id
+        if mark.fence_passed:
+            if mark.fence_event_id is not None:
+                safe = max(safe, mark.fence_event_id)
+            last = await repo.fetchone(conn, "rollup:last_event_id")
+            await repo.execute(conn, "rollup:set_fence", name=name, safe=safe, fence=last.id)
+
+        rows = await repo.fetchall(conn, "rollup:next_events", after=after, safe=safe, limit=batch_size)
+        if not rows:
+            return 0
+        count = len(rows)
+        upto = rows[-1].id if count == batch_size else safe
+
+        for stmt in ROLLUPS[name]:
+            await repo.execute(conn, stmt, after=after, upto=upto)
+        await repo.execute(conn, "rollup:advance", name=name, upto=upto)
+    return count
+
+
+# 所有 rollup 都追到最新，回傳各自累加的事件數
+# 連續兩次沒有事件才停：第一次只是記下新的 fence，第二次 fence 通過後才能處理到那裡
+async def refresh_all(conn) -> dict[str, int]:
+    totals = {}
+    for name in ROLLUPS:
+        totals[name], idle = 0, 0
+        while idle < 2:
+            n = await refresh(conn, name)
+            totals[name] += n
+            idle = 0 if n else idle + 1
+    return totals
+
+
+# 背景工作（見 tasks.py）：每 INTERVAL_SECONDS 秒追到最新；同時跑也只有一個在累加（見 refresh）
+async def refresh_task(payload: dict) -> None:
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        await refresh_all(conn)
+
+
+TASKS = {
+    "rollup.refresh": {"run": refresh_task, "every": INTERVAL_SECONDS, "concurrency": 1, "max_attempts": 3},
+}
+
+
+# 把累加值換算成報表用的比率 / 平均
+def summarize(s: StatsRow) -> dict:
+    def ratio(a, b, scale=1.0):
+        return round(a / b / scale, 2) if b else None
+
+    return {
+        "jobs_created": s.jobs_created,
+        "bids_submitted": s.bids_submitted,
+        "bids_selected": s.bids_selected,
+        "jobs_closed": s.jobs_closed,
+        "jobs_rejected": s.jobs_rejected,
+        "bids_per_job": ratio(s.bids_submitted, s.jobs_created),
+        "avg_winning_price": ratio(s.win_price_sum, s.win_priced),
+        "winning_price_to_budget": ratio(s.win_budget_price_sum, s.win_budget_sum),
+        "avg_hours_to_bid_selected": ratio(s.select_seconds_sum, s.bids_selected, 3600),
+        "avg_hours_to_closed": ratio(s.close_seconds_sum, s.jobs_closed, 3600),
+        "rejection_rate": ratio(s.jobs_rejected, s.jobs_rejected + s.jobs_closed),
+    }
+
+
+def since_days(days: int) -> date:
+    return date.today() - timedelta(days=max(days, 1) - 1)
+
+
+async def _main() -> int:
+    pool = await get_pool()
+    try:
+        async with pool.connection() as conn:
+            totals = await refresh_all(conn)
+    finally:
+        await close_pool()
+    for name, total in totals.items():
+        print(f"rollup {name} 完成，累加 {total} 筆事件")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
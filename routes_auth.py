@@ -3,6 +3,7 @@ import hashlib
 from fastapi import APIRouter, Depends, Form, Request, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
 
+import repo
 from db import getDB
 from deps import session_user
 
@@ -24,17 +25,13 @@ async def register(
     # 密碼雜湊(加密)
     pwd_hash = hashlib.sha256(password.encode()).hexdigest()
 
-    async with conn.cursor() as cur:
-        try:
-            await cur.execute(
-                "INSERT INTO users (username, password_hash, role) VALUES (%s, %s, %s)",
-                (username, pwd_hash, role),
-            )
-        except Exception as e:
-            return HTMLResponse(
-                f"註冊失敗：{e}<br><a href='/registerForm.html'>回註冊</a>",
-                status_code=400,
-            )
+    try:
+        await repo.execute(conn, "user_insert", username=username, password_hash=pwd_hash, role=role)
+    except Exception as e:
+        return HTMLResponse(
+            f"註冊失敗：{e}<br><a href='/registerForm.html'>回註冊</a>",
+            status_code=400,
+        )
     return RedirectResponse(url="/loginForm.html", status_code=302)
 
 
@@ -46,12 +43,7 @@ async def login(
     conn=Depends(getDB),
 ):
     pwd_hash = hashlib.sha256(password.encode()).hexdigest()
-    async with conn.cursor() as cur:
-        await cur.execute(
-            "SELECT id, role, username FROM users WHERE username=%s AND password_hash=%s",
-            (username, pwd_hash),
-        )
-        user = await cur.fetchone()
+    user = await repo.fetchone(conn, "user_login", username=username, password_hash=pwd_hash)
 
     if not user:
         return HTMLResponse(
@@ -59,9 +51,9 @@ async def login(
             status_code=401,
         )
 
-    request.session["user_id"] = user["id"]
-    request.session["role"] = user["role"]
-    request.session["username"] = user["username"]
+    request.session["user_id"] = user.id
+    request.session["role"] = user.role
+    request.session["username"] = user.username
     return RedirectResponse(url="/", status_code=302)
 
 
@@ -0,0 +1,80 @@
+# 頁面初始化：登入身分與頁面要的資料一次拿齊
+#
+# 以前每個頁面都是先 await /me、再 fetch 資料 API，兩個 request 一前一後。
+#   GET /bootstrap?views=client_jobs,history&history_since=2026-10-01T00:00:00Z
+#   → {"me": {...}, "views": {"client_jobs": {...}, "history": {...}}, "errors": {}}
+# 每個 view 的內容與原本的 API 相同（/client/jobs、/history ...），頁面的繪製程式不用改。
+# 多個 view 各自從連線池借一條連線（有副本時走副本）用 asyncio.gather 同時查詢；
+# 某個 view 沒有權限或找不到資料時只有它放進 errors，其他照常回傳。
+# 不指定 views 就只回傳登入身分（取代 /me）。
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+
+from db import read_connection
+from deps import session_user
+from responses import FastJSONResponse
+from routes_client import client_jobs_view
+from routes_contractor import contractor_jobs_view, contractor_my_invitations_view, contractor_my_jobs_view
+from routes_job import history_view, job_detail_view
+
+router = APIRouter()
+
+
+@dataclass(frozen=True, slots=True)
+class View:
+    load: Callable[..., Awaitable[dict]]  # async def load(conn, user, **params) -> dict
+    role: Optional[str] = None            # 只有這個角色可以使用
+    params: tuple[str, ...] = ()          # 需要的 query 參數
+
+
+VIEWS = {
+    "client_jobs": View(client_jobs_view, "client"),
+    "contractor_jobs": View(contractor_jobs_view, "contractor"),
+    "my_jobs": View(contractor_my_jobs_view, "contractor"),
+    "invitations": View(contractor_my_invitations_view, "contractor"),
+    "history": View(history_view, params=("since",)),
+    "job_detail": View(job_detail_view, params=("job_id",)),
+}
+
+
+async def _run(request: Request, user: dict, view: View, params: dict):
+    if view.role is not None and user["role"] != view.role:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    async with read_connection(request) as conn:
+        return await view.load(conn, user, **{p: params[p] for p in view.params})
+
+
+@router.get("/bootstrap")
+async def bootstrap(
+    request: Request,
+    views: str = "",
+    job_id: Optional[int] = None,
+    history_since: Optional[datetime] = None,
+    user=Depends(session_user),
+):
+    names = [v.strip() for v in views.split(",") if v.strip()]
+    unknown = [n for n in names if n not in VIEWS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown views: {', '.join(unknown)}")
+    if "job_detail" in names and job_id is None:
+        raise HTTPException(status_code=400, detail="job_detail requires job_id")
+
+    params = {"job_id": job_id, "since": history_since}
+    results = await asyncio.gather(
+        *(_run(request, user, VIEWS[name], params) for name in names), return_exceptions=True
+    )
+
+    payload, errors = {}, {}
+    for name, result in zip(names, results):
+        if isinstance(result, HTTPException):
+            errors[name] = {"status": result.status_code, "detail": result.detail}
+        elif isinstance(result, BaseException):
+            # 其他 view 都已經結束（連線都已歸還），再照一般的 500 處理
+            raise result
+        else:
+            payload[name] = result
+    return FastJSONResponse({"me": user, "views": payload, "errors": errors})
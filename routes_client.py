@@ -1,47 +1,65 @@
+import logging
 from typing import Optional
 from datetime import date
 
-from fastapi import APIRouter, Depends, Form, Request, HTTPException
+from fastapi import APIRouter, Body, Depends, Form, Request, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
 
-from db import getDB
+import job_state
+import repo
+from rollup import job_text, prefix_range
+from db import getDB, getReadDB
 from deps import require_role
+from responses import FastJSONResponse
 
 router = APIRouter()
+log = logging.getLogger(__name__)
 
 
 # 取得承包人列表 (for 邀請)
 @router.get("/contractors/list")
 async def get_contractors_list(
     user=Depends(require_role("client")),
-    conn=Depends(getDB)
+    conn=Depends(getReadDB)
+):
+    rows = await repo.fetchall(conn, "contractors_list")
+    return FastJSONResponse({"items": rows})
+
+
+# 依新案件的標題 / 內容推薦承包人（得標率、結案率、過往案件文字相似度），
+# q 為帳號前綴，只回傳前 limit 名，給下拉選單逐字搜尋用。
+# 內容最長 5000 字，放在網址裡會超過 proxy 的長度限制、也會被記進 access log，所以用 POST 的 JSON body：
+#   {"q": "...", "title": "...", "content": "...", "limit": 10}
+# 只有讀取，不算寫入（見 main.py 的 READ_ONLY_POSTS）
+@router.post("/contractors/recommend")
+async def recommend_contractors(
+    q: str = Body("", max_length=50),
+    title: str = Body("", max_length=100),
+    content: str = Body("", max_length=5000),
+    limit: int = Body(10, ge=1, le=50),
+    user=Depends(require_role("client")),
+    conn=Depends(getReadDB),
 ):
-    async with conn.cursor() as cur:
-        await cur.execute(
-            "SELECT id, username FROM users WHERE role = 'contractor' ORDER BY username"
-        )
-        rows = await cur.fetchall()
-    return {"items": rows}
+    text = job_text(title, content)
+    prefix = q.strip()
+    if prefix:
+        lo, hi = prefix_range(prefix)
+        rows = await repo.fetchall(conn, "contractor_search", text=text, prefix=lo, prefix_end=hi, limit=limit)
+    else:
+        rows = await repo.fetchall(conn, "contractor_recommend", text=text, limit=limit)
+    return FastJSONResponse({"q": prefix, "count": len(rows), "items": rows})
 
 
 # 取得委託人自己的案件列表
 @router.get("/client/jobs")
-async def client_jobs(user=Depends(require_role("client")), conn=Depends(getDB)):
+async def client_jobs(user=Depends(require_role("client")), conn=Depends(getReadDB)):
+    return FastJSONResponse(await client_jobs_view(conn, user))
+
+
+# 也給 /bootstrap 使用（見 routes_bootstrap.py）
+async def client_jobs_view(conn, user) -> dict:
     uid = user["user_id"]
-    async with conn.cursor() as cur:
-        await cur.execute(
-            """
-            SELECT j.id, j.title, j.status, j.created_at,
-                   COALESCE((SELECT COUNT(*) FROM bids b WHERE b.job_id = j.id), 0) AS bid_count,
-                   u_con.username AS contractor_name
-            FROM jobs j
-            LEFT JOIN users u_con ON j.contractor_id = u_con.id
-            WHERE j.client_id = %s
-            ORDER BY j.id DESC
-            """,
-            (uid,),
-        )
-        rows = await cur.fetchall()
+    rows = await repo.fetchall(conn, "client_jobs", client_id=uid)
     return {"owner": uid, "count": len(rows), "items": rows}
 
 
@@ -99,52 +117,33 @@ async def job_new(
 
     try:
         async with conn.transaction():
-            async with conn.cursor() as cur:
-                job_status = 'pending'
-                contractor_id_to_insert = None
-                event_type = 'JOB_CREATED'
-                event_msg = f"案件「{title}」"
-                event_desc = f"委託人 {client_username} 建立了新案件「{title}」"
-
-                if invited_contractor_id:
-                    # 確認受邀者存在且為 contractor
-                    await cur.execute(
-                        "SELECT username FROM users WHERE id = %s AND role = 'contractor'",
-                        (invited_contractor_id,)
-                    )
-                    invited_user = await cur.fetchone()
-                    if not invited_user:
-                        return HTMLResponse("建立失敗：邀請的承包人不存在", status_code=400)
-
-                    job_status = 'invited'
-                    contractor_id_to_insert = invited_contractor_id
-                    event_type = 'JOB_INVITED'
-                    event_msg = f"邀請 {invited_user['username']}"
-                    event_desc = f"委託人 {client_username} 邀請 {invited_user['username']} 承接案件「{title}」"
-
-                # 新增 job
-                await cur.execute(
-                    """
-                    INSERT INTO jobs (title, content, client_id, status, budget, due_date, contractor_id)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    RETURNING id
-                    """,
-                    (title, content, client_id, job_status, budget, due_date, contractor_id_to_insert),
-                )
-                row = await cur.fetchone()
-                job_id = row["id"]
-
-                # 新增事件
-                await cur.execute(
-                    """
-                    INSERT INTO job_events (job_id, actor_id, event_type, message, description)
-                    VALUES (%s, %s, %s, %s, %s)
-                    """,
-                    (job_id, client_id, event_type, event_msg, event_desc),
-                )
+            contractor_id_to_insert = None
+            event_type = 'JOB_CREATED'
+            event_msg = f"案件「{title}」"
+            event_desc = f"委託人 {client_username} 建立了新案件「{title}」"
+
+            if invited_contractor_id:
+                # 確認受邀者存在且為 contractor
+                invited_user = await repo.fetchone(conn, "contractor_username", contractor_id=invited_contractor_id)
+                if not invited_user:
+                    return HTMLResponse("建立失敗：邀請的承包人不存在", status_code=400)
+
+                contractor_id_to_insert = invited_contractor_id
+                event_type = 'JOB_INVITED'
+                event_msg = f"邀請 {invited_user.username}"
+                event_desc = f"委託人 {client_username} 邀請 {invited_user.username} 承接案件「{title}」"
+
+            # 新增 job 與建立事件（同一條 SQL）
+            await job_state.create_job(
+                conn, event_type,
+                title=title, content=content, client_id=client_id,
+                budget=budget, due_date=due_date, contractor_id=contractor_id_to_insert,
+                message=event_msg, description=event_desc,
+            )
         return RedirectResponse(url="/clientJobs.html", status_code=302)
-    except Exception as e:
-        return HTMLResponse(f"建立案件失敗：{e}", status_code=500)
+    except Exception:
+        log.exception("job_new 失敗：client_id=%s", client_id)
+        return HTMLResponse("建立案件失敗，伺服器錯誤，請稍後再試", status_code=500)
 
 
 # 委託人選標（限：已到截止日）
@@ -160,64 +159,39 @@ async def bid_accept(
     client_username = user["username"]
 
     try:
+        # 先用唯讀查詢做檢查（不上鎖）：案件、報價、承包人帳號一次查出
         async with conn.transaction():
-            async with conn.cursor() as cur:
-                # 鎖住案件，並帶出截止日
-                await cur.execute(
-                    """
-                    SELECT id, due_date
-                    FROM jobs
-                    WHERE id = %s AND client_id = %s AND status = 'pending'
-                    FOR UPDATE
-                    """,
-                    (job_id, client_id)
-                )
-                job = await cur.fetchone()
-                if not job:
-                    raise HTTPException(status_code=403, detail="Job not found, not yours, or not in 'pending' state.")
-
-                # 若有設定截止日，必須到了之後才能選標
-                if job["due_date"] is not None and date.today() < job["due_date"]:
-                    raise HTTPException(status_code=400, detail="尚未到達投標截止日，暫時不能選標。")
-
-                # 找出被選中的報價
-                await cur.execute(
-                    "SELECT contractor_id, price FROM bids WHERE id=%s AND job_id=%s",
-                    (bid_id, job_id)
-                )
-                bid = await cur.fetchone()
-                if not bid:
-                    raise HTTPException(status_code=404, detail="Bid not found for this job.")
+            found = await repo.fetchone(conn, "bid_accept_lookup", job_id=job_id, bid_id=bid_id, client_id=client_id)
+        if not found or found.status != "pending":
+            raise HTTPException(status_code=403, detail="Job not found, not yours, or not in 'pending' state.")
 
-                contractor_id = bid["contractor_id"]
+        # 若有設定截止日，必須到了之後才能選標
+        if found.due_date is not None and date.today() < found.due_date:
+            raise HTTPException(status_code=400, detail="尚未到達投標截止日，暫時不能選標。")
 
-                await cur.execute("SELECT username FROM users WHERE id = %s", (contractor_id,))
-                contractor = await cur.fetchone()
-                contractor_username = contractor["username"] if contractor else f"#{contractor_id}"
+        if found.contractor_id is None:
+            raise HTTPException(status_code=404, detail="Bid not found for this job.")
 
-                # 更新 job 狀態
-                await cur.execute(
-                    "UPDATE jobs SET status = 'accepted', contractor_id = %s, updated_at = NOW() WHERE id = %s",
-                    (contractor_id, job_id)
-                )
+        contractor_id = found.contractor_id
+        contractor_username = found.contractor_username or f"#{contractor_id}"
 
-                # 寫入事件
-                await cur.execute(
-                    """
-                    INSERT INTO job_events (job_id, actor_id, event_type, message, description)
-                    VALUES (%s, %s, 'BID_SELECTED', %s, %s)
-                    """,
-                    (
-                        job_id,
-                        client_id,
-                        f"報價 #{bid_id}",
-                        f"委託人 {client_username} 選擇了承包人 {contractor_username} (報價ID: {bid_id}, 價格: {bid['price']})",
-                    )
-                )
+        # 上鎖的只有這一條：條件式更新 job 狀態並寫入事件（狀態、截止日、報價在鎖住後會再確認一次）
+        async with conn.transaction():
+            await job_state.apply(
+                conn, "BID_SELECTED",
+                job_id=job_id,
+                actor_id=client_id,
+                message=f"報價 #{bid_id}",
+                description=f"委託人 {client_username} 選擇了承包人 {contractor_username} (報價ID: {bid_id}, 價格: {found.price})",
+                contractor_id=contractor_id,
+                bid_id=bid_id,
+                price=found.price,
+            )
     except HTTPException as e:
         return HTMLResponse(f"選標失敗：{e.detail}", status_code=e.status_code)
-    except Exception as e:
-        return HTMLResponse(f"選標失敗，伺服器錯誤：{e}", status_code=500)
+    except Exception:
+        log.exception("bid_accept 失敗：job_id=%s bid_id=%s", job_id, bid_id)
+        return HTMLResponse("選標失敗，伺服器錯誤，請稍後再試", status_code=500)
 
     return RedirectResponse(url=f"/jobDetail.html?job_id={job_id}", status_code=302)
 
@@ -238,56 +212,33 @@ async def job_review(
 
     try:
         async with conn.transaction():
-            async with conn.cursor() as cur:
-                # 僅在 status = 'uploaded' 時可審核
-                await cur.execute(
-                    "SELECT id, report_file FROM jobs WHERE id = %s AND client_id = %s AND status = 'uploaded' FOR UPDATE",
-                    (job_id, client_id)
+            # 僅在 status = 'uploaded' 時可審核
+            job = await repo.fetchone(conn, "job_lock_uploaded_for_client", job_id=job_id, client_id=client_id)
+            if not job:
+                raise HTTPException(status_code=403, detail="Job not found, not yours, or not in 'uploaded' state.")
+
+            if decision == 'rejected':
+                # 退件：只改狀態，保留所有檔案（由 job_result_files 管理版本）
+                await job_state.apply(
+                    conn, "JOB_REJECTED",
+                    job_id=job_id,
+                    actor_id=client_id,
+                    message=message,
+                    description=f"委託人 {user['username']} 退件。理由：{message}",
+                )
+
+            else:  # 'closed'
+                await job_state.apply(
+                    conn, "JOB_CLOSED",
+                    job_id=job_id,
+                    actor_id=client_id,
+                    message="驗收結案",
+                    description=f"委託人 {user['username']} 驗收結案。",
                 )
-                job = await cur.fetchone()
-                if not job:
-                    raise HTTPException(status_code=403, detail="Job not found, not yours, or not in 'uploaded' state.")
-
-                if decision == 'rejected':
-                    # 退件：只改狀態，保留所有檔案（由 job_result_files 管理版本）
-                    await cur.execute(
-                        "UPDATE jobs SET status = 'rejected', updated_at = NOW() WHERE id = %s",
-                        (job_id,)
-                    )
-
-                    await cur.execute(
-                        """
-                        INSERT INTO job_events (job_id, actor_id, event_type, message, description)
-                        VALUES (%s, %s, 'JOB_REJECTED', %s, %s)
-                        """,
-                        (
-                            job_id,
-                            client_id,
-                            message,
-                            f"委託人 {user['username']} 退件。理由：{message}",
-                        )
-                    )
-
-                else:  # 'closed'
-                    await cur.execute(
-                        "UPDATE jobs SET status = %s, updated_at = NOW() WHERE id = %s",
-                        (decision, job_id)
-                    )
-                    await cur.execute(
-                        """
-                        INSERT INTO job_events (job_id, actor_id, event_type, message, description)
-                        VALUES (%s, %s, 'JOB_CLOSED', %s, %s)
-                        """,
-                        (
-                            job_id,
-                            client_id,
-                            "驗收結案",
-                            f"委託人 {user['username']} 驗收結案。",
-                        )
-                    )
     except HTTPException as e:
         return HTMLResponse(f"審核失敗：{e.detail}", status_code=e.status_code)
-    except Exception as e:
-        return HTMLResponse(f"審核失敗，伺服器錯誤：{e}", status_code=500)
+    except Exception:
+        log.exception("job_review 失敗：job_id=%s", job_id)
+        return HTMLResponse("審核失敗，伺服器錯誤，請稍後再試", status_code=500)
 
     return RedirectResponse(url=f"/jobDetail.html?job_id={job_id}", status_code=302)
@@ -0,0 +1,156 @@
+# 伺服器端渲染的頁面（SERVER_RENDER=1 時由 main.create_app 掛上，見 pages.py）
+# 網址與 www/ 的靜態頁面相同，內容與頁面上 JS 畫出來的表格一致；JSON API 不受影響。
+from datetime import datetime
+from urllib.parse import quote
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import RedirectResponse
+
+import repo
+from db import read_connection
+from deps import session_user
+from pages import BATCH_ROWS, compile_page, esc, render
+
+router = APIRouter()
+
+# 啟動時（import 這個模組時）就切好，之後每個 request 只做字串串接
+CLIENT_JOBS = compile_page("clientJobs.html", "jobsTable")
+CONTRACTOR_JOBS = compile_page("contractorJobs.html", "jobsTable")
+HISTORY = compile_page("history.html", "historyTable")
+
+NONE_CELL = '<span class="text-muted">—</span>'
+
+CLIENT_JOB_ROW = (
+    "<tr><td>{id}</td><td>{title}</td><td>{status}</td><td>{contractor}</td><td>{bid_count}</td>"
+    '<td><a class="btn btn-secondary btn-sm" href="/jobDetail.html?job_id={id}">查看詳情</a></td></tr>\n'
+)
+
+CONTRACTOR_JOB_ROW = (
+    '<tr><td>{id}</td><td><a href="/jobDetail.html?job_id={id}">{title}</a></td><td>{client}</td>'
+    "<td>{bid_count}</td><td>{my_bid}</td><td>{action}</td></tr>\n"
+)
+BID_LINK = '<a class="btn btn-primary btn-sm" href="/bidForm.html?job_id={id}&amp;title={title}&amp;version={version}">我要出價</a>'
+REBID_LINK = (
+    '<a class="btn btn-secondary btn-sm" '
+    'href="/bidForm.html?job_id={id}&amp;title={title}&amp;price={price}&amp;version={version}">更新報價</a>'
+)
+
+# 時間由頁面上的 JS 依瀏覽器的語系與時區改寫（與 fetch 模式的 toLocaleString 相同），沒有 JS 時顯示伺服器時間
+HISTORY_ROW = (
+    '<tr><td><time datetime="{iso}">{time}</time></td>'
+    '<td><a href="/jobDetail.html?job_id={job_id}">{job_id}</a></td><td>{job_title}</td>'
+    '<td><b>{event_type}</b></td><td class="note">{message}</td><td class="note">{description}</td>'
+    '<td class="text-muted">{actor}</td></tr>\n'
+)
+
+# 與 history.html 的 fmtEventType 相同
+EVENT_LABELS = {
+    "JOB_CREATED": "案件建立",
+    "JOB_INVITED": "發出邀請",
+    "INVITE_ACCEPTED": "接受邀請",
+    "INVITE_DECLINED": "婉拒邀請",
+    "BID_SUBMITTED": "提交報價",
+    "BID_SELECTED": "委託人選標",
+    "REPORT_UPLOADED": "上傳成果",
+    "REPORT_RE_UPLOADED": "重新上傳",
+    "JOB_REJECTED": "委託人退件",
+    "JOB_CLOSED": "驗收結案",
+}
+
+
+def _money(value) -> str:
+    return NONE_CELL if value is None else f"${value:,}"
+
+
+def _url_text(value: str) -> str:
+    # 與 JS 的 encodeURIComponent 相同的保留字元
+    return quote(value, safe="!~*'()")
+
+
+def client_job_row(j) -> str:
+    return CLIENT_JOB_ROW.format(
+        id=j.id,
+        title=esc(j.title),
+        status=esc(j.status),
+        contractor=esc(j.contractor_name) if j.contractor_name else NONE_CELL,
+        bid_count=j.bid_count or 0,
+    )
+
+
+def contractor_job_row(j) -> str:
+    title = esc(_url_text(j.title))
+    if j.my_bid_price is not None:
+        action = REBID_LINK.format(id=j.id, title=title, price=j.my_bid_price, version=j.version)
+    else:
+        action = BID_LINK.format(id=j.id, title=title, version=j.version)
+    return CONTRACTOR_JOB_ROW.format(
+        id=j.id,
+        title=esc(j.title),
+        client=esc(j.client_name),
+        bid_count=j.bid_count,
+        my_bid=_money(j.my_bid_price),
+        action=action,
+    )
+
+
+def history_row(e) -> str:
+    created_at: datetime = e.created_at
+    return HISTORY_ROW.format(
+        iso=created_at.isoformat(),
+        time=created_at.astimezone().strftime("%Y/%m/%d %H:%M:%S"),
+        job_id=e.job_id,
+        job_title=esc(e.job_title),
+        event_type=esc(EVENT_LABELS.get(e.event_type, e.event_type)),
+        message=esc(e.message),
+        description=esc(e.description),
+        actor=esc(e.actor_name) if e.actor_name else f"(System #{e.actor_id})",
+    )
+
+
+# 沒登入與 JS 版一樣導回登入頁；角色不符導回首頁（會依角色轉到對應的列表）
+def _page_user(request: Request, role=None):
+    try:
+        user = session_user(request)
+    except HTTPException:
+        return None, RedirectResponse(url="/loginForm.html", status_code=302)
+    if role is not None and user["role"] != role:
+        return None, RedirectResponse(url="/", status_code=302)
+    return user, None
+
+
+# 用 server-side cursor 分批讀取，每讀到一批就交給 render 送出（見 repo.stream）
+def _loader(request: Request, statement: str, **params):
+    async def load():
+        async with read_connection(request) as conn:
+            async for rows in repo.stream(conn, statement, BATCH_ROWS, **params):
+                yield rows
+
+    return load
+
+
+@router.get("/clientJobs.html")
+async def client_jobs_page(request: Request):
+    user, redirect = _page_user(request, "client")
+    if redirect:
+        return redirect
+    load = _loader(request, "client_jobs", client_id=user["user_id"])
+    return render(CLIENT_JOBS, user, load, client_job_row, "尚未建立任何案件")
+
+
+@router.get("/contractorJobs.html")
+async def contractor_jobs_page(request: Request):
+    user, redirect = _page_user(request, "contractor")
+    if redirect:
+        return redirect
+    load = _loader(request, "contractor_open_jobs", contractor_id=user["user_id"])
+    return render(CONTRACTOR_JOBS, user, load, contractor_job_row, "目前沒有可報價的案件")
+
+
+@router.get("/history.html")
+async def history_page(request: Request):
+    user, redirect = _page_user(request)
+    if redirect:
+        return redirect
+    statement = "history_client" if user["role"] == "client" else "history_contractor"
+    load = _loader(request, statement, user_id=user["user_id"], history_since=None)
+    return render(HISTORY, user, load, history_row, "目前沒有任何歷史紀錄")
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+import detail_cache
+import repo
+from db import getReadDB
+from deps import require_admin, session_user
+from responses import FastJSONResponse
+from rollup import since_days, summarize
+
+router = APIRouter()
+
+
+# 全站統計：最近 N 天的總計與每日明細
+@router.get("/stats/overview")
+async def stats_overview(
+    days: int = Query(30, ge=1, le=366),
+    user=Depends(session_user),
+    conn=Depends(getReadDB),
+):
+    since = since_days(days)
+    totals = await repo.fetchone(conn, "stats_totals", since=since)
+    rows = await repo.fetchall(conn, "stats_days", since=since)
+    return FastJSONResponse({
+        "since": since,
+        "totals": summarize(totals),
+        "days": [{"day": r.day, **summarize(r)} for r in rows],
+    })
+
+
+# 目前登入者自己的統計（委託人看自己發的案件，承包人看自己的報價與得標）
+@router.get("/stats/me")
+async def stats_me(user=Depends(session_user), conn=Depends(getReadDB)):
+    statement = "stats_client" if user["role"] == "client" else "stats_contractor"
+    row = await repo.fetchone(conn, statement, user_id=user["user_id"])
+    return FastJSONResponse({"user_id": user["user_id"], "role": user["role"], "stats": summarize(row) if row else None})
+
+
+# 某位承包人的統計（得標數、退件率等），給委託人選人時參考
+@router.get("/stats/contractors/{contractor_id}")
+async def stats_contractor(contractor_id: int, user=Depends(session_user), conn=Depends(getReadDB)):
+    row = await repo.fetchone(conn, "stats_contractor", user_id=contractor_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="No stats for this contractor")
+    return FastJSONResponse({"contractor_id": contractor_id, "stats": summarize(row)})
+
+
+# 案件詳情快取（detail_cache.py）的命中率與佔用空間，每個 process 各自一份（只有管理者可以看）
+@router.get("/stats/detail-cache")
+async def stats_detail_cache(user=Depends(require_admin)):
+    return FastJSONResponse(detail_cache.cache.stats())
@@ -0,0 +1,128 @@
+# 啟動時間分析（cold start）
+#
+#   1. import 時間：用 python -X importtime 在新的行程 import main 並建立 app（router 在 create_app 裡才 import），
+#      依模組列出累計 / 自身時間，本專案的模組另外列一張表
+#   2. 從 import main 到 ready、第一個 / 第二個 request 各花多久：在新的行程裡建立 app（create_app），
+#      跑 startup，等 /ready 之後送出兩次 POST /login（不存在的帳號，會查資料庫但不寫入），
+#      有預熱與沒有預熱各跑一次比較
+# 每一項都在全新的 Python 行程裡量，才是 autoscaling 新開機器時的情況。
+#
+# 用法：python startup_profile.py [--top 25] [--runs 3]
+# 單純想在正式啟動時看到數字：STARTUP_PROFILE=1 uvicorn main:app（ready 與第一個 request 會印出來）
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+
+# ========== import 時間 ==========
+
+# 只建立 app、不跑 startup（不連資料庫），量到的是 import main 加上 create_app 載入的 router
+IMPORT_SNIPPET = "import main; main.create_app(prewarm=False, background=False, check_schema=False)"
+
+
+def import_times() -> tuple[list[tuple[str, int, int]], int]:
+    # -X importtime 的輸出：import time: self [us] | cumulative | imported package
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_SNIPPET],
+        cwd=ROOT, capture_output=True, text=True, env={**os.environ, "STARTUP_PROFILE": "0"},
+    )
+    items = []
+    top_level_us = 0  # 最外層的 import（名稱沒有縮排）累計時間加總
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        items.append((name.strip(), int(self_us), int(cumulative_us)))
+        if name.startswith(" ") and not name.startswith("  "):
+            top_level_us += int(cumulative_us)
+    if not items:
+        raise RuntimeError(proc.stderr.strip() or "python -X importtime 沒有輸出")
+    return items, top_level_us
+
+
+def is_local(module: str) -> bool:
+    top = module.split(".")[0]
+    return (ROOT / f"{top}.py").exists() or (ROOT / top / "__init__.py").exists()
+
+
+def print_imports(items: list[tuple[str, int, int]], total: int, top: int) -> None:
+    print(f"import main + create_app 共 {total / 1000:.1f} ms\n")
+
+    print(f"累計時間前 {top} 名（含被它 import 的模組）")
+    print(f"{'module':<44}{'self ms':>10}{'cum ms':>10}")
+    for name, self_us, cumulative_us in sorted(items, key=lambda i: -i[2])[:top]:
+        print(f"{name:<44}{self_us / 1000:>10.1f}{cumulative_us / 1000:>10.1f}")
+
+    print("\n本專案的模組")
+    print(f"{'module':<44}{'self ms':>10}{'cum ms':>10}")
+    for name, self_us, cumulative_us in sorted((i for i in items if is_local(i[0])), key=lambda i: -i[2]):
+        print(f"{name:<44}{self_us / 1000:>10.1f}{cumulative_us / 1000:>10.1f}")
+
+
+# ========== 到 ready 與第一個 request ==========
+
+async def measure(prewarm: bool) -> dict:
+    import httpx
+
+    import main
+
+    app = main.create_app(prewarm=prewarm, background=False, profile=False)
+    result = {"import_ms": app.state.startup["import_ms"]}
+    async with app.router.lifespan_context(app):
+        while not app.state.ready:
+            await asyncio.sleep(0.002)
+        result["ready_ms"] = app.state.startup["ready_ms"]
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://profile") as client:
+            for key in ("first_ms", "second_ms"):
+                start = time.perf_counter()
+                r = await client.post("/login", data={"username": "startup-profile", "password": "-"})
+                result[key] = round((time.perf_counter() - start) * 1000, 1)
+                if r.status_code != 401:
+                    raise RuntimeError(f"POST /login 回傳 {r.status_code}：{r.text}")
+        result["served_ms"] = round((time.perf_counter() - main._IMPORT_STARTED) * 1000, 1)
+    return result
+
+
+def run_child(prewarm: bool) -> dict:
+    args = [sys.executable, __file__, "--child"] + ([] if prewarm else ["--no-prewarm"])
+    proc = subprocess.run(args, cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip())
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def print_startup(runs: int) -> None:
+    columns = [("import_ms", "import"), ("ready_ms", "ready"), ("first_ms", "1st req"),
+               ("second_ms", "2nd req"), ("served_ms", "served")]
+    print(f"\n從 import main 起算（ms，{runs} 次的中位數；1st / 2nd req 是單一 request 的時間）")
+    print(f"{'':<12}" + "".join(f"{label:>10}" for _, label in columns))
+    for prewarm in (False, True):
+        results = [run_child(prewarm) for _ in range(runs)]
+        row = [statistics.median(r[key] for r in results) for key, _ in columns]
+        print(f"{'prewarm' if prewarm else 'no prewarm':<12}" + "".join(f"{v:>10.1f}" for v in row))
+
+
+def main(args) -> int:
+    if args.child:
+        print(json.dumps(asyncio.run(measure(not args.no_prewarm))))
+        return 0
+    print_imports(*import_times(), args.top)
+    print_startup(args.runs)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="啟動時間分析")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--no-prewarm", action="store_true", help=argparse.SUPPRESS)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,431 @@
+# 背景工作佇列：工作存在 PostgreSQL 的 tasks 表（見 migrations/0008_tasks.sql）
+#
+#   enqueue(conn, kind, payload)   在呼叫端的 transaction 裡加入工作，commit 之後才會被執行
+#   處理函式                        async def run(payload: dict) -> None，寫在各自的模組裡，
+#                                  以模組層級的 TASKS = {kind: {"run": run, 其他 Handler 選項}} 提供，
+#                                  模組列在 HANDLER_MODULES（不必 import tasks，python -m tasks 時也不會重複載入）
+#   Worker(...).run()              領取並執行工作；正式環境用 python -m tasks 獨立執行，
+#                                  開發時也可以設定 BACKGROUND_TASKS=1 在 app 裡一起執行（main.py）
+#
+# 領取：一條 UPDATE ... FROM (SELECT ... FOR UPDATE SKIP LOCKED) 把工作改為 running 並設定租約，
+#       多個 worker 同時領取不會互相等待，也不會拿到同一筆。依 priority（大的先）→ run_at → id 的順序。
+# 喚醒：worker LISTEN tasks_queued，新增工作時由 trigger NOTIFY；另外每 POLL_SECONDS 秒檢查一次
+#       （延後執行、重試退避的工作，以及漏掉的通知）。
+# 結果：成功就刪除；失敗時 run_at 往後延（指數退避）改回 queued，超過 max_attempts 次改為 failed 保留錯誤訊息。
+#       worker 當掉時租約（timeout + LEASE_MARGIN_SECONDS）過期，由任何一個 worker 改回 queued。
+#       所以同一個工作可能執行不只一次，處理函式要能重複執行。
+# 並行：每個 worker 同時最多執行 concurrency 個工作，各種工作另外可以限制同時幾個（handler 的 concurrency）。
+# 定期工作：handler 設定 every 秒，完成後自動排入下一次；用 dedupe_key 確保同時只有一筆在等待 / 執行。
+#
+# 用法：
+#   python -m tasks [--concurrency 10] [--kinds rollup.refresh,...]   啟動 worker（Ctrl+C 結束），和 uvicorn 分開執行
+#   python -m tasks --status                                        各種工作的數量、失敗的工作
+#   python -m tasks --enqueue KIND [--payload '{"a": 1}']
+#
+# worker 的訊息（工作失敗含 traceback、重連、租約過期）用 logging；
+# python -m tasks 會設定輸出到 stderr，在 app 裡執行時沿用 uvicorn / app 的 logging 設定。
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+import psycopg
+from psycopg.types.json import Jsonb
+
+import repo
+from db import close_pool, get_pool
+from models import IdRow, TaskRow, TaskStatusRow
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "tasks_queued"
+POLL_SECONDS = 5.0
+LEASE_MARGIN_SECONDS = 30.0
+RETRY_BASE_SECONDS = 2.0
+RETRY_MAX_SECONDS = 600.0
+DEFAULT_CONCURRENCY = int(os.environ.get("TASK_CONCURRENCY", "4"))
+
+# 登錄了 handler 的模組，worker 啟動時 import
+HANDLER_MODULES = ("rollup", "partitions", "reconcile_uploads")
+
+
+@dataclass(frozen=True)
+class Handler:
+    kind: str
+    run: Callable[[dict], Awaitable[None]]
+    concurrency: Optional[int] = None  # 每個 worker 同時執行幾個；None 表示只受 worker 的 concurrency 限制
+    max_attempts: int = 5
+    timeout: float = 300.0
+    priority: int = 0
+    every: Optional[float] = None      # 定期工作：完成後過幾秒再執行一次
+
+
+HANDLERS: dict[str, Handler] = {}
+
+
+def register(kind: str, run: Callable[[dict], Awaitable[None]], **options) -> Handler:
+    if kind in HANDLERS:
+        raise ValueError(f"task {kind!r} 重複登錄")
+    HANDLERS[kind] = h = Handler(kind, run, **options)
+    return h
+
+
+def load_handlers() -> dict[str, Handler]:
+    for name in HANDLER_MODULES:
+        module = importlib.import_module(name)
+        for kind, options in getattr(module, "TASKS", {}).items():
+            if kind not in HANDLERS:
+                register(kind, **options)
+    return HANDLERS
+
+
+# ========== SQL ==========
+
+repo.statement(
+    "tasks:enqueue",
+    """
+    INSERT INTO tasks (kind, payload, priority, run_at, max_attempts, dedupe_key)
+    VALUES (%(kind)s, %(payload)s, %(priority)s, NOW() + make_interval(secs => %(delay)s),
+            %(max_attempts)s, %(dedupe_key)s)
+    ON CONFLICT (dedupe_key) WHERE dedupe_key IS NOT NULL AND status IN ('queued', 'running') DO NOTHING
+    RETURNING id
+    """,
+    IdRow,
+)
+
+# 每種工作最多領 slots 筆（同種工作的並行限制），全部合起來依優先度取前 limit 筆
+repo.statement(
+    "tasks:claim",
+    """
+    UPDATE tasks t
+    SET status = 'running', attempts = t.attempts + 1, locked_by = %(worker)s,
+        locked_until = NOW() + make_interval(secs => k.lease), updated_at = NOW()
+    FROM (
+        SELECT c.id, k.lease
+        FROM unnest(%(kinds)s::text[], %(slots)s::int[], %(leases)s::float8[]) AS k(kind, slots, lease)
+        CROSS JOIN LATERAL (
+            SELECT id, priority, run_at
+            FROM tasks
+            WHERE status = 'queued' AND kind = k.kind AND run_at <= NOW()
+            ORDER BY priority DESC, run_at, id
+            LIMIT k.slots
+            FOR UPDATE SKIP LOCKED
+        ) c
+        ORDER BY c.priority DESC, c.run_at, c.id
+        LIMIT %(limit)s
+    ) k
+    WHERE t.id = k.id
+    RETURNING t.id, t.kind, t.payload, t.attempts, t.max_attempts
+    """,
+    TaskRow,
+)
+
+repo.statement("tasks:done", "DELETE FROM tasks WHERE id = %(id)s AND locked_by = %(worker)s")
+
+repo.statement(
+    "tasks:fail",
+    """
+    UPDATE tasks
+    SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+        run_at = NOW() + make_interval(secs => %(delay)s),
+        last_error = %(error)s, locked_by = NULL, locked_until = NULL, updated_at = NOW()
+    WHERE id = %(id)s AND locked_by = %(worker)s
+    """,
+)
+
+# worker 結束時把還沒做完的工作放回佇列，不算一次失敗
+repo.statement(
+    "tasks:release",
+    """
+    UPDATE tasks
+    SET status = 'queued', attempts = attempts - 1, locked_by = NULL, locked_until = NULL, updated_at = NOW()
+    WHERE id = ANY(%(ids)s) AND locked_by = %(worker)s
+    """,
+)
+
+# 租約過期（worker 當掉或被中斷）的工作
+repo.statement(
+    "tasks:reap",
+    """
+    UPDATE tasks
+    SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+        last_error = 'lease expired (' || locked_by || ')', locked_by = NULL, locked_until = NULL, updated_at = NOW()
+    WHERE status = 'running' AND locked_until < NOW()
+    RETURNING id
+    """,
+    IdRow,
+)
+
+repo.statement(
+    "tasks:status",
+    """
+    SELECT kind, status, COUNT(*) AS count, MIN(run_at) AS next_run_at
+    FROM tasks
+    GROUP BY kind, status
+    ORDER BY kind, status
+    """,
+    TaskStatusRow,
+)
+
+
+async def enqueue(
+    conn,
+    kind: str,
+    payload: Optional[dict] = None,
+    *,
+    priority: Optional[int] = None,
+    delay: float = 0.0,
+    max_attempts: Optional[int] = None,
+    dedupe_key: Optional[str] = None,
+) -> Optional[int]:
+    # 沒有登錄 handler 的工作也可以加入（handler 可能只在獨立的 worker 裡登錄），預設值才需要 handler
+    h = HANDLERS.get(kind)
+    row = await repo.fetchone(
+        conn, "tasks:enqueue",
+        kind=kind,
+        payload=Jsonb(payload or {}),
+        priority=priority if priority is not None else (h.priority if h else 0),
+        delay=float(delay),
+        max_attempts=max_attempts if max_attempts is not None else (h.max_attempts if h else 5),
+        dedupe_key=dedupe_key,
+    )
+    # 同一個 dedupe_key 已經有在等待 / 執行的工作時回傳 None
+    return row.id if row else None
+
+
+# ========== worker ==========
+
+def retry_delay(attempts: int) -> float:
+    return min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+
+
+class Worker:
+    def __init__(
+        self,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        kinds: Optional[list[str]] = None,
+        poll_interval: float = POLL_SECONDS,
+        pool=None,  # 預設用 db.get_pool() 的主庫連線池
+    ):
+        self.concurrency = concurrency
+        self.kinds = kinds
+        self.poll_interval = poll_interval
+        self.pool = pool
+        self.name = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.handlers: dict[str, Handler] = {}
+        self.running: dict[int, tuple[str, asyncio.Task]] = {}
+        self.stats = {"done": 0, "retried": 0, "failed": 0}
+        self._wake = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._reaped_at = 0.0
+
+    # 不再領取新工作；還在執行的工作中斷後放回佇列
+    def stop(self) -> None:
+        self._stopping.set()
+        self._wake.set()
+
+    def _slots(self) -> tuple[list[str], list[int], list[float], int]:
+        free = self.concurrency - len(self.running)
+        kinds, slots, leases = [], [], []
+        if free <= 0:
+            return kinds, slots, leases, 0
+        busy: dict[str, int] = {}
+        for kind, _ in self.running.values():
+            busy[kind] = busy.get(kind, 0) + 1
+        for kind, h in self.handlers.items():
+            n = free if h.concurrency is None else min(free, h.concurrency - busy.get(kind, 0))
+            if n > 0:
+                kinds.append(kind)
+                slots.append(n)
+                leases.append(h.timeout + LEASE_MARGIN_SECONDS)
+        return kinds, slots, leases, free
+
+    async def _claim(self, pool) -> int:
+        kinds, slots, leases, limit = self._slots()
+        if not kinds:
+            return 0
+        async with pool.connection() as conn:
+            rows = await repo.fetchall(
+                conn, "tasks:claim", worker=self.name, kinds=kinds, slots=slots, leases=leases, limit=limit
+            )
+        for task in rows:
+            self.running[task.id] = (task.kind, asyncio.create_task(self._execute(pool, task)))
+        return len(rows)
+
+    async def _execute(self, pool, task: TaskRow) -> None:
+        h = self.handlers[task.kind]
+        try:
+            exc = None
+            try:
+                await asyncio.wait_for(h.run(task.payload), h.timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                exc = e
+            await self._finish(pool, h, task, exc)
+        except psycopg.Error:
+            # 結果寫不回資料庫：租約過期後會再執行一次
+            log.exception("工作 %s#%s 的結果無法寫入", task.kind, task.id)
+        finally:
+            self.running.pop(task.id, None)
+            self._wake.set()
+
+    async def _finish(self, pool, h: Handler, task: TaskRow, exc: Optional[Exception]) -> None:
+        async with pool.connection() as conn:
+            if exc is None:
+                await repo.execute(conn, "tasks:done", id=task.id, worker=self.name)
+                self.stats["done"] += 1
+            else:
+                final = task.attempts >= task.max_attempts
+                error = f"{type(exc).__name__}: {exc}"
+                await repo.execute(
+                    conn, "tasks:fail", id=task.id, worker=self.name,
+                    delay=retry_delay(task.attempts), error=error[:2000],
+                )
+                self.stats["failed" if final else "retried"] += 1
+                # 還會重試的記 warning，不再重試的記 error；都附上 traceback
+                log.log(
+                    logging.ERROR if final else logging.WARNING,
+                    "工作 %s#%s 第 %d 次執行失敗%s", task.kind, task.id, task.attempts, "（不再重試）" if final else "",
+                    exc_info=exc,
+                )
+                if not final:
+                    return
+            # 定期工作：這次結束（成功或不再重試）後排入下一次
+            if h.every is not None:
+                await enqueue(conn, h.kind, task.payload, delay=h.every, dedupe_key=h.kind)
+
+    # LISTEN 要一直佔著一條連線，不從連線池借
+    async def _listen(self, conninfo: str) -> None:
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(conninfo, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {CHANNEL}")
+                    self._wake.set()  # 連上之前可能漏掉通知
+                    async for _ in conn.notifies():
+                        self._wake.set()
+            except asyncio.CancelledError:
+                raise
+            except psycopg.Error as e:
+                log.warning("tasks LISTEN 連線中斷，%s 秒後重連：%s", self.poll_interval, e)
+                await asyncio.sleep(self.poll_interval)
+
+    async def _reap(self, pool) -> None:
+        now = time.monotonic()
+        if now - self._reaped_at < self.poll_interval:
+            return
+        self._reaped_at = now
+        async with pool.connection() as conn:
+            reaped = await repo.fetchall(conn, "tasks:reap")
+        if reaped:
+            log.warning("%d 個工作的租約過期，已放回佇列", len(reaped))
+
+    async def _schedule_periodic(self, pool) -> None:
+        async with pool.connection() as conn:
+            for h in self.handlers.values():
+                if h.every is not None:
+                    await enqueue(conn, h.kind, dedupe_key=h.kind)
+
+    async def run(self) -> None:
+        handlers = load_handlers()
+        self.handlers = {k: h for k, h in handlers.items() if self.kinds is None or k in self.kinds}
+        pool = self.pool or await get_pool()
+        await self._schedule_periodic(pool)
+        listener = asyncio.create_task(self._listen(pool.conninfo))
+        try:
+            while not self._stopping.is_set():
+                try:
+                    await self._reap(pool)
+                    self._wake.clear()
+                    claimed = await self._claim(pool)
+                except psycopg.Error as e:
+                    log.warning("領取工作失敗，%s 秒後重試：%s", self.poll_interval, e)
+                    claimed = 0
+                # 領到了而且還有空位：佇列裡可能還有，馬上再領一次
+                if claimed and len(self.running) < self.concurrency:
+                    continue
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)  # 等 LISTEN 連線關閉
+            await self._shutdown(pool)
+
+    # 結束時中斷還在執行的工作並放回佇列，讓其他 worker 接手
+    async def _shutdown(self, pool) -> None:
+        running = dict(self.running)
+        for _, task in running.values():
+            task.cancel()
+        await asyncio.gather(*(task for _, task in running.values()), return_exceptions=True)
+        if running:
+            async with pool.connection() as conn:
+                await repo.execute(conn, "tasks:release", ids=list(running), worker=self.name)
+
+
+# ========== CLI ==========
+
+async def print_status(conn) -> None:
+    rows = await repo.fetchall(conn, "tasks:status")
+    print(f"{'kind':<28}{'status':<10}{'count':>8}  next run")
+    for r in rows:
+        print(f"{r.kind:<28}{r.status:<10}{r.count:>8}  {r.next_run_at:%Y-%m-%d %H:%M:%S}")
+    cur = await conn.execute(
+        "SELECT id, kind, attempts, last_error FROM tasks WHERE status = 'failed' ORDER BY updated_at DESC LIMIT 10"
+    )
+    failed = await cur.fetchall()
+    if failed:
+        print("\n最近失敗的工作")
+        for row in failed:
+            print(f"  {row['kind']}#{row['id']}（{row['attempts']} 次）：{row['last_error']}")
+
+
+async def main(args) -> int:
+    if args.status or args.enqueue:
+        pool = await get_pool()
+        async with pool.connection() as conn:
+            if args.enqueue:
+                load_handlers()
+                task_id = await enqueue(conn, args.enqueue, json.loads(args.payload), priority=args.priority)
+                print(f"已加入 {args.enqueue}#{task_id}" if task_id else "已有相同的工作在等待")
+            else:
+                await print_status(conn)
+        await close_pool()
+        return 0
+
+    kinds = [k.strip() for k in args.kinds.split(",")] if args.kinds else None
+    worker = Worker(args.concurrency, kinds)
+    # SIGTERM（systemd、docker stop）與 Ctrl+C 一樣：執行中的工作放回佇列再結束
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, worker.stop)
+    log.info("worker %s 啟動，concurrency %d", worker.name, args.concurrency)
+    try:
+        await worker.run()
+    finally:
+        log.info("worker 結束：%s", worker.stats)
+        await close_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="背景工作佇列")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--kinds", help="只處理這幾種工作（逗號分隔），預設全部")
+    parser.add_argument("--status", action="store_true", help="顯示佇列狀態")
+    parser.add_argument("--enqueue", metavar="KIND", help="加入一個工作")
+    parser.add_argument("--payload", default="{}")
+    parser.add_argument("--priority", type=int, default=None)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        sys.exit(asyncio.run(main(parser.parse_args())))
+    except KeyboardInterrupt:
+        pass
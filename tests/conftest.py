@@ -0,0 +1,99 @@
+# 測試用資料庫：每次 pytest 執行時用 explain_check 的 prepare_database 建一個新的資料庫
+# （跑完所有 migration、放入少量種子資料），全部測試結束後刪除。
+# 連線設定與 db.py 相同（DB_HOST 等環境變數），連不上 PostgreSQL 時整批略過。
+#
+# 用法：python -m pytest -q
+#       TEST_DB_NAME=midterm_test_2 python -m pytest -q tests/test_replay.py
+import asyncio
+import itertools
+import os
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+import psycopg
+import pytest
+from psycopg.conninfo import make_conninfo
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import job_state  # noqa: E402
+import repo  # noqa: E402
+from db import DATABASE_URL  # noqa: E402
+from explain_check import prepare_database  # noqa: E402
+
+TEST_DB_NAME = os.environ.get("TEST_DB_NAME", "midterm_pytest")
+SEED_SCALE = 100
+
+_names = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def database() -> str:
+    admin = make_conninfo(DATABASE_URL, dbname="postgres")
+    try:
+        conninfo = asyncio.run(prepare_database(admin, TEST_DB_NAME, SEED_SCALE))
+    except psycopg.OperationalError as e:
+        pytest.skip(f"連不上 PostgreSQL：{e}")
+    yield conninfo
+
+    async def drop():
+        async with await psycopg.AsyncConnection.connect(admin, autocommit=True) as conn:
+            await conn.execute(f'DROP DATABASE IF EXISTS "{TEST_DB_NAME}" WITH (FORCE)')
+
+    asyncio.run(drop())
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+async def connect(database):
+    opened = []
+
+    async def open_connection() -> psycopg.AsyncConnection:
+        conn = await psycopg.AsyncConnection.connect(database, autocommit=True)
+        opened.append(conn)
+        return conn
+
+    yield open_connection
+    for conn in opened:
+        await conn.close()
+
+
+async def create_user(conn, role: str) -> int:
+    username = f"pytest_{role}_{os.getpid()}_{next(_names)}"
+    await repo.execute(conn, "user_insert", username=username, password_hash="-", role=role)
+    cur = await conn.execute("SELECT id FROM users WHERE username = %s", (username,))
+    return (await cur.fetchone())[0]
+
+
+# 新案件（pending），有指定承包人時是邀請制（invited）；截止日在一週後，可以投標
+async def create_job(conn, client_id: int, contractor_id=None) -> int:
+    return await job_state.create_job(
+        conn, "JOB_INVITED" if contractor_id else "JOB_CREATED",
+        title="pytest", content="pytest", client_id=client_id, budget=1000,
+        due_date=date.today() + timedelta(days=7), contractor_id=contractor_id,
+        message="pytest", description="pytest",
+    )
+
+
+async def submit_bid(conn, job_id: int, contractor_id: int, price: int) -> int:
+    cur = await conn.execute("SELECT version FROM jobs WHERE id = %s", (job_id,))
+    (version,) = await cur.fetchone()
+    return await job_state.apply(
+        conn, "BID_SUBMITTED",
+        job_id=job_id, actor_id=contractor_id, message=f"報價 ${price}", description="pytest",
+        price=price, note="", proposal_file=None, proposal_original_name=None, job_version=version,
+    )
+
+
+async def upload(conn, job_id: int, contractor_id: int, event_type: str = "REPORT_UPLOADED") -> int:
+    name = f"pytest_{job_id}_{next(_names)}.pdf"
+    return await job_state.apply(
+        conn, event_type,
+        job_id=job_id, actor_id=contractor_id, message="pytest", description="pytest",
+        report_file=name, original_name=name,
+    )
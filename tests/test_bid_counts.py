@@ -0,0 +1,50 @@
+# 報價數（user-035）：報價之間不互相等待，列表的報價數在報價 commit 的當下就正確，
+# 同一個承包人重新報價不重複計算
+import pytest
+
+import repo
+from conftest import create_job, create_user, submit_bid
+
+pytestmark = pytest.mark.anyio
+
+
+# 委託人與承包人的列表看到的報價數
+async def listed_counts(conn, job_id: int, client_id: int, contractor_id: int) -> tuple[int, int]:
+    client_rows = await repo.fetchall(conn, "client_jobs", client_id=client_id)
+    open_rows = await repo.fetchall(conn, "contractor_open_jobs", contractor_id=contractor_id)
+    return (
+        next(r.bid_count for r in client_rows if r.id == job_id),
+        next(r.bid_count for r in open_rows if r.id == job_id),
+    )
+
+
+async def test_bids_do_not_wait_for_each_other(connect):
+    first, second = await connect(), await connect()
+    client_id = await create_user(first, "client")
+    contractors = [await create_user(first, "contractor") for _ in range(2)]
+    job_id = await create_job(first, client_id)
+
+    # 第一個報價的 transaction 還沒 commit，第二個新報價也不必等它
+    await second.execute("SET lock_timeout = '2s'")
+    async with first.transaction():
+        await submit_bid(first, job_id, contractors[0], 100)
+        await submit_bid(second, job_id, contractors[1], 200)
+        assert await listed_counts(second, job_id, client_id, contractors[1]) == (1, 1)
+
+    assert await listed_counts(second, job_id, client_id, contractors[1]) == (2, 2)
+
+
+async def test_count_is_correct_after_each_bid(connect):
+    conn = await connect()
+    client_id = await create_user(conn, "client")
+    contractors = [await create_user(conn, "contractor") for _ in range(3)]
+    viewer = await create_user(conn, "contractor")
+    job_id = await create_job(conn, client_id)
+
+    for n, contractor_id in enumerate(contractors, start=1):
+        await submit_bid(conn, job_id, contractor_id, 100 + n)
+        assert await listed_counts(conn, job_id, client_id, viewer) == (n, n)
+
+    # 重新報價不增加報價數
+    await submit_bid(conn, job_id, contractors[0], 50)
+    assert await listed_counts(conn, job_id, client_id, viewer) == (3, 3)
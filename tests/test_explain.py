@@ -0,0 +1,25 @@
+# explain_check（user-027）：EXPLAIN 所有 router 裡的 SQL，不能執行失敗、不能有未接受的問題，
+# cost 也不能超過 baseline。測試資料庫（SEED_SCALE 筆案件）比 baseline 最小的資料量還小，
+# 所以拿最小資料量的 baseline 當上限比較；完整的多資料量檢查仍用 python explain_check.py。
+import json
+
+import pytest
+
+import explain_check
+from conftest import SEED_SCALE
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_no_plan_regressions(database):
+    baseline_scale = min(explain_check.DEFAULT_SCALES)
+    assert SEED_SCALE <= baseline_scale
+
+    results = await explain_check.explain_all(database, explain_check.collect_statements())
+    baseline = json.loads(explain_check.BASELINE_FILE.read_text(encoding="utf-8"))
+    regressions = explain_check.compare(
+        {f"{baseline_scale}/{key}": res for key, res in results.items()}, baseline
+    )
+
+    assert results
+    assert regressions == []
@@ -0,0 +1,43 @@
+# 重播（user-036）：建立事件已被封存的案件不重建；完整的案件重播結果與目前的 projection 相同
+import pytest
+
+import replay
+from conftest import create_job, create_user, submit_bid
+
+pytestmark = pytest.mark.anyio
+
+
+async def job_status(conn, job_id: int) -> str:
+    cur = await conn.execute("SELECT status FROM jobs WHERE id = %s", (job_id,))
+    return (await cur.fetchone())[0]
+
+
+async def test_skips_job_whose_creation_event_is_archived(connect, database):
+    conn = await connect()
+    client_id = await create_user(conn, "client")
+    contractor_id = await create_user(conn, "contractor")
+    job_id = await create_job(conn, client_id)
+    await submit_bid(conn, job_id, contractor_id, 100)
+
+    # 與 partition 被封存相同：只剩建立事件之後的事件
+    await conn.execute("DELETE FROM job_events WHERE job_id = %s AND event_type = 'JOB_CREATED'", (job_id,))
+
+    result = await replay.replay(database, job_id=job_id)
+    assert result["stats"].get("incomplete") == 1
+    assert result["stats"].get("jobs", 0) == 0
+    assert await job_status(conn, job_id) == "pending"
+
+
+async def test_complete_job_replays_to_current_projection(connect, database):
+    conn = await connect()
+    client_id = await create_user(conn, "client")
+    contractors = [await create_user(conn, "contractor") for _ in range(2)]
+    job_id = await create_job(conn, client_id)
+    for price, contractor_id in enumerate(contractors, start=100):
+        await submit_bid(conn, job_id, contractor_id, price)
+
+    result = await replay.replay(database, job_id=job_id)
+    assert result["stats"]["jobs"] == 1
+    assert result["stats"].get("anomalies", 0) == 0
+    assert result["stats"]["jobs_changed"] == 0
+    assert result["statuses"] == {"pending": 1}
@@ -0,0 +1,82 @@
+# 成果檔案的版本號（user-034）：版本號在鎖住案件後才計算，(job_id, version) 是 unique，
+# 事件 payload 的版本號與實際寫入的版本一致
+import asyncio
+
+import pytest
+from psycopg import errors as pg_errors
+
+import job_state
+from conftest import create_job, create_user, upload
+
+pytestmark = pytest.mark.anyio
+
+
+async def accepted_job(conn) -> tuple[int, int, int]:
+    client_id = await create_user(conn, "client")
+    contractor_id = await create_user(conn, "contractor")
+    job_id = await create_job(conn, client_id, contractor_id)
+    await job_state.apply(
+        conn, "INVITE_ACCEPTED", job_id=job_id, actor_id=contractor_id, message="pytest", description="pytest"
+    )
+    return job_id, client_id, contractor_id
+
+
+async def versions(conn, job_id: int) -> list[int]:
+    cur = await conn.execute("SELECT version FROM job_result_files WHERE job_id = %s ORDER BY version", (job_id,))
+    return [v for (v,) in await cur.fetchall()]
+
+
+async def event_versions(conn, job_id: int) -> list[int]:
+    cur = await conn.execute(
+        """
+        SELECT (payload->>'version')::int FROM job_events
+        WHERE job_id = %s AND event_type IN ('REPORT_UPLOADED', 'REPORT_RE_UPLOADED') ORDER BY id
+        """,
+        (job_id,),
+    )
+    return [v for (v,) in await cur.fetchall()]
+
+
+async def test_versions_follow_upload_order(connect):
+    conn = await connect()
+    job_id, client_id, contractor_id = await accepted_job(conn)
+
+    await upload(conn, job_id, contractor_id)
+    for _ in range(2):
+        await job_state.apply(
+            conn, "JOB_REJECTED", job_id=job_id, actor_id=client_id, message="pytest", description="pytest"
+        )
+        await upload(conn, job_id, contractor_id, "REPORT_RE_UPLOADED")
+
+    assert await versions(conn, job_id) == [1, 2, 3]
+    assert await event_versions(conn, job_id) == [1, 2, 3]
+
+
+async def test_concurrent_uploads_store_one_version(connect):
+    conns = [await connect() for _ in range(5)]
+    job_id, _, contractor_id = await accepted_job(conns[0])
+
+    results = await asyncio.gather(
+        *(upload(conn, job_id, contractor_id) for conn in conns), return_exceptions=True
+    )
+
+    # 只有一個上傳拿到 accepted → uploaded，其他的看到新狀態而失敗
+    assert sum(not isinstance(r, BaseException) for r in results) == 1
+    assert all(isinstance(r, job_state.InvalidTransition) for r in results if isinstance(r, BaseException))
+    assert await versions(conns[0], job_id) == [1]
+    assert await event_versions(conns[0], job_id) == [1]
+
+
+async def test_duplicate_version_is_rejected(connect):
+    conn = await connect()
+    job_id, _, contractor_id = await accepted_job(conn)
+    await upload(conn, job_id, contractor_id)
+
+    with pytest.raises(pg_errors.UniqueViolation):
+        await conn.execute(
+            """
+            INSERT INTO job_result_files (job_id, contractor_id, version, file_path, original_name)
+            VALUES (%s, %s, 1, 'duplicate.pdf', 'duplicate.pdf')
+            """,
+            (job_id, contractor_id),
+        )
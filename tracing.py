@@ -0,0 +1,277 @@
+# 輕量的 request tracing：找出一個 request 的時間花在哪裡（等連線池、哪一條 SQL、JSON 序列化）
+#
+#   TracingMiddleware  每個 request 都會有 request ID（沿用 X-Request-ID header，沒有就產生一個，
+#                      並放在 response header）；依 TRACE_SAMPLE_RATE 抽樣決定要不要記錄
+#   span(name, ...)    在被抽中的 request 裡記錄一段時間；沒被抽中時只有一次 ContextVar 讀取
+#                      目前有記錄的：pool.acquire（db.py）、sql（repo.py，含 statement 名稱與列數）、
+#                      json.render（responses.py）
+#
+# 設定（環境變數）：
+#   TRACE_SAMPLE_RATE  0 ~ 1，預設 0（不記錄）；request 帶 X-Trace: 1 header 時一律記錄
+#   TRACE_FILE         有設定時以 OTLP/JSON 格式（每行一個 ExportTraceServiceRequest）附加到這個檔案，
+#                      可以直接給 OpenTelemetry Collector 的 otlpjsonfile receiver 讀；
+#                      沒設定時每個 request 一行 JSON log 印到 stdout
+#   寫檔 / stdout 由背景 thread 負責（見 export），request 結束時只把 trace 放進佇列，不在 event loop 上等 I/O
+import atexit
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+
+from fast_json import dumps
+
+log = logging.getLogger(__name__)
+
+SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))
+TRACE_FILE = os.environ.get("TRACE_FILE") or None
+SERVICE_NAME = "midterm"
+EXPORT_QUEUE_SIZE = 10_000
+
+REQUEST_ID_HEADER = b"x-request-id"
+FORCE_HEADER = b"x-trace"
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+
+
+class Span:
+    __slots__ = ("trace", "name", "attrs", "start_ns", "end_ns", "span_id")
+
+    def __init__(self, trace: "Trace", name: str, attrs: dict):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.start_ns = 0
+        self.end_ns = 0
+        self.span_id = uuid.uuid4().hex[:16]
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end_ns = time.time_ns()
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.trace.spans.append(self)
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Trace:
+    __slots__ = ("trace_id", "request_id", "method", "path", "route", "status", "start_ns", "end_ns", "spans")
+
+    def __init__(self, request_id: str, method: str, path: str):
+        self.trace_id = uuid.uuid4().hex
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.route = None
+        self.status = 0
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.spans: list[Span] = []
+
+
+# 在目前的 request 裡記錄一段時間：with tracing.span("sql", statement=name) as s: ...; s.set(rows=n)
+def span(name: str, **attrs):
+    trace = _current.get()
+    if trace is None:
+        return _NO_SPAN
+    return Span(trace, name, attrs)
+
+
+# ========== 輸出 ==========
+
+def _ms(ns: int) -> float:
+    return round(ns / 1_000_000, 3)
+
+
+def to_log(trace: Trace) -> dict:
+    return {
+        "trace_id": trace.trace_id,
+        "request_id": trace.request_id,
+        "method": trace.method,
+        "path": trace.path,
+        "route": trace.route,
+        "status": trace.status,
+        "duration_ms": _ms(trace.end_ns - trace.start_ns),
+        "spans": [
+            {"name": s.name, "start_ms": _ms(s.start_ns - trace.start_ns), "duration_ms": _ms(s.end_ns - s.start_ns), **s.attrs}
+            for s in trace.spans
+        ],
+    }
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attrs: dict) -> list[dict]:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attrs.items() if v is not None]
+
+
+# OTLP/JSON：request 是 SERVER span（kind 2），其餘是它底下的 INTERNAL span（kind 1）
+def to_otlp(trace: Trace) -> dict:
+    root_id = uuid.uuid4().hex[:16]
+    name = f"{trace.method} {trace.route or trace.path}"
+    spans = [{
+        "traceId": trace.trace_id,
+        "spanId": root_id,
+        "name": name,
+        "kind": 2,
+        "startTimeUnixNano": str(trace.start_ns),
+        "endTimeUnixNano": str(trace.end_ns),
+        "attributes": _otlp_attributes({
+            "http.request.method": trace.method,
+            "url.path": trace.path,
+            "http.route": trace.route,
+            "http.response.status_code": trace.status,
+            "request.id": trace.request_id,
+        }),
+        "status": {"code": 2} if trace.status >= 500 else {},
+    }]
+    for s in trace.spans:
+        spans.append({
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "parentSpanId": root_id,
+            "name": s.name,
+            "kind": 1,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": _otlp_attributes(s.attrs),
+            "status": {"code": 2} if "error" in s.attrs else {},
+        })
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+        }]
+    }
+
+
+# 輸出在背景 thread：middleware 只做 put_nowait，序列化與寫入（可能很慢的磁碟 / 被導向的 stdout）都不佔 event loop。
+# 寫入跟不上、佇列滿了就丟掉這一筆（算在 dropped），不回頭拖慢 request；行程結束前把佇列裡剩下的寫完。
+_queue: queue.Queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+dropped = 0
+
+
+def _write(trace: Trace) -> None:
+    if TRACE_FILE:
+        with open(TRACE_FILE, "ab") as f:
+            f.write(dumps(to_otlp(trace)) + b"\n")
+    else:
+        sys.stdout.write(dumps(to_log(trace)).decode("utf-8") + "\n")
+        sys.stdout.flush()
+
+
+def _drain() -> None:
+    while True:
+        trace = _queue.get()
+        if trace is None:
+            return
+        try:
+            _write(trace)
+        except Exception:
+            log.exception("trace 輸出失敗：trace_id=%s", trace.trace_id)
+
+
+def _stop_writer() -> None:
+    try:
+        _queue.put(None, timeout=1)
+    except queue.Full:
+        return
+    _writer.join(timeout=5)
+
+
+def export(trace: Trace) -> None:
+    global _writer, dropped
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_drain, name="trace-export", daemon=True)
+                _writer.start()
+                atexit.register(_stop_writer)
+    try:
+        _queue.put_nowait(trace)
+    except queue.Full:
+        dropped += 1
+
+
+# ========== middleware ==========
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+# 純 ASGI middleware（不經過 BaseHTTPMiddleware 的額外 task 與 stream 包裝），放在最外層
+class TracingMiddleware:
+    def __init__(self, app, sample_rate: float = SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        incoming = _header(scope, REQUEST_ID_HEADER)
+        request_id = incoming.decode("latin-1")[:64] if incoming else uuid.uuid4().hex
+        header = (REQUEST_ID_HEADER, request_id.encode("latin-1"))
+        sampled = _header(scope, FORCE_HEADER) == b"1" or (
+            self.sample_rate > 0 and random.random() < self.sample_rate
+        )
+        trace = Trace(request_id, scope["method"], scope["path"]) if sampled else None
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), header]
+                if trace is not None:
+                    trace.status = message["status"]
+            await send(message)
+
+        if trace is None:
+            return await self.app(scope, receive, send_with_id)
+
+        token = _current.set(trace)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _current.reset(token)
+            trace.end_ns = time.time_ns()
+            route = scope.get("route")
+            trace.route = getattr(route, "path", None)
+            export(trace)
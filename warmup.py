@@ -0,0 +1,151 @@
+# 啟動預熱：在 /ready 回報可用之前先把第一批 request 會碰到的東西準備好
+#   1. 主庫（與副本）的連線池開好，等 min_size 條連線都連上
+#   2. 每條連線都先執行一次唯讀的 statement，建立 server-side prepared statement
+#      （repo 的 statement 都用 prepare=True，第一次執行時才會 prepare）
+#   3. 執行登錄的快取預熱函式（register）
+#   4. 對 app 自己送一個表單 POST：第一個 request 會 lazy import anyio 的 asyncio backend、
+#      表單解析等模組（約 20~30 ms），在回報 ready 前先走一遍
+# 由 main.create_app 在啟動後於背景呼叫，完成前 /ready 回傳 503。
+import asyncio
+import re
+import time
+from contextlib import AsyncExitStack
+from datetime import date, datetime, timezone
+from typing import Awaitable, Callable
+
+import psycopg
+from psycopg_pool import PoolTimeout
+
+import repo
+from db import get_pool, get_replicas
+
+POOL_TIMEOUT = 10.0
+
+# 預熱時代入的參數：只需要型別與正式呼叫相同（psycopg 依參數型別區分 prepared statement），
+# id 用 0 查不到資料，執行很快。int 的型別依數值大小決定（int2 / int4 / int8），小的值對應一般的 id。
+SAMPLE_PARAMS = {
+    "job_id": 0,
+    "bid_id": 0,
+    "user_id": 0,
+    "client_id": 0,
+    "contractor_id": 0,
+    "limit": 10,
+    "since": date(2000, 1, 1),
+    "history_since": None,
+    "job_created_at": datetime(2000, 1, 1, tzinfo=timezone.utc),
+    "username": "",
+    "password_hash": "",
+    "text": "",
+    "prefix": "",
+    "prefix_end": "",
+}
+
+_PARAM = re.compile(r"%\((\w+)\)s")
+_WRITE = re.compile(r"\b(INSERT|UPDATE|DELETE)\b|\bFOR\s+(UPDATE|SHARE)\b", re.IGNORECASE)
+
+# 快取預熱函式：async def warm(conn) -> None，用 register 登錄
+CACHE_WARMERS: list[Callable[..., Awaitable[None]]] = []
+
+
+def register(warmer: Callable[..., Awaitable[None]]) -> Callable[..., Awaitable[None]]:
+    CACHE_WARMERS.append(warmer)
+    return warmer
+
+
+# 可以預熱的 statement：唯讀、而且所有參數都有樣本值
+def warm_statements() -> list[tuple[str, dict]]:
+    items = []
+    for stmt in repo.STATEMENTS.values():
+        if _WRITE.search(stmt.sql):
+            continue
+        names = set(_PARAM.findall(stmt.sql))
+        if names <= SAMPLE_PARAMS.keys():
+            items.append((stmt.name, {n: SAMPLE_PARAMS[n] for n in names}))
+    return items
+
+
+async def _prepare(conn, statements: list[tuple[str, dict]]) -> None:
+    async with conn.transaction():
+        for name, params in statements:
+            await repo.fetchall(conn, name, **params)
+
+
+# 同時借出池裡的每一條連線（一次借一條可能一直拿到同一條），每條都 prepare 一次
+async def warm_pool(pool, statements: list[tuple[str, dict]]) -> int:
+    await pool.wait(timeout=POOL_TIMEOUT)
+    async with AsyncExitStack() as stack:
+        conns = [await stack.enter_async_context(pool.connection()) for _ in range(pool.min_size)]
+        await asyncio.gather(*(_prepare(conn, statements) for conn in conns))
+    return len(conns)
+
+
+# 不經過網路直接呼叫 ASGI app：POST /login 一個不存在的帳號（查資料庫、回 401，不寫入也不建立 session）
+async def warm_request(app) -> int:
+    body = b"username=&password="
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/login", "raw_path": b"/login",
+        "root_path": "", "query_string": b"",
+        "headers": [
+            (b"host", b"warmup"),
+            (b"content-type", b"application/x-www-form-urlencoded"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 0), "server": ("warmup", 80),
+    }
+    done = asyncio.Event()
+    status = 0
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and not message.get("more_body"):
+            done.set()
+
+    await app(scope, receive, send)
+    return status
+
+
+# 回傳各步驟花費的毫秒數，給 /ready 與啟動分析顯示
+async def prewarm(app=None) -> dict:
+    timings = {}
+    start = time.perf_counter()
+    statements = warm_statements()
+
+    pool = await get_pool()
+    conns = await warm_pool(pool, statements)
+    timings["primary_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    # 副本連不上就跳過，不影響啟動（db.getReadDB 會自己判定副本不可用）
+    replica_start = time.perf_counter()
+    for replica in await get_replicas():
+        try:
+            conns += await warm_pool(replica.pool, statements)
+        except (PoolTimeout, psycopg.OperationalError):
+            replica.mark_down()
+    timings["replicas_ms"] = round((time.perf_counter() - replica_start) * 1000, 1)
+
+    cache_start = time.perf_counter()
+    if CACHE_WARMERS:
+        async with pool.connection() as conn:
+            for warmer in CACHE_WARMERS:
+                await warmer(conn)
+    timings["caches_ms"] = round((time.perf_counter() - cache_start) * 1000, 1)
+
+    if app is not None:
+        request_start = time.perf_counter()
+        await warm_request(app)
+        timings["request_ms"] = round((time.perf_counter() - request_start) * 1000, 1)
+
+    timings["connections"] = conns
+    timings["statements"] = len(statements)
+    timings["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return timings